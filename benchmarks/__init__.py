@@ -0,0 +1 @@
+"""Performance benchmarks for the cog's message pipeline, see `python -m benchmarks --help`"""
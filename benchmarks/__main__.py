@@ -0,0 +1,90 @@
+"""
+Run the message pipeline benchmarks and print (or save) their results as JSON.
+
+    python -m benchmarks --scenario end_to_end --iterations 500 --history 200 --output results.json
+
+Run from the repository root, with the cog's requirements installed.
+Results of different runs can be compared with `--compare`.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+from dataclasses import asdict, fields
+from typing import Dict, List
+
+from benchmarks.scenarios import SCENARIOS, Options
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.splitlines()[1])
+    parser.add_argument("--scenario", "-s", action="append", choices=sorted(SCENARIOS), help="(default: all)")
+    defaults = Options()
+    parser.add_argument("--iterations", "-n", type=int, default=defaults.iterations)
+    parser.add_argument("--history", type=int, default=defaults.history, help="messages in each channel's history")
+    parser.add_argument("--backread", type=int, default=defaults.backread, help="messages used for context")
+    parser.add_argument("--concurrency", "-c", type=int, default=defaults.concurrency)
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="stub endpoint latency (seconds)")
+    parser.add_argument("--stream", action="store_true", help="stream responses")
+    parser.add_argument("--tools", action="store_true", help="enable function calling")
+    parser.add_argument("--trace-allocations", action="store_true", help="measure memory (slows runs down)")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--output", "-o", help="write results to this file instead of stdout")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    options = Options(**{f.name: getattr(args, f.name) for f in fields(Options)})
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = (await SCENARIOS[name](options)).to_json()
+    return {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": asdict(options),
+        "results": results,
+    }
+
+
+def compare(current: Dict, previous: Dict) -> Dict:
+    """Relative change of throughput and latency percentiles, per scenario present in both runs"""
+    changes = {}
+    for name, result in current["results"].items():
+        before = previous.get("results", {}).get(name)
+        if not before:
+            continue
+        change = {"per_second": _change(result["per_second"], before["per_second"])}
+        for key, value in result["latency"].items():
+            if key in before["latency"]:
+                change[key] = _change(value, before["latency"][key])
+        changes[name] = change
+    return changes
+
+
+def _change(value: float, previous: float) -> float:
+    return (value - previous) / previous if previous else 0.0
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    if args.compare:
+        with open(args.compare) as file:
+            report["compared_to"] = {"file": args.compare, "changes": compare(report, json.load(file))}
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,256 @@
+"""
+Minimal stand-ins for the discord.py / Red objects the message pipeline touches.
+
+Only the attributes and coroutines the cog uses are implemented, everything sent to Discord is recorded instead.
+"""
+import itertools
+import random
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import discord
+
+from localaibot.functions.tool_call import ToolCall
+from localaibot.functions.types import Function, Parameters, ToolCallSchema
+
+WORDS = (
+    "the quick brown fox jumps over lazy dog anyone seen that new game yesterday honestly it was pretty good "
+    "but the ending felt rushed what do you think about it lol maybe we should play later tonight"
+).split()
+
+_ids = itertools.count(1)
+
+
+def snowflake(when: datetime) -> int:
+    # low bits keep ids unique for messages created in the same millisecond
+    return discord.utils.time_snowflake(when) + next(_ids) % 4096
+
+
+class FakeUser:
+    def __init__(self, name: str, bot: bool = False, user_id: Optional[int] = None):
+        self.id = user_id or snowflake(datetime.now(timezone.utc))
+        self.name = name
+        self.display_name = name
+        self.nick = None
+        self.bot = bot
+        self.roles: List = []
+        self.top_role = SimpleNamespace(id=0, name="@everyone")
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    def __eq__(self, other) -> bool:
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+
+class FakeMessage:
+    def __init__(self, channel: "FakeChannel", author: FakeUser, content: str, created_at: datetime):
+        self.id = snowflake(created_at)
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.clean_content = content
+        self.created_at = created_at
+        self.edited_at = None
+        self.type = discord.MessageType.default
+        self.attachments: List = []
+        self.embeds: List = []
+        self.stickers: List = []
+        self.mentions: List = []
+        self.role_mentions: List = []
+        self.channel_mentions: List = []
+        self.reference = None
+
+    async def reply(self, content: str, **_) -> "FakeMessage":
+        return await self.channel.send(content)
+
+    async def edit(self, content: str = None, **_) -> "FakeMessage":
+        self.content = self.clean_content = content
+        self.edited_at = datetime.now(timezone.utc)
+        return self
+
+    async def delete(self):
+        self.channel.messages.pop(self.id, None)
+
+
+class FakeChannel:
+    def __init__(self, guild: "FakeGuild", name: str):
+        self.id = snowflake(datetime.now(timezone.utc))
+        self.guild = guild
+        self.name = name
+        self.topic = "A channel for benchmarking"
+        self.messages: Dict[int, FakeMessage] = {}
+        self.sent: List[FakeMessage] = []
+        self.history_calls = 0
+
+    async def send(self, content: str = None, **_) -> FakeMessage:
+        message = FakeMessage(self, self.guild.me, content or "", datetime.now(timezone.utc))
+        self.messages[message.id] = message
+        self.sent.append(message)
+        return message
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        try:
+            return self.messages[message_id]
+        except KeyError:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Message")
+
+    async def history(self, limit: int = 100, before=None, after=None, oldest_first: bool = False):
+        self.history_calls += 1
+        before_id = getattr(before, "id", None)
+        after_id = discord.utils.time_snowflake(after) if after else None
+        messages = sorted(self.messages.values(), key=lambda m: m.id, reverse=not oldest_first)
+        count = 0
+        for message in messages:
+            if before_id and message.id >= before_id or after_id and message.id <= after_id:
+                continue
+            yield message
+            count += 1
+            if limit and count >= limit:
+                return
+
+    @asynccontextmanager
+    async def typing(self):
+        yield
+
+    def permissions_for(self, _) -> discord.Permissions:
+        return discord.Permissions.all()
+
+    def add(self, author: FakeUser, content: str, created_at: Optional[datetime] = None) -> FakeMessage:
+        message = FakeMessage(self, author, content, created_at or datetime.now(timezone.utc))
+        self.messages[message.id] = message
+        return message
+
+
+class FakeGuild:
+    def __init__(self, name: str, me: FakeUser):
+        self.id = snowflake(datetime.now(timezone.utc))
+        self.name = name
+        self.me = me
+        self.emojis: List = []
+        self.roles: List = []
+        self.threads: List = []
+        self._channels: Dict[int, FakeChannel] = {}
+
+    @property
+    def channels(self) -> List[FakeChannel]:
+        return list(self._channels.values())
+
+    def add_channel(self, name: str) -> FakeChannel:
+        channel = FakeChannel(self, name)
+        self._channels[channel.id] = channel
+        return channel
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self._channels.get(channel_id)
+
+    get_channel_or_thread = get_channel
+
+
+class FakeContext:
+    def __init__(self, bot: "FakeBot", message: FakeMessage):
+        self.bot = bot
+        self.message = message
+        self.guild = message.guild
+        self.channel = message.channel
+        self.author = message.author
+        self.interaction = None
+        self.clean_prefix = "[p]"
+        self.reactions: List[str] = []
+
+    async def send(self, content: str = None, **kwargs) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
+
+    async def react_quietly(self, emoji: str, **_):
+        self.reactions.append(emoji)
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        return await self.channel.fetch_message(message_id)
+
+    async def embed_color(self) -> discord.Colour:
+        return discord.Colour.blurple()
+
+
+class FakeBot:
+    """The parts of `Red` the cog uses, with a fixed API key and nothing ignored or blocked"""
+
+    def __init__(self, api_key: str = "benchmark"):
+        self.user = FakeUser("BenchBot", bot=True)
+        self.guilds: List[FakeGuild] = []
+        self.api_key = api_key
+        self.application_info_calls = 0
+
+    async def get_context(self, message: FakeMessage) -> FakeContext:
+        return FakeContext(self, message)
+
+    async def application_info(self):
+        self.application_info_calls += 1
+        return SimpleNamespace(owner=FakeUser("owner"))
+
+    async def get_shared_api_tokens(self, service: str) -> Dict[str, str]:
+        return {"api_key": self.api_key} if service == "openai" else {}
+
+    async def allowed_by_whitelist_blacklist(self, _) -> bool:
+        return True
+
+    async def cog_disabled_in_guild(self, *_) -> bool:
+        return False
+
+    async def ignored_channel_or_guild(self, _) -> bool:
+        return True
+
+    async def get_embed_color(self, _) -> discord.Colour:
+        return discord.Colour.blurple()
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        for guild in self.guilds:
+            channel = guild.get_channel(channel_id)
+            if channel:
+                return channel
+        return None
+
+    def add_guild(self, name: str = "Benchmark Server") -> FakeGuild:
+        me = FakeUser(self.user.name, bot=True, user_id=self.user.id)
+        guild = FakeGuild(name, me)
+        self.guilds.append(guild)
+        return guild
+
+
+def random_content(rng: random.Random, min_words: int = 3, max_words: int = 40) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words)))
+
+
+def fill_history(
+    channel: FakeChannel, size: int, authors: List[FakeUser], seed: int = 0, spacing: float = 20.0
+) -> List[FakeMessage]:
+    """Add `size` messages ending now, `spacing` seconds apart on average"""
+    rng = random.Random(seed)
+    start = datetime.now(timezone.utc) - timedelta(seconds=spacing * (size + 1))
+    messages = []
+    for i in range(size):
+        created_at = start + timedelta(seconds=spacing * i + rng.random())
+        messages.append(channel.add(rng.choice(authors), random_content(rng), created_at))
+    return messages
+
+
+class BenchmarkToolCall(ToolCall):
+    """A tool answering instantly without any network access, so tool call rounds measure only the cog's overhead"""
+
+    function_name = "get_benchmark_fact"
+    schema = ToolCallSchema(
+        function=Function(
+            name=function_name,
+            description="Returns a fact about the benchmark.",
+            parameters=Parameters(properties={}),
+        )
+    )
+
+    async def run(self, arguments: Dict, available_tools: List) -> str:
+        return "The benchmark tool was called."
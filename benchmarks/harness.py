@@ -0,0 +1,184 @@
+"""Building a cog wired to fake Discord objects and a stub endpoint, and measuring what it does"""
+import asyncio
+import itertools
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from unittest import mock
+
+from redbot.core import Config
+from redbot.core._drivers import JsonDriver
+
+from benchmarks.fakes import FakeBot, FakeChannel, FakeGuild, FakeUser, fill_history
+from localaibot.core.aibot import AIBot
+from localaibot.core.openai_utils import replace_openai_client
+
+COG_NAME = "AIBotBenchmark"
+IDENTIFIER = "754070"
+
+# Red caches Config instances by cog name and identifier, each environment needs its own
+_environments = itertools.count()
+
+
+class CountingDriver(JsonDriver):
+    """Json driver counting Config reads, to measure how often the message path hits Config"""
+
+    reads = 0
+
+    async def get(self, identifier_data):
+        CountingDriver.reads += 1
+        return await super().get(identifier_data)
+
+
+@dataclass
+class Environment:
+    cog: AIBot
+    bot: FakeBot
+    guild: FakeGuild
+    channels: List[FakeChannel]
+    users: List[FakeUser]
+
+    @property
+    def channel(self) -> FakeChannel:
+        return self.channels[0]
+
+
+@asynccontextmanager
+async def create_environment(
+    endpoint: str,
+    history_size: int = 50,
+    users: int = 8,
+    channels: int = 1,
+    settings: Optional[Dict] = None,
+    global_settings: Optional[Dict] = None,
+) -> AsyncIterator[Environment]:
+    """A loaded cog with whitelisted channels holding `history_size` messages each, using `endpoint` for completions"""
+    with tempfile.TemporaryDirectory() as data_path:
+        identifier = f"{IDENTIFIER}{next(_environments)}"
+        driver = CountingDriver(COG_NAME, identifier, data_path_override=Path(data_path))
+        config = Config(cog_name=COG_NAME, unique_identifier=identifier, driver=driver, force_registration=True)
+
+        bot = FakeBot()
+        guild = bot.add_guild()
+        authors = [FakeUser(f"user{i}") for i in range(users)]
+        fake_channels = []
+        for i in range(channels):
+            channel = guild.add_channel(f"general-{i}")
+            fill_history(channel, history_size, authors + [guild.me], seed=i)
+            fake_channels.append(channel)
+
+        with mock.patch.object(Config, "get_conf", return_value=config):
+            cog = AIBot(bot)
+
+        await config.custom_openai_endpoint.set(endpoint)
+        await config.estimate_unknown_model_tokens.set(True)
+        for key, value in (global_settings or {}).items():
+            await config.set_raw(key, value=value)
+        guild_config = config.guild_from_id(guild.id)
+        await guild_config.channels_whitelist.set([channel.id for channel in fake_channels])
+        await guild_config.optin_by_default.set(True)
+        await guild_config.reply_percent.set(1.0)
+        await guild_config.burst_window.set(0)
+        await guild_config.model.set("benchmark")
+        for key, value in (settings or {}).items():
+            await guild_config.set_raw(key, value=value)
+
+        await cog.cog_load()
+        # random messages would add requests the scenarios don't account for
+        cog.random_message_trigger.cancel()
+        await replace_openai_client(cog)
+        try:
+            yield Environment(cog, bot, guild, fake_channels, authors)
+        finally:
+            await cog.cog_unload()
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def at(percent: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+    return {
+        "min": ordered[0],
+        "mean": statistics.fmean(ordered),
+        "p50": at(50),
+        "p95": at(95),
+        "p99": at(99),
+        "max": ordered[-1],
+    }
+
+
+@dataclass
+class Measurement:
+    name: str
+    iterations: int
+    seconds: float
+    latency: Dict[str, float]
+    config_reads_per_iteration: float
+    retained_bytes_per_iteration: float
+    peak_allocated_bytes: int
+    extra: Dict = field(default_factory=dict)
+
+    @property
+    def per_second(self) -> float:
+        return self.iterations / self.seconds if self.seconds else 0.0
+
+    def to_json(self) -> Dict:
+        return {**asdict(self), "per_second": self.per_second}
+
+
+async def measure(
+    name: str,
+    run: Callable[[int], Awaitable],
+    iterations: int,
+    concurrency: int = 1,
+    warmup: int = 3,
+    trace_allocations: bool = False,
+) -> Measurement:
+    """
+    Run `run(i)` `iterations` times, `concurrency` at a time, timing each call.
+
+    Allocation tracing slows everything down, so latencies of traced runs are only comparable to other traced runs.
+    """
+    for i in range(warmup):
+        await run(-1 - i)
+
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await run(i)
+            latencies.append(time.perf_counter() - start)
+
+    reads = CountingDriver.reads
+    if trace_allocations:
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    await asyncio.gather(*(timed(i) for i in range(iterations)))
+    elapsed = time.perf_counter() - start
+    retained, peak = 0, 0
+    if trace_allocations:
+        after, peak = tracemalloc.get_traced_memory()
+        retained = after - before
+        tracemalloc.stop()
+
+    return Measurement(
+        name=name,
+        iterations=iterations,
+        seconds=elapsed,
+        latency=percentiles(latencies),
+        config_reads_per_iteration=(CountingDriver.reads - reads) / iterations if iterations else 0.0,
+        retained_bytes_per_iteration=retained / iterations if iterations else 0.0,
+        peak_allocated_bytes=peak,
+    )
@@ -0,0 +1,128 @@
+"""Benchmark scenarios, each returning a `Measurement` of one part of the message pipeline"""
+import random
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict
+
+from benchmarks.fakes import BenchmarkToolCall, FakeMessage, random_content
+from benchmarks.harness import Environment, Measurement, create_environment, measure
+from benchmarks.stub_server import StubServer
+from localaibot.core.handlers import handle_message
+from localaibot.messages_list.converter.converter import MessageConverter
+from localaibot.messages_list.messages import create_messages_list
+from localaibot.response.chat.response import remove_patterns_from_response
+
+RESPONSE_WITH_PREFIXES = 'BenchBot: As an AI language model, <think>let me think</think>sounds good to me user3, see you later!'
+
+
+@dataclass
+class Options:
+    iterations: int = 200
+    history: int = 50
+    backread: int = 25
+    concurrency: int = 1
+    latency: float = 0.05
+    stream: bool = False
+    tools: bool = False
+    trace_allocations: bool = False
+    seed: int = 0
+
+
+def new_message(env: Environment, rng: random.Random, channel_index: int = 0) -> FakeMessage:
+    """A user message arriving in a channel, fed to the history buffer like the cog's listener does"""
+    channel = env.channels[channel_index % len(env.channels)]
+    message = channel.add(rng.choice(env.users), random_content(rng))
+    env.cog.channel_history.add(message)
+    return message
+
+
+def guild_settings(options: Options) -> Dict:
+    return {
+        "messages_backread": options.backread,
+        "stream_responses": options.stream,
+        "function_calling": options.tools,
+        "function_calling_functions": [BenchmarkToolCall.function_name] if options.tools else [],
+    }
+
+
+async def convert(options: Options) -> Measurement:
+    """Converting history messages to entries, with the converted message cache cleared in between"""
+    async with StubServer(options.latency) as server:
+        async with create_environment(server.url, options.history, settings=guild_settings(options)) as env:
+            history = list(env.channel.messages.values())
+            ctx = await env.bot.get_context(history[-1])
+            converter = MessageConverter(env.cog, ctx)
+
+            async def run(i: int):
+                env.cog.cached_messages.clear()
+                await converter.convert(history[i % len(history)])
+
+            return await measure("convert", run, options.iterations, trace_allocations=options.trace_allocations)
+
+
+async def history(options: Options) -> Measurement:
+    """Building the messages list (prompt, history, conversion and token counting) for a new message"""
+    rng = random.Random(options.seed)
+    async with StubServer(options.latency) as server:
+        async with create_environment(server.url, options.history, settings=guild_settings(options)) as env:
+
+            async def run(_: int):
+                ctx = await env.bot.get_context(new_message(env, rng))
+                await create_messages_list(env.cog, ctx)
+
+            measurement = await measure("history", run, options.iterations, trace_allocations=options.trace_allocations)
+            measurement.extra["history_fetches"] = env.cog.channel_history.fetches
+            return measurement
+
+
+async def cleanup(options: Options) -> Measurement:
+    """Removing the removelist patterns from a response"""
+    async with StubServer(options.latency) as server:
+        async with create_environment(server.url, options.history, settings=guild_settings(options)) as env:
+            ctx = await env.bot.get_context(list(env.channel.messages.values())[-1])
+
+            async def run(_: int):
+                await remove_patterns_from_response(env.cog, ctx, RESPONSE_WITH_PREFIXES)
+
+            return await measure("cleanup", run, options.iterations, trace_allocations=options.trace_allocations)
+
+
+async def end_to_end(options: Options) -> Measurement:
+    """
+    A message event up to the reply being sent, against the stub endpoint.
+
+    With concurrency, messages are spread over as many channels, so replies aren't folded together.
+    """
+    rng = random.Random(options.seed)
+    async with StubServer(options.latency) as server:
+        async with create_environment(
+            server.url, options.history, channels=options.concurrency, settings=guild_settings(options)
+        ) as env:
+
+            async def run(i: int):
+                channel = env.channels[i % len(env.channels)]
+                sent = len(channel.sent)
+                await handle_message(env.cog, new_message(env, rng, i))
+                if len(channel.sent) == sent:
+                    raise RuntimeError("Message was not replied to, check the benchmark's settings")
+
+            measurement = await measure(
+                "end_to_end", run, options.iterations, options.concurrency, trace_allocations=options.trace_allocations
+            )
+            if options.tools and server.stats.tool_calls < options.iterations:
+                raise RuntimeError("Tools were not called for every reply, check the benchmark's settings")
+            measurement.extra.update({
+                "endpoint_requests": server.stats.requests,
+                "streamed_requests": server.stats.streamed,
+                "tool_calls": server.stats.tool_calls,
+                "application_info_calls": env.bot.application_info_calls,
+                "rejections": dict(env.cog.rejections),
+            })
+            return measurement
+
+
+SCENARIOS: Dict[str, Callable[[Options], Awaitable[Measurement]]] = {
+    "convert": convert,
+    "history": history,
+    "cleanup": cleanup,
+    "end_to_end": end_to_end,
+}
@@ -0,0 +1,147 @@
+"""
+In-process OpenAI compatible endpoint serving canned chat completions with a configurable latency.
+
+Supports streamed responses (server-sent events) and tool calls: when a request offers tools and doesn't carry
+tool results yet, the first tool is called once before the final answer.
+"""
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+REPLY = "Sounds good to me, let's do that later tonight!"
+
+
+@dataclass
+class StubStats:
+    requests: int = 0
+    streamed: int = 0
+    tool_calls: int = 0
+    prompt_messages: List[int] = field(default_factory=list)
+
+
+class StubServer:
+    def __init__(
+        self,
+        latency: float = 0.05,
+        first_token_latency: Optional[float] = None,
+        reply: str = REPLY,
+        chunk_words: int = 2,
+        host: str = "127.0.0.1",
+    ):
+        self.latency = latency
+        self.first_token_latency = latency if first_token_latency is None else first_token_latency
+        self.reply = reply
+        self.chunk_words = chunk_words
+        self.host = host
+        self.stats = StubStats()
+        self._runner: Optional[web.AppRunner] = None
+        self._port: Optional[int] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self._port}/v1"
+
+    async def start(self) -> "StubServer":
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_get("/v1/models", self.models)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, 0)
+        await site.start()
+        self._port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "StubServer":
+        return await self.start()
+
+    async def __aexit__(self, *_):
+        await self.stop()
+
+    async def models(self, _: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": "benchmark", "object": "model"}]})
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.stats.requests += 1
+        self.stats.prompt_messages.append(len(body.get("messages", [])))
+
+        tool_call = self._tool_call(body)
+        if body.get("stream"):
+            self.stats.streamed += 1
+            return await self._stream(request, body, tool_call)
+
+        await asyncio.sleep(self.latency)
+        message: Dict[str, Any] = {"role": "assistant", "content": None if tool_call else self.reply}
+        if tool_call:
+            message["tool_calls"] = [tool_call]
+        return web.json_response({
+            **self._envelope(body, "chat.completion"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_call else "stop"}],
+            "usage": self._usage(body),
+        })
+
+    async def _stream(self, request: web.Request, body: Dict, tool_call: Optional[Dict]) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await asyncio.sleep(self.first_token_latency)
+
+        if tool_call:
+            deltas = [{"role": "assistant", "tool_calls": [{"index": 0, **tool_call}]}]
+        else:
+            words = self.reply.split(" ")
+            pieces = [" ".join(words[i:i + self.chunk_words]) for i in range(0, len(words), self.chunk_words)]
+            deltas = [{"role": "assistant", "content": piece if i == 0 else " " + piece} for i, piece in enumerate(pieces)]
+        # spread the rest of the latency over the chunks, like tokens arriving
+        interval = max(0.0, self.latency - self.first_token_latency) / max(1, len(deltas))
+
+        for i, delta in enumerate(deltas):
+            last = i == len(deltas) - 1
+            chunk = {
+                **self._envelope(body, "chat.completion.chunk"),
+                "choices": [{
+                    "index": 0, "delta": delta,
+                    "finish_reason": ("tool_calls" if tool_call else "stop") if last else None,
+                }],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            if interval and not last:
+                await asyncio.sleep(interval)
+
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage = {**self._envelope(body, "chat.completion.chunk"), "choices": [], "usage": self._usage(body)}
+            await response.write(f"data: {json.dumps(usage)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def _tool_call(self, body: Dict) -> Optional[Dict]:
+        tools = body.get("tools")
+        if not tools or body.get("tool_choice") == "none":
+            return None
+        if any(message.get("role") == "tool" for message in body.get("messages", [])):
+            return None
+        self.stats.tool_calls += 1
+        return {
+            "id": f"call_{self.stats.tool_calls}",
+            "type": "function",
+            "function": {"name": tools[0]["function"]["name"], "arguments": "{}"},
+        }
+
+    @staticmethod
+    def _envelope(body: Dict, kind: str) -> Dict:
+        return {"id": "chatcmpl-benchmark", "object": kind, "created": int(time.time()), "model": body.get("model")}
+
+    def _usage(self, body: Dict) -> Dict:
+        prompt = sum(len(str(message.get("content") or "")) for message in body.get("messages", [])) // 4
+        completion = len(self.reply) // 4
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
@@ -4,5 +4,52 @@ import re
 URL_PATTERN = re.compile(r"(https?://\S+)")
 YOUTUBE_URL_PATTERN = re.compile(r"(?:https?:\/\/)?(?:www\.)?(?:youtube\.com|youtu\.be)\/(?:watch\?v=)?(.+)")
 YOUTUBE_VIDEO_ID_PATTERN = re.compile(r"(?:youtube(?:-nocookie)?\.com|youtu\.be).*(?:v=|/)([\w-]{11})")
+# max ids per request to the videos endpoint
+YOUTUBE_API_BATCH_SIZE = 50
+YOUTUBE_CACHE_LIMIT = 2000
+YOUTUBE_CACHE_TTL = 6 * 60 * 60
 SINGULAR_MENTION_PATTERN = re.compile(r"^<@!?&?(\d+)>$")
 REGEX_RUN_TIMEOUT = 5
+# compiled removelist variants kept per guild (one per bot name / set of recent authors)
+CLEANUP_PROGRAM_CACHE_LIMIT = 32
+# parsed prompt templates, shared by every guild
+PROMPT_TEMPLATE_CACHE_LIMIT = 256
+DISCORD_MESSAGE_LIMIT = 2000
+# streamed responses are first sent after this many chunks (roughly tokens) or a finished sentence
+STREAM_FIRST_CHUNKS = 24
+# seconds between edits of a streamed response, Discord allows ~5 edits per 5 seconds per channel
+STREAM_EDIT_INTERVAL = 1.5
+# seconds a queued LLM request may wait before it is dropped, by scheduler lane
+SCHEDULER_NORMAL_MAX_WAIT = 30
+SCHEDULER_BACKGROUND_MAX_WAIT = 120
+# rolling history summaries, messages folded per update and the least worth an update
+SUMMARY_BATCH_MESSAGES = 50
+SUMMARY_MIN_MESSAGES = 10
+# reply chains, fetched messages are cached and deleted ones remembered
+REPLY_CHAIN_MAX_DEPTH = 10
+REPLY_CHAIN_FETCH_BUDGET = 5
+REFERENCE_CACHE_LIMIT = 2000
+REFERENCE_CACHE_TTL = 60 * 60 * 2
+REFERENCE_MISSING_TTL = 60 * 60
+# on-demand profiling
+PROFILE_MAX_SECONDS = 600
+PROFILE_MAX_MESSAGES = 1000
+PROFILE_TOP_FUNCTIONS = 40
+PROFILE_TOP_ALLOCATIONS = 25
+PROFILE_TRACEBACK_FRAMES = 1
+# endpoint pools
+ENDPOINT_HEALTH_CHECK_INTERVAL = 30
+ENDPOINT_MAX_FAILURES = 2
+ENDPOINT_EWMA_ALPHA = 0.3
+
+# token counting
+DEFAULT_TOKENIZER_MODEL = "gpt-3.5-turbo"
+ESTIMATE_BYTES_PER_TOKEN = 4
+TOKEN_CACHE_LIMIT = 20000
+# below this many characters, tokenizing on the event loop is cheaper than a worker hop
+TOKENIZE_OFFLOAD_CHARS = 4000
+
+# converted message cache
+MESSAGE_CACHE_LIMIT = 5000
+MESSAGE_CACHE_TTL = 60 * 60 * 2
+MESSAGE_CACHE_MAX_BYTES = 16 * 1024 * 1024
@@ -31,6 +31,10 @@ DEFAULT_LLM_MODEL = ""
 DEFAULT_GLOBAL = {
             "custom_openai_endpoint": None,
             "openai_endpoint_request_timeout": 60,
+            "openai_endpoint_connect_timeout": 10,
+            "http_pool_size": 10,
+            "http_keepalive_expiry": 30,
+            "http2": False,
             "optout": [],
             "optin": [],
             "ratelimit_reset": datetime(1990, 1, 1, 0, 1).strftime("%Y-%m-%d %H:%M:%S"),
@@ -38,6 +42,15 @@ DEFAULT_GLOBAL = {
             "max_prompt_length": 200,
             "custom_text_prompt": None,
             "endpoint_model_history": {},
+            "estimate_unknown_model_tokens": False,
+            "worker_pool_type": "thread",
+            "worker_pool_size": 2,
+            "scheduler_concurrency": 4,
+            "scheduler_endpoint_concurrency": 2,
+            "scheduler_weights": {},
+            "endpoint_pools": {},
+            "metrics_host": "127.0.0.1",
+            "metrics_port": None,
 }
 
 DEFAULT_GUILD = {
@@ -62,11 +75,26 @@ DEFAULT_GUILD = {
     "conversation_reply_time": 20,
     "custom_model_tokens_limit": None,
     "always_reply_on_words": [],
+    "always_reply_on_words_whole_words": False,
+    "stream_responses": False,
+    "burst_window": 1.0,
+    "youtube_description_tokens": 200,
+    "endpoint_pool": None,
+    "prompt_cache_mode": False,
+    "history_summary": False,
+    "history_summary_model": None,
+    "history_summary_tokens": 300,
+    "function_calling_max_rounds": 3,
+    "function_calling_concurrency": 3,
+    "function_calling_timeout": 30,
+    "function_calling_result_tokens": 2000,
 }
 
 DEFAULT_CHANNEL = {
     "custom_text_prompt": None,
-    "reply_percent": None
+    "reply_percent": None,
+    "history_summary": None,
+    "history_summary_until": None,
 }
 
 DEFAULT_ROLE = {
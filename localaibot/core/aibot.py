@@ -1,12 +1,22 @@
+import asyncio
 import logging
 import re
+from collections import Counter, defaultdict
 from datetime import datetime
+from typing import Optional, Tuple
 
 import discord
 from openai import AsyncOpenAI
 from redbot.core import Config, app_commands, commands
 from redbot.core.bot import Red
 
+from localaibot.config.constants import (
+    MESSAGE_CACHE_LIMIT,
+    MESSAGE_CACHE_MAX_BYTES,
+    MESSAGE_CACHE_TTL,
+    SCHEDULER_BACKGROUND_MAX_WAIT,
+    SCHEDULER_NORMAL_MAX_WAIT,
+)
 from localaibot.config.defaults import (
     DEFAULT_CHANNEL,
     DEFAULT_GLOBAL,
@@ -14,15 +24,33 @@ from localaibot.config.defaults import (
     DEFAULT_MEMBER,
     DEFAULT_ROLE,
 )
+from localaibot.core.coalescer import BurstCoalescer
+from localaibot.core.endpoint_pool import EndpointPools
 from localaibot.core.handlers import handle_message, handle_slash_command
 from localaibot.core.random_message_task import RandomMessageTask
+from localaibot.core.metrics_server import MetricsServer
+from localaibot.core.rate_limiter import RateLimiter
+from localaibot.core.summarizer import HistorySummarizer
 from localaibot.dashboard.base import DashboardIntegration
+from localaibot.messages_list.channel_history import ChannelHistory
+from localaibot.messages_list.converter.converter import converted_entries_size
+from localaibot.messages_list.converter.embed.youtube import YoutubeClient
 from localaibot.messages_list.entry import MessageEntry
+from localaibot.messages_list.reference_resolver import ReferenceResolver
+from localaibot.response.chat.cleanup import CleanupProgram
+from localaibot.response.chat.llm_pipeline import ToolStats
 from localaibot.settings.base import Settings
 from localaibot.types.abc import CompositeMetaClass
 from localaibot.utils.cache import Cache
+from localaibot.utils.config_cache import ConfigCache
+from localaibot.utils.matcher import WordMatcher
+from localaibot.utils.metrics import Metrics
+from localaibot.utils.profiler import Profiler
+from localaibot.utils.scheduler import LANE_BACKGROUND, LANE_NORMAL, LLMScheduler
+from localaibot.utils.variables import VARIABLES
+from localaibot.utils.workers import WORKERS
 
-from .openai_utils import setup_openai_client
+from .openai_utils import finish_closing_clients, replace_openai_client
 
 logger = logging.getLogger("red.0x42_cogs.aibot")
 logging.getLogger("httpcore").setLevel(logging.WARNING)
@@ -46,10 +74,35 @@ class AIBot(
         self.openai_client: AsyncOpenAI = None
         # cached options
         self.optindefault: dict[int, bool] = {}
-        self.channels_whitelist: dict[int, list[int]] = {}
+        self.channels_whitelist: dict[int, set[int]] = {}
         self.ignore_regex: dict[int, re.Pattern] = {}
+        self.trigger_words: dict[int, WordMatcher] = {}
+        self.cleanup_programs: dict[int, CleanupProgram] = {}
         self.override_prompt_start_time: dict[int, datetime] = {}
-        self.cached_messages: Cache[int, MessageEntry] = Cache(limit=100)
+        self.prompt_anchors: dict[int, datetime] = {}
+        self.rejections: Counter[str] = Counter()
+        self.tool_stats: dict[str, ToolStats] = defaultdict(ToolStats)
+        self.closing_clients: set[asyncio.Task] = set()
+        self.coalescer = BurstCoalescer()
+        self.rate_limiter = RateLimiter(self.config)
+        self.youtube = YoutubeClient()
+        self.endpoint_pools = EndpointPools(self)
+        self.summarizer = HistorySummarizer(self)
+        self.metrics = Metrics()
+        self.metrics_server = MetricsServer(self.metrics)
+        self.profiler = Profiler()
+        self.scheduler = LLMScheduler(
+            max_wait={LANE_NORMAL: SCHEDULER_NORMAL_MAX_WAIT, LANE_BACKGROUND: SCHEDULER_BACKGROUND_MAX_WAIT}
+        )
+        self.cached_messages: Cache[int, Tuple[Optional[datetime], Tuple[MessageEntry, ...]]] = Cache(
+            limit=MESSAGE_CACHE_LIMIT,
+            ttl=MESSAGE_CACHE_TTL,
+            max_bytes=MESSAGE_CACHE_MAX_BYTES,
+            sizeof=converted_entries_size,
+        )
+        self.channel_history = ChannelHistory(self.is_whitelisted_channel)
+        self.references = ReferenceResolver(bot, self.channel_history)
+        self.config_cache = ConfigCache(self.config)
 
         self.config.register_member(**DEFAULT_MEMBER)
         self.config.register_role(**DEFAULT_ROLE)
@@ -58,16 +111,30 @@ class AIBot(
         self.config.register_global(**DEFAULT_GLOBAL)
 
     async def cog_load(self):
-        self.openai_client = await setup_openai_client(self.bot, self.config)
+        await self.rate_limiter.load()
+        await replace_openai_client(self)
+        await self.endpoint_pools.load()
+        WORKERS.configure(await self.config.worker_pool_type(), await self.config.worker_pool_size())
+        self.scheduler.configure(
+            await self.config.scheduler_concurrency(),
+            await self.config.scheduler_endpoint_concurrency(),
+            {int(guild_id): weight for guild_id, weight in (await self.config.scheduler_weights()).items()},
+        )
+
+        if port := await self.config.metrics_port():
+            await self.metrics_server.start(await self.config.metrics_host(), port)
 
         all_config = await self.config.all_guilds()
 
         for guild_id, config in all_config.items():
             self.optindefault[guild_id] = config["optin_by_default"]
-            self.channels_whitelist[guild_id] = config["channels_whitelist"]
+            self.channels_whitelist[guild_id] = set(config["channels_whitelist"])
             pattern = config["ignore_regex"]
 
             self.ignore_regex[guild_id] = re.compile(pattern) if pattern else None
+            self.trigger_words[guild_id] = WordMatcher(
+                config["always_reply_on_words"], config["always_reply_on_words_whole_words"]
+            )
 
         if logger.isEnabledFor(logging.DEBUG):
             # for development
@@ -80,57 +147,45 @@ class AIBot(
         if self.openai_client:
             await self.openai_client.close()
         self.random_message_trigger.cancel()
+        WORKERS.shutdown()
+        await self.youtube.close()
+        await self.endpoint_pools.close()
+        await finish_closing_clients(self)
+        self.summarizer.close()
+        await self.metrics_server.stop()
 
     async def red_delete_data_for_user(self, *, requester, user_id: int):
         for guild in self.bot.guilds:
             member = guild.get_member(user_id)
             if member:
                 await self.config.member(member).clear()
-                # remove user messages from cache
-                # build a stable list of items to avoid modifying the cache while iterating
-                try:
-                    items = list(self.cached_messages.items())
-                except Exception:
-                    # Fallback if Cache doesn't implement items(); try iterating keys
-                    try:
-                        items = [(k, self.cached_messages[k]) for k in self.cached_messages]
-                    except Exception:
-                        # As a last resort, reset the cache
-                        self.cached_messages = Cache(limit=100)
-                        continue
-
-                keys_to_remove = []
-                for mid, entry in items:
-                    try:
-                        # Support multiple possible entry shapes: .author (object), .author_id or .user_id
-                        author_id = None
-                        if hasattr(entry, "author") and getattr(entry, "author") is not None:
-                            author = getattr(entry, "author")
-                            author_id = getattr(author, "id", None)
-                        if author_id is None:
-                            author_id = getattr(entry, "author_id", None) or getattr(entry, "user_id", None)
-                        if author_id == user_id:
-                            keys_to_remove.append(mid)
-                    except Exception:
-                        # Ignore malformed entries and continue
-                        continue
-
-                for k in keys_to_remove:
-                    try:
-                        # Try dict-like deletion first
-                        del self.cached_messages[k]
-                    except Exception:
-                        try:
-                            # Fallback to pop if available
-                            self.cached_messages.pop(k, None)
-                        except Exception:
-                            # Ignore failures; continue removing remaining keys
-                            pass
+        self.config_cache.invalidate()
+        # remove user messages from cache
+        self.cached_messages.invalidate_owner(user_id)
+        self.references.forget_author(user_id)
+        await self.summarizer.forget_user()
+
+    async def cog_after_invoke(self, ctx: commands.Context):
+        # settings commands write straight to Config, so drop the affected snapshots
+        if ctx.guild and not ctx.command.qualified_name.startswith("aibotowner"):
+            self.config_cache.invalidate(ctx.guild)
+        else:
+            self.config_cache.invalidate()
+
+    def is_whitelisted_channel(self, channel: discord.abc.Messageable) -> bool:
+        guild = getattr(channel, "guild", None)
+        if not guild:
+            return False
+        channel_id = channel.parent_id if isinstance(channel, discord.Thread) else channel.id
+        return channel_id in self.channels_whitelist.get(guild.id, ())
 
     @commands.Cog.listener()
     async def on_red_api_tokens_update(self, service_name, _):
         if service_name in ["openai", "openrouter"]:
-            self.openai_client = await setup_openai_client(self.bot, self.config)
+            await replace_openai_client(self)
+            await self.endpoint_pools.load()
+        elif service_name == "youtube":
+            self.youtube.reset_api_key()
 
     @app_commands.command(name="chat")
     @app_commands.describe(text="The prompt you want to send to the AI.")
@@ -145,6 +200,50 @@ class AIBot(
         """Talk directly to this bot's AI. Ask it anything you want!"""
         await handle_slash_command(self, inter, text)
 
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        self.channel_history.add(message)
+
+    @commands.Cog.listener()
+    async def on_message_edit(self, _: discord.Message, after: discord.Message):
+        self.channel_history.edit(after)
+        self.references.update(after)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.channel_history.delete(payload.channel_id, payload.message_id)
+        self.references.forget(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        self.channel_history.delete(payload.channel_id, *payload.message_ids)
+        for message_id in payload.message_ids:
+            self.references.forget(message_id)
+
+    @commands.Cog.listener()
+    async def on_guild_emojis_update(self, guild: discord.Guild, *_):
+        VARIABLES.invalidate(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, _: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+        VARIABLES.invalidate(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_update(self, _: discord.Guild, after: discord.Guild):
+        VARIABLES.invalidate(after.id)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if after.id == self.bot.user.id and before.nick != after.nick:
+            VARIABLES.invalidate(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_disconnect(self):
+        # events may be missed until we reconnect
+        self.channel_history.invalidate()
+
     @commands.Cog.listener()
     async def on_message_without_command(self, message: discord.Message):
+        if self.profiler.active:
+            return await self.profiler.handle(handle_message(self, message))
         await handle_message(self, message)
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Set
+
+from redbot.core import commands
+
+logger = logging.getLogger("red.0x42_cogs.aibot")
+
+
+class BurstCoalescer:
+    """
+    Folds triggered messages in a channel into a single reply.
+
+    A reply waits `window` seconds for more triggered messages, then answers the latest one, keeping the priority
+    of a forced trigger folded into it. Messages triggered while a reply is being generated are answered by one
+    follow-up reply once it is done.
+    """
+
+    def __init__(self):
+        self.submitted = 0
+        self.dispatched = 0
+        self._latest: Dict[int, commands.Context] = {}
+        self._active: Set[int] = set()
+
+    @property
+    def folded(self) -> int:
+        return self.submitted - self.dispatched - len(self._latest)
+
+    async def submit(
+        self, ctx: commands.Context, dispatch: Callable[[commands.Context], Awaitable], window: float = 0
+    ):
+        channel_id = ctx.channel.id
+        self.submitted += 1
+        previous = self._latest.get(channel_id)
+        if previous and _is_forced(previous) and not _is_forced(ctx):
+            ctx.trigger_decision = previous.trigger_decision
+        self._latest[channel_id] = ctx
+        if channel_id in self._active:
+            return
+
+        self._active.add(channel_id)
+        try:
+            while channel_id in self._latest:
+                if window:
+                    await asyncio.sleep(window)
+                ctx = self._latest.pop(channel_id)
+                self.dispatched += 1
+                try:
+                    await dispatch(ctx)
+                except Exception:
+                    logger.exception(f"Failed to respond in {ctx.guild.name}")
+        finally:
+            self._active.discard(channel_id)
+
+
+def _is_forced(ctx: commands.Context) -> bool:
+    decision = getattr(ctx, "trigger_decision", None)
+    return bool(decision and decision.forced)
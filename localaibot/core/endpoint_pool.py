@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+import discord
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from localaibot.config.constants import (
+    ENDPOINT_EWMA_ALPHA,
+    ENDPOINT_HEALTH_CHECK_INTERVAL,
+    ENDPOINT_MAX_FAILURES,
+)
+from localaibot.core.openai_utils import close_openai_client, close_openai_client_later, setup_openai_client
+from localaibot.core.rate_limiter import RateLimiter
+from localaibot.types.abc import MixinMeta
+
+logger = logging.getLogger("red.0x42_cogs.aibot")
+
+# errors worth retrying on another endpoint of the pool
+FAILOVER_ERRORS = (
+    httpx.TimeoutException,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class Endpoint:
+    def __init__(
+        self,
+        url: str,
+        client: AsyncOpenAI,
+        rate_limiter: RateLimiter,
+        weight: float = 1.0,
+        models: Optional[Dict[str, str]] = None,
+    ):
+        self.url = url
+        self.client = client
+        # fed by this endpoint's responses only, a 429 from it makes the pool fail over instead of blocking everyone
+        self.rate_limiter = rate_limiter
+        self.weight = weight
+        self.models = models or {}
+        self.outstanding = 0
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.healthy = True
+        self.requests = 0
+        self.errors = 0
+
+    def model_for(self, model: str) -> str:
+        """The name the endpoint knows a guild's model by"""
+        return self.models.get(model, model)
+
+    def score(self) -> float:
+        # least outstanding requests, scaled by how slow the endpoint has been and its weight
+        return (self.outstanding + 1) * (self.latency or 1.0) / self.weight
+
+    @asynccontextmanager
+    async def track(self) -> AsyncIterator[None]:
+        self.outstanding += 1
+        self.requests += 1
+        start = time.perf_counter()
+        try:
+            yield
+        except FAILOVER_ERRORS:
+            self.mark_failed()
+            raise
+        else:
+            elapsed = time.perf_counter() - start
+            self.latency = elapsed if self.latency is None else (
+                ENDPOINT_EWMA_ALPHA * elapsed + (1 - ENDPOINT_EWMA_ALPHA) * self.latency
+            )
+            self.failures = 0
+        finally:
+            self.outstanding -= 1
+
+    def mark_failed(self):
+        self.errors += 1
+        self.failures += 1
+        if self.failures >= ENDPOINT_MAX_FAILURES and self.healthy:
+            self.healthy = False
+            logger.warning(f"Endpoint {self.url} marked unhealthy after {self.failures} failures")
+
+
+class EndpointPool:
+    """Endpoints that can serve the same requests, picked by load and latency with failover between them"""
+
+    def __init__(self, name: str, endpoints: List[Endpoint]):
+        self.name = name
+        self.endpoints = endpoints
+
+    def select(self, exclude: Set[Endpoint] = frozenset()) -> Optional[Endpoint]:
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        available = [endpoint for endpoint in candidates if endpoint.healthy and not endpoint.rate_limiter.blocked()]
+        # all endpoints down or ratelimited, still try them rather than failing outright
+        candidates = available or candidates
+        if not candidates:
+            return None
+        return min(candidates, key=Endpoint.score)
+
+    def blocked(self) -> Optional[datetime]:
+        """When requests can be made again, if every endpoint of the pool is refusing them"""
+        resets = [endpoint.rate_limiter.blocked() for endpoint in self.endpoints]
+        if not resets or not all(resets):
+            return None
+        return min(resets)
+
+
+class EndpointPools:
+    """Endpoint pools configured by the bot owner, with a background health check of their endpoints"""
+
+    def __init__(self, cog: MixinMeta):
+        self.cog = cog
+        self.pools: Dict[str, EndpointPool] = {}
+        self._health_task: Optional[asyncio.Task] = None
+
+    def get(self, name: Optional[str]) -> Optional[EndpointPool]:
+        return self.pools.get(name) if name else None
+
+    async def blocked(self, guild: discord.Guild) -> Optional[datetime]:
+        """When the guild's requests can be made again, if its pool or the default endpoint is refusing them"""
+        pool = self.get((await self.cog.config_cache.guild(guild))["endpoint_pool"])
+        return pool.blocked() if pool else self.cog.rate_limiter.blocked()
+
+    async def load(self):
+        previous = [endpoint.client for pool in self.pools.values() for endpoint in pool.endpoints]
+
+        pools = {}
+        for name, endpoints in (await self.cog.config.endpoint_pools()).items():
+            pool_endpoints = []
+            for data in endpoints:
+                rate_limiter = RateLimiter()
+                client = await setup_openai_client(
+                    self.cog.bot, self.cog.config, rate_limiter=rate_limiter, base_url=data["url"]
+                )
+                if not client:
+                    continue
+                # failover replaces the client's own retries
+                client = client.with_options(max_retries=0)
+                pool_endpoints.append(
+                    Endpoint(data["url"], client, rate_limiter, data.get("weight", 1.0), data.get("models"))
+                )
+            if pool_endpoints:
+                pools[name] = EndpointPool(name, pool_endpoints)
+        self.pools = pools
+
+        for client in previous:
+            close_openai_client_later(self.cog, client, client.timeout.read or 0)
+
+        if self.pools and not self._health_task:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        for pool in self.pools.values():
+            for endpoint in pool.endpoints:
+                await close_openai_client(endpoint.client)
+        self.pools = {}
+
+    async def check(self, endpoint: Endpoint) -> bool:
+        try:
+            await asyncio.wait_for(endpoint.client.models.list(), ENDPOINT_HEALTH_CHECK_INTERVAL / 2)
+        except Exception:
+            logger.debug(f"Health check failed for endpoint {endpoint.url}", exc_info=True)
+            endpoint.healthy = False
+            return False
+        if not endpoint.healthy:
+            logger.info(f"Endpoint {endpoint.url} is healthy again")
+        endpoint.healthy = True
+        endpoint.failures = 0
+        return True
+
+    async def _health_loop(self):
+        while self.pools:
+            await asyncio.sleep(ENDPOINT_HEALTH_CHECK_INTERVAL)
+            endpoints = [endpoint for pool in self.pools.values() for endpoint in pool.endpoints]
+            await asyncio.gather(*(self.check(endpoint) for endpoint in endpoints))
+        self._health_task = None
@@ -0,0 +1,46 @@
+import logging
+from typing import Optional
+
+from aiohttp import web
+
+from localaibot.utils.metrics import Metrics
+
+logger = logging.getLogger("red.0x42_cogs.aibot")
+
+
+class MetricsServer:
+    """Optional local HTTP server exposing the cog's metrics at `/metrics` for Prometheus to scrape"""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self.address: Optional[str] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None
+
+    async def start(self, host: str, port: int):
+        await self.stop()
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, host, port).start()
+        except OSError:
+            await runner.cleanup()
+            logger.exception(f"Failed to start the metrics server on {host}:{port}")
+            return
+        self._runner = runner
+        self.address = f"http://{host}:{port}/metrics"
+        logger.info(f"Serving metrics at {self.address}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+            self.address = None
+
+    async def _handle(self, _: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
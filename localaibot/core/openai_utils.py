@@ -1,8 +1,11 @@
+import asyncio
+import importlib.util
 import json
 import logging
 import random
+from dataclasses import dataclass
 from datetime import timedelta
-from typing import Optional
+from typing import TYPE_CHECKING, Dict, Optional
 
 import httpx
 from discord.ext import commands
@@ -10,13 +13,30 @@ from openai import AsyncOpenAI
 from redbot.core import Config
 from redbot.core.bot import Red
 
+if TYPE_CHECKING:
+    from localaibot.core.rate_limiter import RateLimiter
+    from localaibot.types.abc import MixinMeta
+
 logger = logging.getLogger("red.0x42_cogs.aibot")
 
 
+@dataclass
+class TransportStats:
+    requests: int = 0
+    clients_created: int = 0
+    clients_closed: int = 0
+
+
+# process-wide, shared by every client the cog creates
+TRANSPORT_STATS = TransportStats()
+
+
 async def setup_openai_client(
     bot: Red,
     config: Config,
-    ctx: Optional[commands.Context] = None
+    ctx: Optional[commands.Context] = None,
+    rate_limiter: Optional["RateLimiter"] = None,
+    base_url: Optional[str] = None,
 ) -> Optional[AsyncOpenAI]:
     """Initialize the OpenAI client with appropriate configuration.
 
@@ -24,11 +44,13 @@ async def setup_openai_client(
         bot: The Red bot instance
         config: The cog's Config instance
         ctx: Optional context for error messaging
+        rate_limiter: Optional limiter fed by the responses' rate limit headers
+        base_url: Endpoint to use instead of the configured custom endpoint (for endpoint pools)
 
     Returns:
         AsyncOpenAI client if successful, None otherwise
     """
-    base_url = await config.custom_openai_endpoint()
+    base_url = base_url or await config.custom_openai_endpoint()
     api_type = "openai"
     api_key = None
     headers = None
@@ -51,13 +73,22 @@ async def setup_openai_client(
             )
             return None
 
-    timeout = await config.openai_endpoint_request_timeout()
+    settings = await config.all()
+    timeout = get_timeout(settings)
     client = httpx.AsyncClient(
+        http2=use_http2(settings),
+        limits=httpx.Limits(
+            max_connections=settings["http_pool_size"],
+            max_keepalive_connections=settings["http_pool_size"],
+            keepalive_expiry=settings["http_keepalive_expiry"],
+        ),
+        timeout=timeout,
         event_hooks={
-            "request": [log_request_prompt],
-            "response": [config]
+            "request": [count_request, log_request_prompt],
+            "response": [rate_limiter.on_response] if rate_limiter else []
         }
     )
+    TRANSPORT_STATS.clients_created += 1
 
     return AsyncOpenAI(
         api_key=api_key or "sk-placeholderkey",
@@ -68,6 +99,77 @@ async def setup_openai_client(
     )
 
 
+async def replace_openai_client(cog: "MixinMeta", ctx: Optional[commands.Context] = None) -> Optional[AsyncOpenAI]:
+    """Set up a new client for the cog, closing the one it replaces once its in-flight requests had time to finish"""
+    previous = cog.openai_client
+    cog.openai_client = await setup_openai_client(cog.bot, cog.config, ctx, rate_limiter=cog.rate_limiter)
+    if previous and previous is not cog.openai_client:
+        grace = previous.timeout.read if isinstance(previous.timeout, httpx.Timeout) else previous.timeout
+        close_openai_client_later(cog, previous, grace or 0)
+    return cog.openai_client
+
+
+def close_openai_client_later(cog: "MixinMeta", client: AsyncOpenAI, delay: float):
+    """Close a replaced client once its in-flight requests had time to finish, tracked on the cog until then"""
+    task = asyncio.create_task(close_openai_client(client, delay))
+    cog.closing_clients.add(task)
+    task.add_done_callback(cog.closing_clients.discard)
+
+
+async def finish_closing_clients(cog: "MixinMeta"):
+    """Close replaced clients right away instead of after their delay, eg. when the cog unloads"""
+    tasks = list(cog.closing_clients)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def close_openai_client(client: AsyncOpenAI, delay: float = 0):
+    try:
+        if delay:
+            await asyncio.sleep(delay)
+    finally:
+        # also when cancelled while waiting
+        try:
+            await client.close()
+        except Exception:
+            logger.debug("Error closing replaced OpenAI client", exc_info=True)
+        TRANSPORT_STATS.clients_closed += 1
+
+
+def get_timeout(settings: dict) -> httpx.Timeout:
+    return httpx.Timeout(
+        settings["openai_endpoint_request_timeout"],
+        connect=settings["openai_endpoint_connect_timeout"],
+    )
+
+
+def use_http2(settings: dict) -> bool:
+    if not settings["http2"]:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 is enabled but the `h2` package is not installed, using HTTP/1.1")
+        return False
+    return True
+
+
+def pool_stats(client: Optional[AsyncOpenAI]) -> Dict[str, int]:
+    """Connections in the client's pool, empty if httpx's internals aren't what we expect"""
+    pool = getattr(getattr(getattr(client, "_client", None), "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is None:
+        return {}
+    return {
+        "open": len(connections),
+        "idle": sum(1 for connection in connections if connection.is_idle()),
+        "http2": sum(1 for connection in connections if "HTTP/2" in connection.info()),
+    }
+
+
+async def count_request(_: httpx.Request) -> None:
+    TRANSPORT_STATS.requests += 1
+
+
 async def log_request_prompt(request: httpx.Request) -> None:
     """Log the request prompt for debugging purposes."""
     if not logger.isEnabledFor(logging.DEBUG):
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import httpx
+from redbot.core import Config
+
+from localaibot.core.openai_utils import extract_time_delta
+
+logger = logging.getLogger("red.0x42_cogs.aibot")
+
+RESET_FORMAT = "%Y-%m-%d %H:%M:%S"
+# assumed when a response has remaining counts but no reset time
+DEFAULT_RESET = 1.0
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|d|h|m|s)")
+DURATION_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class RateLimitExceeded(Exception):
+    """The endpoint's limits won't allow another request for longer than we are willing to wait"""
+
+
+class RateLimiter:
+    """
+    Client-side limiter fed by the endpoint's `x-ratelimit-*` response headers.
+
+    Remaining requests and tokens are tracked as buckets that refill at their reset times, requests are held
+    back once a bucket runs dry instead of waiting for a 429. A 429 blocks all requests until its reset,
+    which is persisted to Config (only when it changes) so it survives reloads, if the limiter has a Config.
+    """
+
+    def __init__(self, config: Optional[Config] = None, max_wait: float = 30):
+        self.config = config
+        self.max_wait = max_wait
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.requests_reset = 0.0
+        self.tokens_reset = 0.0
+        self.blocked_until: Optional[datetime] = None
+        self.throttled = 0
+        self._lock = asyncio.Lock()
+
+    async def load(self):
+        if not self.config:
+            return
+        blocked_until = datetime.strptime(await self.config.ratelimit_reset(), RESET_FORMAT)
+        self.blocked_until = blocked_until if blocked_until > datetime.now() else None
+
+    def blocked(self) -> Optional[datetime]:
+        """When requests can be made again, if the endpoint is refusing them"""
+        if self.blocked_until and self.blocked_until <= datetime.now():
+            self.blocked_until = None
+        return self.blocked_until
+
+    async def acquire(self, tokens: int = 0):
+        """Wait until a request of about `tokens` prompt tokens fits in the endpoint's limits"""
+        async with self._lock:
+            wait = self._wait_time(tokens)
+            if wait > self.max_wait:
+                raise RateLimitExceeded()
+            if wait > 0:
+                self.throttled += 1
+                logger.debug(f"Holding back request for {wait:.1f}s to stay within the endpoint's rate limits")
+                await asyncio.sleep(wait)
+                # buckets refilled, until the next response says otherwise
+                self.remaining_requests = self.remaining_tokens = None
+            if self.remaining_requests is not None:
+                self.remaining_requests -= 1
+            if self.remaining_tokens is not None:
+                self.remaining_tokens -= tokens
+
+    def _wait_time(self, tokens: int) -> float:
+        now = time.monotonic()
+        wait = 0.0
+        if blocked_until := self.blocked():
+            wait = (blocked_until - datetime.now()).total_seconds()
+        if self.remaining_requests is not None and self.remaining_requests < 1 and self.requests_reset > now:
+            wait = max(wait, self.requests_reset - now)
+        if self.remaining_tokens is not None and self.remaining_tokens < tokens and self.tokens_reset > now:
+            wait = max(wait, self.tokens_reset - now)
+        return wait
+
+    async def on_response(self, response: httpx.Response):
+        """httpx response event hook"""
+        headers = response.headers
+        now = time.monotonic()
+
+        if (remaining := headers.get("x-ratelimit-remaining-requests")) is not None:
+            self.remaining_requests = _parse_int(remaining)
+            self.requests_reset = now + _parse_duration(headers.get("x-ratelimit-reset-requests"))
+        if (remaining := headers.get("x-ratelimit-remaining-tokens")) is not None:
+            self.remaining_tokens = _parse_int(remaining)
+            self.tokens_reset = now + _parse_duration(headers.get("x-ratelimit-reset-tokens"))
+
+        if response.status_code == 429:
+            reset = headers.get("retry-after")
+            delta = (
+                timedelta(seconds=float(reset)) if reset and reset.replace(".", "", 1).isdigit()
+                else extract_time_delta(headers.get("x-ratelimit-reset-requests"))
+            )
+            await self.block(datetime.now() + delta)
+
+    async def block(self, until: datetime):
+        until = until.replace(microsecond=0)
+        if self.blocked_until and until <= self.blocked_until:
+            return
+        self.blocked_until = until
+        logger.warning(f"Endpoint ratelimited until {until.strftime(RESET_FORMAT)}")
+        if self.config:
+            await self.config.ratelimit_reset.set(until.strftime(RESET_FORMAT))
+
+
+def _parse_duration(value: Optional[str]) -> float:
+    """Seconds in a reset header, exactly (`extract_time_delta` pads them for 429 blocks), eg. `1m30s` or `120ms`"""
+    if not value:
+        return DEFAULT_RESET
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return DEFAULT_RESET
+    return sum(float(amount) * DURATION_SECONDS[unit] for amount, unit in parts)
+
+
+def _parse_int(value: str) -> Optional[int]:
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import discord
+import openai
+from openai.types.chat import ChatCompletion
+
+from localaibot.config.constants import ESTIMATE_BYTES_PER_TOKEN, SUMMARY_BATCH_MESSAGES, SUMMARY_MIN_MESSAGES
+from localaibot.core.endpoint_pool import FAILOVER_ERRORS, EndpointPool
+from localaibot.core.rate_limiter import RateLimitExceeded
+from localaibot.types.abc import MixinMeta
+from localaibot.utils.scheduler import LANE_BACKGROUND, SchedulerDropped
+
+if TYPE_CHECKING:
+    from localaibot.messages_list.messages import MessagesList
+
+logger = logging.getLogger("red.0x42_cogs.aibot")
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a Discord conversation. "
+    "Update the summary with the new messages, keeping who said what, open questions and anything worth remembering. "
+    "Drop small talk. Reply with only the updated summary, in at most {tokens} tokens."
+)
+
+
+class HistorySummarizer:
+    """
+    Rolling per-channel summaries of history older than the backread window.
+
+    Messages that fell out of a reply's window are folded into the channel's summary on a background task,
+    the summary is stored with the channel and sent to the LLM as a single system message.
+    """
+
+    def __init__(self, cog: MixinMeta):
+        self.cog = cog
+        self.updates = 0
+        self.folded = 0
+        self._summaries: Dict[int, Dict] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    async def get(self, channel: discord.abc.Messageable, start_time: Optional[datetime] = None) -> Optional[str]:
+        data = await self._load(channel.id)
+        if not data["history_summary"]:
+            return None
+        # the conversation was forgotten after the summary was made
+        if start_time and discord.utils.snowflake_time(data["history_summary_until"]) < start_time:
+            return None
+        return data["history_summary"]
+
+    def schedule(self, messages: "MessagesList"):
+        channel_id = messages.init_message.channel.id
+        if channel_id in self._tasks or not messages.oldest_message:
+            return
+        task = asyncio.create_task(self._update(messages))
+        self._tasks[channel_id] = task
+        task.add_done_callback(lambda done: self._tasks.get(channel_id) is done and self._tasks.pop(channel_id))
+
+    async def reset(self, channel_id: int):
+        if task := self._tasks.pop(channel_id, None):
+            task.cancel()
+        self._summaries.pop(channel_id, None)
+        await self.cog.config.channel_from_id(channel_id).history_summary.clear()
+        await self.cog.config.channel_from_id(channel_id).history_summary_until.clear()
+
+    async def forget_user(self, user_id: Optional[int] = None):
+        """
+        A summary can't be edited per user, so reset every summary of the user's guilds,
+        or all of them if no user is given (or the channel is gone).
+        """
+        for channel_id, data in (await self.cog.config.all_channels()).items():
+            if not data.get("history_summary"):
+                continue
+            guild = getattr(self.cog.bot.get_channel(channel_id), "guild", None)
+            if user_id and guild and not guild.get_member(user_id):
+                continue
+            await self.reset(channel_id)
+        self._summaries.clear()
+
+    def close(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+    async def _load(self, channel_id: int) -> Dict:
+        if channel_id not in self._summaries:
+            group = self.cog.config.channel_from_id(channel_id)
+            self._summaries[channel_id] = {
+                "history_summary": await group.history_summary(),
+                "history_summary_until": await group.history_summary_until(),
+            }
+        return self._summaries[channel_id]
+
+    async def _update(self, messages: "MessagesList"):
+        channel = messages.init_message.channel
+        try:
+            data = await self._load(channel.id)
+            summary, until = data["history_summary"], data["history_summary_until"]
+            after = discord.utils.snowflake_time(until) if until else None
+            if messages.start_time and (not after or after < messages.start_time):
+                summary, after = None, messages.start_time
+
+            # newest first, so a long backlog keeps its most recent part
+            pending = await self.cog.channel_history.history(
+                channel, limit=SUMMARY_BATCH_MESSAGES, before=messages.oldest_message, after=after
+            )
+            pending = [message for message in reversed(pending) if await self._is_foldable(messages, message)]
+            if len(pending) < SUMMARY_MIN_MESSAGES:
+                return
+
+            updated = await self._summarize(messages, summary, pending)
+            if not updated:
+                return
+            data["history_summary"] = updated
+            data["history_summary_until"] = pending[-1].id
+            group = self.cog.config.channel_from_id(channel.id)
+            await group.history_summary.set(updated)
+            await group.history_summary_until.set(pending[-1].id)
+            self.updates += 1
+            self.folded += len(pending)
+            logger.debug(f"Folded {len(pending)} messages into the summary of {channel.id} in {channel.guild.name}")
+        except (SchedulerDropped, RateLimitExceeded, openai.RateLimitError):
+            logger.debug(f"Skipped summary update for {channel.id} in {channel.guild.name}, endpoint is busy")
+        except FAILOVER_ERRORS:
+            logger.warning(f"Skipped summary update for {channel.id} in {channel.guild.name}, endpoint is unavailable")
+        except Exception:
+            logger.exception(f"Failed to update the history summary of {channel.id} in {channel.guild.name}")
+
+    async def _is_foldable(self, messages: "MessagesList", message: discord.Message) -> bool:
+        if not message.clean_content:
+            return False
+        return await messages.is_allowed(message)
+
+    async def _summarize(
+        self, messages: "MessagesList", summary: Optional[str], pending: List[discord.Message]
+    ) -> Optional[str]:
+        settings = messages.settings
+        pool = self.cog.endpoint_pools.get(settings["endpoint_pool"])
+        client = self.cog.openai_client
+        if not pool and not client:
+            return None
+        model = settings["history_summary_model"] or settings["model"]
+        max_tokens = settings["history_summary_tokens"]
+        lines = "\n".join(f'{message.author.display_name}: {message.clean_content}' for message in pending)
+        request = [
+            {"role": "system", "content": SUMMARY_PROMPT.format(tokens=max_tokens)},
+            {"role": "user", "content": f"Current summary:\n{summary or 'None'}\n\nNew messages:\n{lines}"},
+        ]
+        tokens = len(lines) // ESTIMATE_BYTES_PER_TOKEN + max_tokens
+
+        endpoint = f"pool:{pool.name}" if pool else str(client.base_url)
+        async with self.cog.scheduler.slot(messages.guild.id, LANE_BACKGROUND, endpoint):
+            if pool:
+                response = await self._request_pool(pool, model, request, max_tokens, tokens)
+            else:
+                await self.cog.rate_limiter.acquire(tokens)
+                response = await client.chat.completions.create(model=model, messages=request, max_tokens=max_tokens)
+        return (response.choices[0].message.content or "").strip() or None
+
+    async def _request_pool(
+        self, pool: EndpointPool, model: str, request: List[Dict], max_tokens: int, tokens: int
+    ) -> ChatCompletion:
+        """Same failover between the pool's endpoints as replies"""
+        tried = set()
+        while True:
+            endpoint = pool.select(exclude=tried)
+            tried.add(endpoint)
+            try:
+                await endpoint.rate_limiter.acquire(tokens)
+                async with endpoint.track():
+                    return await endpoint.client.chat.completions.create(
+                        model=endpoint.model_for(model), messages=request, max_tokens=max_tokens
+                    )
+            except (*FAILOVER_ERRORS, openai.RateLimitError, RateLimitExceeded):
+                if len(tried) == len(pool.endpoints):
+                    raise
+                logger.debug(f"Summary request to {endpoint.url} failed, trying another endpoint")
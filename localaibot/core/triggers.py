@@ -1,5 +1,10 @@
+import asyncio
+import logging
+import math
 import random
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 
 from redbot.core import commands
 
@@ -8,21 +13,29 @@ from localaibot.config.constants import (
     GROK_PRIMARY_TRIGGERS,
     GROK_SECONDARY_TRIGGERS,
 )
+from localaibot.config.defaults import DEFAULT_REPLY_PERCENT
 from localaibot.core.validators import is_bot_mentioned_or_replied
 from localaibot.types.abc import MixinMeta
+from localaibot.utils.matcher import WordMatcher
+
+logger = logging.getLogger("red.0x42_cogs.aibot")
+
+GROK_PRIMARY_MATCHER = WordMatcher(GROK_PRIMARY_TRIGGERS)
+GROK_SECONDARY_MATCHER = WordMatcher(GROK_SECONDARY_TRIGGERS)
 
 
 async def is_in_conversation(cog: MixinMeta, ctx: commands.Context) -> bool:
     """Check if bot should continue conversation based on recent messages"""
-    reply_percent = await cog.config.guild(ctx.guild).conversation_reply_percent()
-    reply_time_seconds = await cog.config.guild(ctx.guild).conversation_reply_time()
+    settings = await cog.config_cache.guild(ctx.guild)
+    reply_percent = settings["conversation_reply_percent"]
+    reply_time_seconds = settings["conversation_reply_time"]
 
     if reply_percent == 0 or reply_time_seconds == 0:
         return False
 
     cutoff_time = datetime.now(tz=timezone.utc) - timedelta(seconds=reply_time_seconds)
 
-    async for message in ctx.channel.history(limit=10):
+    for message in await cog.channel_history.history(ctx.channel, limit=10):
         if (
             message.author.id == cog.bot.user.id
             and len(message.embeds) == 0
@@ -33,36 +46,79 @@ async def is_in_conversation(cog: MixinMeta, ctx: commands.Context) -> bool:
     return False
 
 async def is_grok_triggered(cog: MixinMeta, ctx: commands.Context) -> bool:
-    if not (await cog.config.guild(ctx.guild).grok_trigger()):
+    if not (await cog.config_cache.guild(ctx.guild))["grok_trigger"]:
         return False
 
     if len(ctx.message.content.split()) > GROK_MAX_WORDS:
         return False
 
-    message_lower = ctx.message.content.lower()
-    
-    return (any(word in message_lower for word in GROK_PRIMARY_TRIGGERS) and 
-            any(word in message_lower for word in GROK_SECONDARY_TRIGGERS))
+    content = ctx.message.content
+    return bool(GROK_PRIMARY_MATCHER.match(content) and GROK_SECONDARY_MATCHER.match(content))
 
 async def is_always_reply_on_words_triggered(cog: MixinMeta, ctx: commands.Context) -> bool:
     """Check if any always_reply_on_words appears in the message"""
-    trigger_words = await cog.config.guild(ctx.guild).always_reply_on_words()
-    if not trigger_words:
+    matcher = cog.trigger_words.get(ctx.guild.id)
+    if not matcher:
         return False
-    
-    message_lower = ctx.message.content.lower()
-    return any(word.lower() in message_lower for word in trigger_words)
-
-async def check_triggers(cog: MixinMeta, ctx: commands.Context, message) -> bool:
-    trigger_funcs = [
-        lambda: is_bot_mentioned_or_replied(cog, message),        
-        lambda: is_always_reply_on_words_triggered(cog, ctx),     
-        lambda: is_grok_triggered(cog, ctx),
-        lambda: is_in_conversation(cog, ctx),                     
+
+    word = matcher.match(ctx.message.content)
+    if word:
+        logger.debug(f'Triggered by word "{word}" in {ctx.guild.name}')
+    return word is not None
+
+async def get_percentage(cog: MixinMeta, ctx: commands.Context) -> float:
+    """Get reply percentage based on member/role/channel/guild settings"""
+    settings = await cog.config_cache.guild(ctx.guild)
+    percentage = settings.resolve("reply_percent", ctx.author, ctx.channel)
+    if percentage is None:
+        percentage = DEFAULT_REPLY_PERCENT
+    return percentage
+
+
+@dataclass(frozen=True)
+class TriggerDecision:
+    trigger: Optional[str]
+    percentage: float
+    rolled: bool = False
+
+    @property
+    def should_reply(self) -> bool:
+        return self.trigger is not None or self.rolled
+
+    @property
+    def forced(self) -> bool:
+        """Whether the message would always be replied to, regardless of chance"""
+        return self.trigger is not None or math.isclose(self.percentage, 1.0, rel_tol=1e-9)
+
+
+async def check_triggers(cog: MixinMeta, ctx: commands.Context) -> TriggerDecision:
+    """Evaluate triggers once per message, the decision is cached on the context for reuse"""
+    decision: Optional[TriggerDecision] = getattr(ctx, "trigger_decision", None)
+    if decision:
+        return decision
+
+    cheap_triggers = [
+        ("mention", lambda: is_bot_mentioned_or_replied(cog, ctx.message)),
+        ("words", lambda: is_always_reply_on_words_triggered(cog, ctx)),
+        ("grok", lambda: is_grok_triggered(cog, ctx)),
     ]
-    
+
     # Short-circuit on first True
-    for trigger_func in trigger_funcs:
+    for name, trigger_func in cheap_triggers:
         if await trigger_func():
-            return True
-    return False
\ No newline at end of file
+            decision = TriggerDecision(name, await get_percentage(cog, ctx))
+            break
+    else:
+        # may need a history fetch, so run it alongside the roll and drop it if the roll already passes
+        conversation = asyncio.create_task(is_in_conversation(cog, ctx))
+        conversation.add_done_callback(lambda task: task.cancelled() or task.exception())
+        percentage = await get_percentage(cog, ctx)
+        if random.random() <= percentage:
+            conversation.cancel()
+            decision = TriggerDecision(None, percentage, rolled=True)
+        else:
+            decision = TriggerDecision("conversation" if await conversation else None, percentage)
+
+    logger.debug(f"Trigger decision for message {ctx.message.id}: {decision}")
+    ctx.trigger_decision = decision
+    return decision
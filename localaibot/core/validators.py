@@ -5,12 +5,58 @@ import asyncio
 import discord
 from redbot.core import commands
 
-from localaibot.core.openai_utils import setup_openai_client
+from localaibot.core.openai_utils import replace_openai_client
 from localaibot.types.abc import MixinMeta
 from localaibot.config.constants import SINGULAR_MENTION_PATTERN
 
 logger = logging.getLogger("red.0x42_cogs.aibot")
 
+def prefilter_message(cog: MixinMeta, message: discord.Message) -> bool:
+    """
+    Cheap synchronous checks run before creating a context or awaiting anything.
+    Only uses precomputed state, anything not cached yet is left to `is_valid_message`.
+    """
+    prefilter_chain = [
+        (prefilter_channel, "Prefilter Channel"),
+        (prefilter_author, "Prefilter Author"),
+        (prefilter_content, "Prefilter Content"),
+    ]
+
+    for prefilter, prefilter_type in prefilter_chain:
+        if not prefilter(cog, message):
+            cog.rejections[prefilter_type] += 1
+            return False
+
+    return True
+
+
+def prefilter_channel(cog: MixinMeta, message: discord.Message) -> bool:
+    if not message.guild:
+        return False
+    channel = message.channel
+    channel_id = channel.parent_id if isinstance(channel, discord.Thread) else channel.id
+    return channel_id in cog.channels_whitelist.get(message.guild.id, ())
+
+
+def prefilter_author(cog: MixinMeta, message: discord.Message) -> bool:
+    if message.author.bot:
+        return False
+    glob = cog.config_cache.peek_global()
+    if not glob:
+        return True
+    if message.author.id in glob.optout:
+        return False
+    return bool(cog.optindefault.get(message.guild.id)) or message.author.id in glob.optin
+
+
+def prefilter_content(cog: MixinMeta, message: discord.Message) -> bool:
+    settings = cog.config_cache.peek(message.guild.id)
+    if settings and 1 <= len(message.content) < settings["messages_min_length"]:
+        return False
+    ignore_regex = cog.ignore_regex.get(message.guild.id)
+    return not (ignore_regex and ignore_regex.search(message.content))
+
+
 async def is_valid_message(cog: MixinMeta, ctx: commands.Context) -> bool:
     """
     Main validation chain that runs all checks in sequence.
@@ -28,6 +74,7 @@ async def is_valid_message(cog: MixinMeta, ctx: commands.Context) -> bool:
         try:
             is_valid, reason = await validator(cog, ctx) 
             if not is_valid:
+                cog.rejections[validation_type] += 1
                 if validation_type in ["OpenAI Client"]:
                     logger.warning(f"Critical validation failed in '{ctx.guild.id}': {validation_type} - {reason}")
                 return False
@@ -41,8 +88,7 @@ async def is_valid_message(cog: MixinMeta, ctx: commands.Context) -> bool:
 async def check_openai_client(cog: MixinMeta, _ : commands.Context) -> Tuple[bool, str]:
     """Validate and setup OpenAI client"""
     if not cog.openai_client:
-        cog.openai_client = await setup_openai_client(cog.bot, cog.config)
-        if not cog.openai_client:
+        if not await replace_openai_client(cog):
             return False, "Failed to setup OpenAI client"
     return True, ""
 
@@ -69,7 +115,7 @@ async def check_channel_settings(cog: MixinMeta, ctx: commands.Context) -> Tuple
     # no-op await so this coroutine uses async features (satisfies linters)
     await asyncio.sleep(0)
 
-    whitelist = cog.channels_whitelist.get(ctx.guild.id, [])
+    whitelist = cog.channels_whitelist.get(ctx.guild.id, ())
     if not whitelist:
         return False, "No whitelisted channels"
 
@@ -92,15 +138,17 @@ async def check_user_status(cog: MixinMeta, ctx: commands.Context) -> Tuple[bool
     if not await cog.bot.allowed_by_whitelist_blacklist(ctx.author):
         return False, "User not allowed by whitelist/blacklist"
 
-    if ctx.author.id in await cog.config.optout():
+    glob = await cog.config_cache.glob()
+    if ctx.author.id in glob.optout:
         return False, "User opted out"
 
-    if not cog.optindefault.get(ctx.guild.id) and ctx.author.id not in await cog.config.optin():
+    if not cog.optindefault.get(ctx.guild.id) and ctx.author.id not in glob.optin:
         return False, "User not opted in"
 
     # Role/member whitelist checks
-    whitelisted_roles = await cog.config.guild(ctx.guild).roles_whitelist()
-    whitelisted_members = await cog.config.guild(ctx.guild).members_whitelist()
+    settings = await cog.config_cache.guild(ctx.guild)
+    whitelisted_roles = settings["roles_whitelist"]
+    whitelisted_members = settings["members_whitelist"]
     if whitelisted_members or whitelisted_roles:
         user_roles = {role.id for role in ctx.author.roles} if ctx.author.roles else set()
         if not (
@@ -119,7 +167,7 @@ async def check_message_content(cog: MixinMeta, ctx: commands.Context) -> Tuple[
             if not await is_bot_mentioned_or_replied(cog, ctx.message):
                 return False, "Single mention without bot reference"
 
-        min_length = await cog.config.guild(ctx.guild).messages_min_length()
+        min_length = (await cog.config_cache.guild(ctx.guild))["messages_min_length"]
         if 1 <= len(ctx.message.content) < min_length:
             return False, f"Message too short (min: {min_length})"
 
@@ -131,6 +179,6 @@ async def check_message_content(cog: MixinMeta, ctx: commands.Context) -> Tuple[
 
 async def is_bot_mentioned_or_replied(cog: MixinMeta, message: discord.Message) -> bool:
     """Check if message mentions or replies to bot"""
-    if not await cog.config.guild(message.guild).reply_to_mentions_replies():
+    if not (await cog.config_cache.guild(message.guild))["reply_to_mentions_replies"]:
         return False
     return cog.bot.user in message.mentions
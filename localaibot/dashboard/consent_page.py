@@ -49,6 +49,7 @@ async def opt_consent(self, user: discord.User, **kwargs):
             elif form.reject.data:
                 await self.config.optout.set(blacklist + [user.id])
                 await self.config.optin.set([id for id in whitelist if id != user.id])
+            self.config_cache.invalidate_global()
         except Exception:
             return {
                 "status": 1,
@@ -74,7 +74,8 @@ async def bot_owner_server_config(self: MixinMeta, guild: discord.Guild, **kwarg
             await self.config.guild(guild).channels_whitelist.set(new_whitelist)
             await self.config.guild(guild).messages_backread.set(messages_backread)
             await self.config.guild(guild).messages_backread_seconds.set(messages_backread_seconds)
-            self.channels_whitelist[guild.id] = new_whitelist
+            self.channels_whitelist[guild.id] = set(new_whitelist)
+            self.config_cache.invalidate(guild)
         except Exception:
             return {
                 "status": 1,
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set
+
+import discord
+
+logger = logging.getLogger("red.0x42_cogs.aibot")
+
+# extra room kept above the requested history size, for messages newer than the one being replied to
+CAPACITY_HEADROOM = 10
+
+
+class ChannelBuffer:
+    def __init__(self, capacity: int):
+        self.messages: Deque[discord.Message] = deque(maxlen=capacity)
+        self.ids: Set[int] = set()
+        self.synced = False
+        self.exhausted = False
+        self.lock = asyncio.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self.messages.maxlen
+
+    def resize(self, capacity: int):
+        if capacity <= self.capacity:
+            return
+        self.messages = deque(self.messages, maxlen=capacity)
+        self.synced = False
+
+    def append(self, message: discord.Message):
+        if message.id in self.ids:
+            return self.replace(message)
+        if self.messages and message.id < self.messages[-1].id:
+            return self.merge([message])
+        if len(self.messages) == self.capacity:
+            self.ids.discard(self.messages.popleft().id)
+            self.exhausted = False
+        self.messages.append(message)
+        self.ids.add(message.id)
+
+    def get(self, message_id: int) -> Optional[discord.Message]:
+        if message_id not in self.ids:
+            return None
+        # referenced messages are usually recent, so search from the newest
+        for message in reversed(self.messages):
+            if message.id == message_id:
+                return message
+        return None
+
+    def replace(self, message: discord.Message):
+        if message.id not in self.ids:
+            return
+        for i, buffered in enumerate(self.messages):
+            if buffered.id == message.id:
+                self.messages[i] = message
+                return
+
+    def remove(self, message_ids: Iterable[int]):
+        removed = self.ids.intersection(message_ids)
+        if not removed:
+            return
+        self.ids -= removed
+        self.messages = deque((m for m in self.messages if m.id not in removed), maxlen=self.capacity)
+
+    def merge(self, messages: List[discord.Message]):
+        merged = {m.id: m for m in messages}
+        merged.update({m.id: m for m in self.messages})
+        ordered = sorted(merged.values(), key=lambda m: m.id)[-self.capacity:]
+        if len(ordered) < len(merged):
+            self.exhausted = False
+        self.messages = deque(ordered, maxlen=self.capacity)
+        self.ids = {m.id for m in ordered}
+
+    def select(self, limit: int, before: Optional[discord.Message], after: Optional[datetime]) -> Optional[List[discord.Message]]:
+        """Newest-first slice matching `channel.history()` arguments, or None if the buffer can't answer it"""
+        result = []
+        for message in reversed(self.messages):
+            if before and message.id >= before.id:
+                continue
+            if after and message.created_at <= after:
+                return result
+            result.append(message)
+            if len(result) >= limit:
+                return result
+        return result if self.exhausted else None
+
+
+class ChannelHistory:
+    """
+    In-memory ring buffers of recent messages for whitelisted channels.
+
+    Buffers are kept up to date from gateway events, so history is only fetched from Discord on a cold start or after a gap.
+    """
+
+    def __init__(self, is_tracked: Callable[[discord.abc.Messageable], bool], capacity: int = 50):
+        self.is_tracked = is_tracked
+        self.capacity = capacity
+        self.hits = 0
+        self.fetches = 0
+        self._buffers: Dict[int, ChannelBuffer] = {}
+
+    def add(self, message: discord.Message):
+        buffer = self._buffers.get(message.channel.id)
+        if buffer:
+            buffer.append(message)
+
+    def edit(self, message: discord.Message):
+        buffer = self._buffers.get(message.channel.id)
+        if buffer:
+            buffer.replace(message)
+
+    def delete(self, channel_id: int, *message_ids: int):
+        buffer = self._buffers.get(channel_id)
+        if buffer:
+            buffer.remove(message_ids)
+
+    def discard(self, channel_id: int):
+        self._buffers.pop(channel_id, None)
+
+    def invalidate(self):
+        """Drop all buffers, eg. after missing gateway events"""
+        self._buffers.clear()
+
+    def get(self, channel_id: int, message_id: int) -> Optional[discord.Message]:
+        """A buffered message, without fetching"""
+        buffer = self._buffers.get(channel_id)
+        return buffer.get(message_id) if buffer else None
+
+    def contains(self, channel: discord.abc.Messageable, message_id: int) -> Optional[bool]:
+        """If a message still exists, or None if unknown"""
+        buffer = self._buffers.get(channel.id)
+        if not buffer or not buffer.synced:
+            return None
+        if message_id in buffer.ids:
+            return True
+        if buffer.messages and buffer.messages[0].id < message_id < buffer.messages[-1].id:
+            return False
+        return None
+
+    async def history(
+        self,
+        channel: discord.abc.Messageable,
+        limit: int,
+        before: Optional[discord.Message] = None,
+        after: Optional[datetime] = None,
+    ) -> List[discord.Message]:
+        """Same as `channel.history(limit, before, after, oldest_first=False)`, served from the buffer when possible"""
+        if not self.is_tracked(channel):
+            return await self._fetch(channel, limit, before, after)
+
+        buffer = self._buffers.get(channel.id)
+        if not buffer:
+            buffer = self._buffers[channel.id] = ChannelBuffer(max(self.capacity, limit + CAPACITY_HEADROOM))
+        buffer.resize(limit + CAPACITY_HEADROOM)
+
+        async with buffer.lock:
+            if buffer.synced:
+                result = buffer.select(limit, before, after)
+                if result is not None:
+                    self.hits += 1
+                    return result
+            else:
+                fetched = await self._fetch(channel, buffer.capacity)
+                buffer.merge(fetched)
+                buffer.exhausted = len(fetched) < buffer.capacity
+                buffer.synced = True
+
+                result = buffer.select(limit, before, after)
+                if result is not None:
+                    return result
+
+        logger.debug(f"Requested history in {channel.id} is older than its buffer, fetching directly")
+        return await self._fetch(channel, limit, before, after)
+
+    async def _fetch(self, channel, limit, before=None, after=None) -> List[discord.Message]:
+        self.fetches += 1
+        return [
+            message
+            async for message in channel.history(
+                limit=limit,
+                before=before,
+                after=after,
+                oldest_first=False,
+            )
+        ]
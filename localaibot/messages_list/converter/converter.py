@@ -3,6 +3,7 @@ import logging
 from discord import Message
 from redbot.core import commands
 
+from localaibot.config.constants import URL_PATTERN
 from localaibot.types.abc import MixinMeta
 from localaibot.utils.utilities import contains_youtube_link, is_embed_valid
 from localaibot.messages_list.converter.embed.formatter import format_embed_content
@@ -14,6 +15,12 @@ from localaibot.messages_list.entry import MessageEntry
 logger = logging.getLogger("red.0x42_cogs.aibot")
 
 
+def converted_entries_size(value) -> int:
+    """Approximate memory used by a cached conversion, for the cache byte budget"""
+    _, entries = value
+    return sum(len(str(entry.content)) for entry in entries) + 64 * len(entries)
+
+
 class MessageConverter():
     def __init__(self, cog: MixinMeta, ctx: commands.Context):
         self.cog = cog
@@ -25,6 +32,10 @@ class MessageConverter():
 
     async def convert(self, message: Message):
         """Converts a Discord message to ChatML format message(s)"""
+        cached = self.message_cache.get(message.id)
+        if cached and cached[0] == message.edited_at:
+            return list(cached[1])
+
         res = []
         role = "user" if message.author.id != self.bot_id else "assistant"
         if message.attachments:
@@ -38,8 +49,16 @@ class MessageConverter():
             content = format_text_content(message)
             self.add_entry(content, res, role)
 
+        if res and self.is_cacheable(message):
+            self.message_cache.set(message.id, (message.edited_at, tuple(res)), owner=message.author.id)
+
         return res or None
 
+    @staticmethod
+    def is_cacheable(message: Message) -> bool:
+        # link previews can still arrive without the message being edited
+        return not (URL_PATTERN.search(message.content) and not is_embed_valid(message))
+
     def handle_attachment(self, message: Message, res, role):
         attachment = message.attachments[0]
         # Treat all attachments generically. Do not perform any image detection or scanning.
@@ -1,31 +1,160 @@
-
+import asyncio
 import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
 
 import aiohttp
 from discord import Message
+from redbot.core.bot import Red
 from tenacity import retry, stop_after_attempt, wait_random
 
-from localaibot.config.constants import YOUTUBE_VIDEO_ID_PATTERN
+from localaibot.config.constants import (
+    YOUTUBE_API_BATCH_SIZE,
+    YOUTUBE_CACHE_LIMIT,
+    YOUTUBE_CACHE_TTL,
+    YOUTUBE_VIDEO_ID_PATTERN,
+)
+from localaibot.types.abc import MixinMeta
+from localaibot.utils.cache import Cache
+from localaibot.utils.tokens import get_encoding, truncate_to_tokens
+from localaibot.utils.utilities import contains_youtube_link
 
 logger = logging.getLogger("red.0x42_cogs.aibot")
 
-YOUTUBE_API_URL = "https://www.googleapis.com/youtube/v3/videos?part=snippet&id={}&key={}"
+YOUTUBE_API_URL = "https://www.googleapis.com/youtube/v3/videos"
+
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class VideoDetails:
+    title: str
+    channel: str
+    description: str
+
+
+class YoutubeClient:
+    """
+    Shared session and LRU/TTL cache for YouTube video metadata.
+
+    Uncached videos are looked up in batches (the videos endpoint takes up to 50 comma-separated ids),
+    and videos that don't exist are cached too.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self._api_key: Optional[str] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._cache: Cache[str, Optional[VideoDetails]] = Cache(limit=YOUTUBE_CACHE_LIMIT, ttl=YOUTUBE_CACHE_TTL)
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    async def get_api_key(self, bot: Red) -> Optional[str]:
+        if self._api_key is None:
+            self._api_key = (await bot.get_shared_api_tokens("youtube")).get("api_key") or ""
+        return self._api_key or None
+
+    def reset_api_key(self):
+        self._api_key = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if not self._session or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        return self._session
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
 
+    async def get_videos(self, api_key: str, video_ids: Iterable[str]) -> Dict[str, Optional[VideoDetails]]:
+        results = {}
+        missing = []
+        waiting = {}
+        for video_id in dict.fromkeys(video_ids):
+            cached = self._cache.get(video_id, _MISSING)
+            if cached is not _MISSING:
+                results[video_id] = cached
+            elif video_id in self._pending:
+                waiting[video_id] = self._pending[video_id]
+            else:
+                missing.append(video_id)
 
-async def format_youtube_embed(api_key: str, message: Message):
+        loop = asyncio.get_running_loop()
+        for start in range(0, len(missing), YOUTUBE_API_BATCH_SIZE):
+            batch = missing[start:start + YOUTUBE_API_BATCH_SIZE]
+            futures = {video_id: loop.create_future() for video_id in batch}
+            self._pending.update(futures)
+            try:
+                fetched = await self._fetch(api_key, batch)
+                for video_id in batch:
+                    results[video_id] = fetched.get(video_id)
+                    self._cache[video_id] = results[video_id]
+            except Exception:
+                logger.error("Failed request to Youtube API", exc_info=True)
+                for video_id in batch:
+                    results[video_id] = None
+            finally:
+                for video_id in batch:
+                    self._pending.pop(video_id, None)
+                    if not futures[video_id].done():
+                        futures[video_id].set_result(results.get(video_id))
+
+        for video_id, future in waiting.items():
+            results[video_id] = await future
+        return results
+
+    async def prefetch(self, bot: Red, messages: Iterable[Message]):
+        """Look up the videos linked in a batch of history messages at once, so converting them hits the cache"""
+        video_ids = [
+            video_id for message in messages
+            if contains_youtube_link(message.content) and (video_id := get_video_id(message.content))
+        ]
+        if not video_ids:
+            return
+        api_key = await self.get_api_key(bot)
+        if api_key:
+            await self.get_videos(api_key, video_ids)
+
+    @retry(
+        wait=wait_random(min=1, max=2), stop=(stop_after_attempt(3)),
+        reraise=True
+    )
+    async def _fetch(self, api_key: str, video_ids: List[str]) -> Dict[str, VideoDetails]:
+        self.requests += 1
+        params = {"part": "snippet", "id": ",".join(video_ids), "key": api_key}
+        async with self.session.get(YOUTUBE_API_URL, params=params) as response:
+            response.raise_for_status()
+            video_data = await response.json()
+        return {
+            item["id"]: VideoDetails(
+                item["snippet"]["title"], item["snippet"]["channelTitle"], item["snippet"]["description"]
+            )
+            for item in video_data.get("items", [])
+        }
+
+
+async def format_youtube_embed(cog: MixinMeta, api_key: str, message: Message):
     video_id = get_video_id(message.content)
     author = message.author.display_name
 
     if not video_id:
         return None
 
-    try:
-        video_title, channel_title, description = await get_video_details(api_key, video_id)
-    except Exception:
-        logger.error("Failed request to Youtube API", exc_info=True)
+    video = (await cog.youtube.get_videos(api_key, [video_id])).get(video_id)
+    if not video:
         return None
 
-    return (f'User "{author}" sent: [Link to Youtube video with title "{video_title}" and description "{description}" from channel "{channel_title}"]')
+    settings = await cog.config_cache.guild(message.guild)
+    description = video.description
+    budget = settings["youtube_description_tokens"]
+    if budget is not None:
+        encoding = get_encoding(settings["model"], estimate=(await cog.config_cache.glob()).settings["estimate_unknown_model_tokens"])
+        truncated = truncate_to_tokens(description, encoding, budget)
+        if truncated != description:
+            description = truncated.rstrip() + "..."
+
+    return (f'User "{author}" sent: [Link to Youtube video with title "{video.title}" and description "{description}" from channel "{video.channel}"]')
 
 
 def get_video_id(url):
@@ -35,20 +164,3 @@ def get_video_id(url):
         return match.group(1)
     else:
         return None
-
-
-@retry(
-    wait=wait_random(min=1, max=2), stop=(stop_after_attempt(3)),
-    reraise=True
-)
-async def get_video_details(api_key, video_id):
-    url = YOUTUBE_API_URL.format(video_id, api_key)
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            response.raise_for_status()
-            video_data = await response.json()
-            snippet = video_data["items"][0]["snippet"]
-            video_title = snippet["title"]
-            channel_title = snippet["channelTitle"]
-            description = snippet["description"]
-            return (video_title, channel_title, description)
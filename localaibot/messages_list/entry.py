@@ -1,8 +1,12 @@
-from dataclasses import dataclass
-from typing import Literal, Union
+from dataclasses import dataclass, field
+from typing import Dict, List, Literal, Optional, Union
 
 
 @dataclass(frozen=True)
 class MessageEntry:
     role: Literal['user', 'assistant', 'system', 'tool']
-    content: Union[str, list]
\ No newline at end of file
+    content: Union[str, list]
+    tool_calls: Optional[List] = None
+    tool_call_id: Optional[str] = None
+    # token counts per encoding name (None for estimates), filled in lazily
+    tokens: Dict[Optional[str], int] = field(default_factory=dict, compare=False, repr=False)
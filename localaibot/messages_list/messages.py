@@ -1,21 +1,27 @@
 import json
 import logging
 import random
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from typing import List
+from typing import Any, Deque, Dict, List, Optional
 
 import discord
 import tiktoken
 from discord import Message
 from redbot.core import commands
 
+from localaibot.config.constants import REPLY_CHAIN_FETCH_BUDGET, REPLY_CHAIN_MAX_DEPTH
 from localaibot.config.defaults import DEFAULT_PROMPT
 from localaibot.config.models import OTHER_MODELS_LIMITS
 from localaibot.messages_list.converter.converter import MessageConverter
 from localaibot.messages_list.entry import MessageEntry
 from localaibot.messages_list.opt_view import OptView
+from localaibot.messages_list.reference_resolver import FetchBudget
 from localaibot.types.abc import MixinMeta
-from localaibot.utils.utilities import format_variables
+from localaibot.utils.metrics import STAGE_CONVERSION, STAGE_HISTORY, STAGE_TOKENIZATION
+from localaibot.utils.tokens import count_entries_tokens, count_texts_tokens, get_encoding
+from localaibot.utils.utilities import format_variables, format_volatile_variables
 
 logger = logging.getLogger("red.0x42_cogs.aibot")
 
@@ -26,10 +32,18 @@ async def create_messages_list(
     cog: MixinMeta, ctx: commands.Context, prompt: str = None, history: bool = True
 ):
     """to manage messages in ChatML format"""
+    start = time.perf_counter()
     thread = MessagesList(cog, ctx)
     await thread._init(prompt=prompt)
     if history:
         await thread.add_history()
+        await thread.add_summary()
+    await thread.apply_cache_layout()
+
+    metrics = cog.metrics
+    metrics.observe(STAGE_HISTORY, time.perf_counter() - start, ctx.guild.id, thread.model)
+    metrics.observe(STAGE_CONVERSION, thread.conversion_time, ctx.guild.id, thread.model)
+    metrics.observe(STAGE_TOKENIZATION, thread.tokenization_time, ctx.guild.id, thread.model)
     return thread
 
 
@@ -41,6 +55,14 @@ class MessagesList:
     ):
         self.bot = cog.bot
         self.config = cog.config
+        self.channel_history = cog.channel_history
+        self.config_cache = cog.config_cache
+        self.youtube = cog.youtube
+        self.prompt_anchors = cog.prompt_anchors
+        self.summarizer = cog.summarizer
+        self.references = cog.references
+        # shared by every reply chain walked for this list
+        self.fetch_budget = FetchBudget(REPLY_CHAIN_FETCH_BUDGET)
         self.ctx = ctx
         self.converter = MessageConverter(cog, ctx)
         self.init_message = ctx.message
@@ -48,11 +70,20 @@ class MessagesList:
         self.ignore_regex = cog.ignore_regex.get(self.guild.id, None)
         self.start_time = cog.override_prompt_start_time.get(
             self.guild.id)
-        self.messages: List[MessageEntry] = []
+        # history is walked newest first, so entries are mostly added at the front
+        self.messages: Deque[MessageEntry] = deque()
+        self._json: Optional[List[Dict[str, Any]]] = None
         self.messages_ids = set()
         self.tokens = 0
+        # seconds spent converting messages and counting their tokens, for the metrics
+        self.conversion_time = 0.0
+        self.tokenization_time = 0.0
         self.model = None
         self.can_reply = True
+        self.prompt: Optional[str] = None
+        self.system_entry: Optional[MessageEntry] = None
+        # oldest history message that made it into the list, older ones can be summarized
+        self.oldest_message: Optional[Message] = None
 
     def __len__(self):
         return len(self.messages)
@@ -61,34 +92,28 @@ class MessagesList:
         return json.dumps(self.get_json(), indent=4)
 
     async def _init(self, prompt=None):
-        self.model = await self.config.guild(self.guild).model()
-        self.token_limit = await self.config.guild(self.guild).custom_model_tokens_limit() or self._get_token_limit(self.model)
-        try:
-            self._encoding = tiktoken.encoding_for_model(self.model)
-        except KeyError:
-            self._encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
+        self.settings = await self.config_cache.guild(self.guild)
+        self.glob = await self.config_cache.glob()
+        self.model = self.settings["model"]
+        self.token_limit = self.settings["custom_model_tokens_limit"] or self._get_token_limit(self.model)
+        self._encoding = get_encoding(self.model, estimate=self.glob.settings["estimate_unknown_model_tokens"])
 
         if not prompt:  # jank
             await self.add_msg(self.init_message)
 
-        bot_prompt = prompt or await self._pick_prompt()
-
-        await self.add_system(await format_variables(self.ctx, bot_prompt))
+        self.prompt = prompt or await self._pick_prompt()
+        stable = self.settings["prompt_cache_mode"]
+        self.system_entry = await self.add_system(await format_variables(self.ctx, self.prompt, stable=stable))
 
     async def _pick_prompt(self):
         author = self.init_message.author
-        role_prompt = None
-
-        for role in author.roles:
-            if role.id in (await self.config.all_roles()):
-                role_prompt = await self.config.role(role).custom_text_prompt()
-                break
+        role_prompt = (self.settings.role(author) or {}).get("custom_text_prompt")
 
-        return (await self.config.member(self.init_message.author).custom_text_prompt()
+        return (self.settings.member(author)["custom_text_prompt"]
                 or role_prompt
-                or await self.config.channel(self.init_message.channel).custom_text_prompt()
-                or await self.config.guild(self.guild).custom_text_prompt()
-                or await self.config.custom_text_prompt()
+                or self.settings.channel(self.init_message.channel)["custom_text_prompt"]
+                or self.settings["custom_text_prompt"]
+                or self.glob.settings["custom_text_prompt"]
                 or DEFAULT_PROMPT)
 
     async def check_if_add(self, message: Message, force: bool = False):
@@ -101,16 +126,20 @@ class MessagesList:
             )
             return False
 
+        return await self.is_allowed(message)
+
+    async def is_allowed(self, message: Message) -> bool:
+        """If a message may be sent to the LLM at all"""
         if self.ignore_regex and self.ignore_regex.search(message.content):
             return False
         if not await self.bot.allowed_by_whitelist_blacklist(message.author):
             return False
-        if message.author.id in await self.config.optout():
+        if message.author.id in self.glob.optout:
             return False
         if (
             (message.author.id != self.bot.user.id)
-            and message.author.id not in await self.config.optin()
-            and not await self.config.guild(self.guild).optin_by_default()
+            and message.author.id not in self.glob.optin
+            and not self.settings["optin_by_default"]
         ):
             return False
 
@@ -120,83 +149,81 @@ class MessagesList:
         if not await self.check_if_add(message, force):
             return
 
+        start = time.perf_counter()
         converted = await self.converter.convert(message)
+        self.conversion_time += time.perf_counter() - start
 
         if not converted:
             return
 
-        for entry in converted:
+        start = time.perf_counter()
+        counts = await count_entries_tokens(converted, self._encoding)
+        self.tokenization_time += time.perf_counter() - start
+        for entry, count in zip(converted, counts):
             if self.tokens > self.token_limit:
                 return
 
-            self.messages.insert(index or 0, entry)
+            self._insert(entry, index)
             self.messages_ids.add(message.id)
-
-            if isinstance(entry.content, list):
-                for item in entry.content:
-                    if not isinstance(item, dict):
-                        continue
-                    if item.get("type") == "text":
-                        await self._add_tokens(item.get("text"))
-            else:
-                await self._add_tokens(entry.content)
+            self.tokens += count
 
         if message.reference and message.author.id != self.bot.user.id:
             chain = []
-            ref = message.reference
-
-            # attempt to resolve or fetch the referenced message
-            try:
-                referenced = ref.resolved if isinstance(ref.resolved, discord.Message) else await self.bot.get_channel(ref.channel_id).fetch_message(ref.message_id)
-            except Exception:
-                referenced = None
+            referenced = await self.references.resolve(message.reference, self.fetch_budget)
 
             # walk up the reply chain, collecting messages to add, avoiding bot messages and duplicates
-            depth = 0
-            MAX_CHAIN_DEPTH = 10
-            while referenced and isinstance(referenced, discord.Message) and referenced.author.id != self.bot.user.id and referenced.id not in self.messages_ids and depth < MAX_CHAIN_DEPTH:
+            while (
+                referenced
+                and referenced.author.id != self.bot.user.id
+                and referenced.id not in self.messages_ids
+                and len(chain) < REPLY_CHAIN_MAX_DEPTH
+            ):
                 chain.append(referenced)
-
-                if not referenced.reference:
-                    break
-
-                # resolve/fetch the next referenced message in the chain
-                try:
-                    next_ref = referenced.reference
-                    referenced = next_ref.resolved if isinstance(next_ref.resolved, discord.Message) else await self.bot.get_channel(next_ref.channel_id).fetch_message(next_ref.message_id)
-                except Exception:
-                    break
-
-                depth += 1
+                referenced = await self.references.resolve(referenced.reference, self.fetch_budget)
 
             # add the chain oldest-first so context order is correct
             for msg in reversed(chain):
                 await self.add_msg(msg, index=0, force=force)
 
-    async def add_system(self, content: str, index: int = None):
+    async def add_system(self, content: str, index: int = None) -> Optional[MessageEntry]:
         if self.tokens > self.token_limit:
-            return
+            return None
         entry = MessageEntry("system", content)
-        self.messages.insert(index or 0, entry)
+        self._insert(entry, index)
         await self._add_tokens(content)
+        return entry
+
+    async def apply_cache_layout(self):
+        """
+        In prompt cache mode, put the system prompt first and volatile variables last,
+        so consecutive requests share the longest possible prefix
+        """
+        if not self.settings["prompt_cache_mode"]:
+            return
+        if self.system_entry in self.messages:
+            self.messages.remove(self.system_entry)
+            self._insert(self.system_entry, 0)
+        volatile = await format_volatile_variables(self.ctx, self.prompt)
+        if volatile:
+            await self.add_system(volatile, index=len(self.messages))
 
     async def add_assistant(self, content: str = "", index: int = None, tool_calls: list = []):
         if self.tokens > self.token_limit:
             return
         entry = MessageEntry("assistant", content, tool_calls=tool_calls)
-        self.messages.insert(index or 0, entry)
+        self._insert(entry, index)
         await self._add_tokens(content)
 
     async def add_tool_result(self, content: str,  tool_call_id: int, index: int = None):
         if self.tokens > self.token_limit:
             return
         entry = MessageEntry("tool", content, tool_call_id=tool_call_id)
-        self.messages.insert(index or 0, entry)
+        self._insert(entry, index)
         await self._add_tokens(content)
 
     async def add_history(self):
-        limit = await self.config.guild(self.guild).messages_backread()
-        max_seconds_gap = await self.config.guild(self.guild).messages_backread_seconds()
+        limit = self.settings["messages_backread"]
+        max_seconds_gap = self.settings["messages_backread_seconds"]
         start_time: datetime = (
             self.start_time - timedelta(seconds=1) if self.start_time else None
         )
@@ -212,76 +239,131 @@ class MessagesList:
 
         await self._process_past_messages(past_messages, max_seconds_gap)
 
-        if users and not await self.config.guild(self.guild).optin_disable_embed():
+        if users and not self.settings["optin_disable_embed"]:
             if (random.random() <= 0.33) or (len(users) > 3):
                 await self._send_optin_embed(users)
 
+    async def add_summary(self):
+        """Summary of the channel's history before the backread window, updated in the background"""
+        if not self.settings["history_summary"]:
+            return
+        summary = await self.summarizer.get(self.init_message.channel, self.start_time)
+        if summary:
+            await self.add_system(f"Summary of the earlier conversation in this channel:\n{summary}")
+        self.summarizer.schedule(self)
+
     async def _get_past_messages(self, limit, start_time):
-        return [
-            message
-            async for message in self.init_message.channel.history(
-                limit=limit + 1,
-                before=self.init_message,
-                after=start_time,
-                oldest_first=False,
-            )
-        ]
+        if self.settings["prompt_cache_mode"]:
+            return await self._get_anchored_messages(limit, start_time)
+        return await self.channel_history.history(
+            self.init_message.channel,
+            limit=limit + 1,
+            before=self.init_message,
+            after=start_time,
+        )
+
+    async def _get_anchored_messages(self, limit, start_time):
+        """
+        History whose oldest message stays the same across replies, so the prompt only grows at its end.
+        The window moves forward once it holds twice the backread limit.
+        """
+        channel = self.init_message.channel
+        anchor = self.prompt_anchors.get(channel.id)
+        after = max((time for time in (start_time, anchor) if time), default=None)
+        messages = await self.channel_history.history(
+            channel,
+            limit=limit * 2 + 1,
+            before=self.init_message,
+            after=after,
+        )
+        if anchor is None or len(messages) > limit * 2:
+            messages = messages[:limit + 1]
+        if messages:
+            # the last message is only used for the time gap check, it stays the anchor
+            self.prompt_anchors[channel.id] = messages[-1].created_at - timedelta(microseconds=1)
+        return messages
 
     async def _get_unopted_users(self, messages):
         users = set()
 
-        if await self.config.guild(self.guild).optin_by_default():
+        if self.settings["optin_by_default"]:
             return users
 
         for message in messages:
             if (
                 (not message.author.bot)
-                and (message.author.id not in await self.config.optin())
-                and (message.author.id not in await self.config.optout())
+                and (message.author.id not in self.glob.optin)
+                and (message.author.id not in self.glob.optout)
             ):
                 users.add(message.author)
 
         return users
 
     async def _process_past_messages(self, past_messages, max_seconds_gap):
+        await self.youtube.prefetch(self.bot, past_messages)
+        await self.references.prefetch(past_messages, self.fetch_budget, follow=self._is_followed)
         for i in range(len(past_messages) - 1):
             if self.tokens > self.token_limit:
                 return logger.debug(f"{self.tokens} tokens used - nearing limit, stopping context creation for message {self.init_message.id}")
             if (past_messages[i].author.id == self.bot.user.id) and (past_messages[i].embeds and past_messages[i].embeds[0].title == OPTIN_EMBED_TITLE):
                 continue
+            self.oldest_message = past_messages[i]
             if await self._is_valid_time_gap(past_messages[i], past_messages[i + 1], max_seconds_gap):
                 await self.add_msg(past_messages[i])
             else:
                 await self.add_msg(past_messages[i])
                 break
 
+    def _is_followed(self, message: Message) -> bool:
+        # like in `add_msg`, reply chains aren't followed past the bot's own messages
+        return message.author.id != self.bot.user.id
+
     async def _send_optin_embed(self, users):
         users = ", ".join([user.mention for user in users])
         embed = discord.Embed(
             title=OPTIN_EMBED_TITLE,
             color=await self.bot.get_embed_color(self.init_message),
         )
-        view = OptView(self.config)
+        view = OptView(self.config, self.config_cache)
         embed.description = f"{users}\nPlease choose whether to allow a subset of your Discord messages from any server with the bot, to be sent to OpenAI or an external party.\nThis will allow the bot to reply to your messages or use your messages.\nThis message will disappear if all current chatters have made a choice."
         await self.init_message.channel.send(embed=embed, view=view)
 
-    def get_json(self):
-        return [
-            {
-                "role": message.role,
-                "content": message.content,
-                **({"tool_calls": message.tool_calls} if message.tool_calls else {}),
-                **({"tool_call_id": message.tool_call_id} if hasattr(message, 'tool_call_id') and message.tool_call_id else {})
-            }
-            for message in self.messages
-        ]
+    def _insert(self, entry: MessageEntry, index: Optional[int] = None):
+        """Add an entry at `index`, the front by default; adding at either end is O(1)"""
+        if not index:
+            self.messages.appendleft(entry)
+            self._json = None
+        elif index >= len(self.messages):
+            self.messages.append(entry)
+            # appends (eg. tool rounds) extend the serialized messages instead of rebuilding them
+            if self._json is not None:
+                self._json.append(self._entry_json(entry))
+        else:
+            self.messages.insert(index, entry)
+            self._json = None
+
+    def get_json(self) -> List[Dict[str, Any]]:
+        if self._json is None:
+            self._json = [self._entry_json(message) for message in self.messages]
+        return self._json
+
+    @staticmethod
+    def _entry_json(message: MessageEntry) -> Dict[str, Any]:
+        return {
+            "role": message.role,
+            "content": message.content,
+            **({"tool_calls": message.tool_calls} if message.tool_calls else {}),
+            **({"tool_call_id": message.tool_call_id} if message.tool_call_id else {})
+        }
+
+    @property
+    def encoding(self) -> Optional[tiktoken.Encoding]:
+        return self._encoding
 
     async def _add_tokens(self, content):
-        if not self._encoding:
-            await self._initialize_encoding()
-        content = str(content)
-        tokens = self._encoding.encode(content, disallowed_special=())
-        self.tokens += len(tokens)
+        start = time.perf_counter()
+        self.tokens += (await count_texts_tokens([str(content)], self._encoding))[0]
+        self.tokenization_time += time.perf_counter() - start
 
     @staticmethod
     def _get_token_limit(model) -> int:
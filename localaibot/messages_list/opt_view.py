@@ -1,10 +1,13 @@
 import discord
 from redbot.core import Config
 
+from localaibot.utils.config_cache import ConfigCache
+
 
 class OptView(discord.ui.View):
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, config_cache: ConfigCache):
         self.config = config
+        self.config_cache = config_cache
         super().__init__()
 
     @discord.ui.button(label='Opt In', style=discord.ButtonStyle.green)
@@ -18,6 +21,7 @@ class OptView(discord.ui.View):
             await self.config.optout.set(optout)
         optin.append(interaction.user.id)
         await self.config.optin.set(optin)
+        self.config_cache.invalidate_global()
         await interaction.response.send_message("You are now opted in bot-wide", ephemeral=True)
 
     @discord.ui.button(label='Opt Out', style=discord.ButtonStyle.grey)
@@ -31,4 +35,5 @@ class OptView(discord.ui.View):
             await self.config.optin.set(optin)
         optout.append(interaction.user.id)
         await self.config.optout.set(optout)
+        self.config_cache.invalidate_global()
         await interaction.response.send_message("You are now opted out bot-wide", ephemeral=True)
\ No newline at end of file
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, Optional
+
+import discord
+from redbot.core.bot import Red
+
+from localaibot.config.constants import (
+    REFERENCE_CACHE_LIMIT,
+    REFERENCE_CACHE_TTL,
+    REFERENCE_MISSING_TTL,
+    REPLY_CHAIN_MAX_DEPTH,
+)
+from localaibot.messages_list.channel_history import ChannelHistory
+from localaibot.utils.cache import Cache
+
+logger = logging.getLogger("red.0x42_cogs.aibot")
+
+_MISSING = object()
+
+
+class FetchBudget:
+    """How many messages one reply may still fetch from Discord to resolve reply chains"""
+
+    def __init__(self, fetches: int):
+        self.remaining = fetches
+
+    def take(self) -> bool:
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+class ReferenceResolver:
+    """
+    Resolves the messages replies point to, fetching from Discord only as a last resort.
+
+    Looks in the reference itself, the channel history buffers, messages fetched before and discord.py's message cache.
+    Deleted messages are remembered for a while, and concurrent fetches of the same message are shared.
+    """
+
+    def __init__(self, bot: Red, channel_history: ChannelHistory):
+        self.bot = bot
+        self.channel_history = channel_history
+        self.fetches = 0
+        self.over_budget = 0
+        # message id -> message, or None if it is known to be gone
+        self._messages: Cache[int, Optional[discord.Message]] = Cache(limit=REFERENCE_CACHE_LIMIT, ttl=REFERENCE_CACHE_TTL)
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    def lookup(self, channel_id: int, message_id: int):
+        """A message without fetching it, None if it is known to be deleted or `_MISSING` if unknown"""
+        cached = self._messages.get(message_id, _MISSING)
+        if cached is not _MISSING:
+            return cached
+        message = self.channel_history.get(channel_id, message_id)
+        if message:
+            return message
+        # discord.py keeps recently seen messages too, but has no public lookup by id
+        get_message = getattr(getattr(self.bot, "_connection", None), "_get_message", None)
+        message = get_message(message_id) if get_message else None
+        return message or _MISSING
+
+    async def resolve(
+        self, reference: Optional[discord.MessageReference], budget: Optional[FetchBudget] = None
+    ) -> Optional[discord.Message]:
+        if not reference or not reference.message_id:
+            return None
+        if isinstance(reference.resolved, discord.Message):
+            return reference.resolved
+        if isinstance(reference.resolved, discord.DeletedReferencedMessage):
+            self._remember_missing(reference.message_id)
+            return None
+
+        message = self.lookup(reference.channel_id, reference.message_id)
+        if message is not _MISSING:
+            return message
+        pending = self._pending.get(reference.message_id)
+        if pending:
+            return await asyncio.shield(pending)
+        if budget and not budget.take():
+            self.over_budget += 1
+            return None
+        return await self._fetch(reference.channel_id, reference.message_id)
+
+    async def prefetch(
+        self,
+        messages: Iterable[discord.Message],
+        budget: Optional[FetchBudget] = None,
+        follow: Callable[[discord.Message], bool] = lambda _: True,
+    ):
+        """
+        Resolve the reply chains of several messages a level at a time, fetching each level concurrently,
+        so walking the chains afterwards only hits the cache. Chains stop at messages `follow` rejects.
+        """
+        frontier = [message for message in messages if message.reference and follow(message)]
+        for _ in range(REPLY_CHAIN_MAX_DEPTH):
+            references = {message.reference.message_id: message.reference for message in frontier if message.reference}
+            if not references:
+                return
+            resolved = await asyncio.gather(*(self.resolve(reference, budget) for reference in references.values()))
+            frontier = [message for message in resolved if message and follow(message)]
+
+    def update(self, message: discord.Message):
+        if message.id in self._messages:
+            self._messages.set(message.id, message, owner=message.author.id)
+
+    def forget(self, message_id: int):
+        """Remember a deleted message as deleted, if it was cached or is being fetched"""
+        # other deletions would only evict the messages the cache is for
+        if message_id in self._messages or message_id in self._pending:
+            self._remember_missing(message_id)
+
+    def forget_author(self, author_id: int):
+        self._messages.invalidate_owner(author_id)
+
+    def _remember_missing(self, message_id: int):
+        self._messages.set(message_id, None, ttl=REFERENCE_MISSING_TTL)
+
+    async def _fetch(self, channel_id: int, message_id: int) -> Optional[discord.Message]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        message = None
+        try:
+            channel = self.bot.get_channel(channel_id)
+            if channel:
+                self.fetches += 1
+                message = await channel.fetch_message(message_id)
+                self._messages.set(message_id, message, owner=message.author.id)
+            else:
+                self._remember_missing(message_id)
+        except (discord.NotFound, discord.Forbidden):
+            self._remember_missing(message_id)
+        except Exception:
+            # may be temporary, so not remembered
+            logger.debug(f"Failed to fetch referenced message {message_id}", exc_info=True)
+        finally:
+            self._pending.pop(message_id, None)
+            future.set_result(message)
+        return message
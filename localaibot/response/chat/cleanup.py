@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+import discord
+
+from localaibot.config.constants import CLEANUP_PROGRAM_CACHE_LIMIT, REGEX_RUN_TIMEOUT
+from localaibot.types.abc import MixinMeta
+from localaibot.utils.cache import Cache
+from localaibot.utils.workers import WORKERS
+
+logger = logging.getLogger("red.0x42_cogs.aibot")
+
+
+@dataclass
+class PatternStats:
+    matches: int = 0
+    errors: int = 0
+
+
+class CleanupProgram:
+    """
+    A guild's removelist regexes, compiled once and applied to a response in a single worker job.
+
+    `{botname}` and `{authorname}` are substituted when compiling, with all recent authors folded into one alternation group.
+    Compiled variants are cached per bot name / set of authors.
+
+    A job that times out keeps its worker thread busy until the regex gives up, so it is never retried,
+    the response is sent uncleaned instead.
+    """
+
+    def __init__(self, templates: List[str]):
+        self.templates = list(templates)
+        self.stats = [PatternStats() for _ in self.templates]
+        self.timeouts = 0
+        self._compiled: Cache[Tuple[str, Tuple[str, ...]], List[Tuple[int, Optional[re.Pattern]]]] = Cache(
+            limit=CLEANUP_PROGRAM_CACHE_LIMIT
+        )
+
+    def compile(self, botname: str, authors: Iterable[str]) -> List[Tuple[int, re.Pattern]]:
+        authors = tuple(sorted(set(authors)))
+        key = (botname, authors)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = [(i, self._compile_one(i, botname, authors)) for i in range(len(self.templates))]
+            self._compiled[key] = compiled
+        return [(i, pattern) for i, pattern in compiled if pattern is not None]
+
+    def _compile_one(self, index: int, botname: str, authors: Tuple[str, ...]) -> Optional[re.Pattern]:
+        template = self.templates[index]
+        if "{authorname}" in template:
+            if not authors:
+                return None
+            template = template.replace("{authorname}", "(?:" + "|".join(re.escape(a) for a in authors) + ")")
+        template = template.replace("{botname}", re.escape(botname))
+        try:
+            return re.compile(template)
+        except re.error:
+            self.stats[index].errors += 1
+            logger.warning(f"Invalid regex pattern in removelist: {self.templates[index]}", exc_info=True)
+            return None
+
+    async def run(self, text: str, botname: str, authors: Iterable[str]) -> str:
+        compiled = self.compile(botname, authors)
+        text = text.strip(" \n")
+        if not compiled:
+            return text
+
+        patterns = [pattern for _, pattern in compiled]
+        try:
+            cleaned, matches = await WORKERS.run(apply_patterns, patterns, text, timeout=REGEX_RUN_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning("Timeout applying removelist regexes, sending the response uncleaned")
+            return text
+
+        for (i, _), count in zip(compiled, matches):
+            self.stats[i].matches += count
+        return cleaned
+
+
+async def get_cleanup_program(cog: MixinMeta, guild: discord.Guild) -> CleanupProgram:
+    program = cog.cleanup_programs.get(guild.id)
+    if program is None:
+        templates = (await cog.config_cache.guild(guild))["removelist_regexes"]
+        program = cog.cleanup_programs[guild.id] = CleanupProgram(templates)
+    return program
+
+
+# Runs in the worker pool, so must stay a plain module-level function
+def apply_patterns(patterns: List[re.Pattern], text: str) -> Tuple[str, List[int]]:
+    matches = []
+    for pattern in patterns:
+        text, count = pattern.subn("", text)
+        text = text.strip(" \n")
+        matches.append(count)
+    return text, matches
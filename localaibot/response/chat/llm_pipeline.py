@@ -1,11 +1,15 @@
+import asyncio
 import json
 import logging
-from dataclasses import asdict
+import time
+from dataclasses import asdict, dataclass
 from typing import Any, Dict, List, Optional, Tuple, Union
 
 import httpx
 import openai
+from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletion, ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
 from openai.types.completion import Completion
 from redbot.core import Config, commands
 
@@ -13,35 +17,78 @@ from localaibot.config.models import (
     UNSUPPORTED_LOGIT_BIAS_MODELS,
     VISION_SUPPORTED_MODELS,
 )
+from localaibot.core.endpoint_pool import FAILOVER_ERRORS, Endpoint, EndpointPool
+from localaibot.core.rate_limiter import RateLimitExceeded
 from localaibot.functions.tool_call import ToolCall
 from localaibot.functions.types import ToolCallSchema
 from localaibot.messages_list.messages import MessagesList
+from localaibot.response.chat.stream import ResponseStreamer
 from localaibot.types.abc import MixinMeta
+from localaibot.utils.metrics import STAGE_LLM, STAGE_QUEUE
+from localaibot.utils.scheduler import LANE_BACKGROUND, LANE_INTERACTIVE, LANE_NORMAL, SchedulerDropped
+from localaibot.utils.tokens import count_tokens, truncate_to_tokens
 from localaibot.utils.utilities import get_enabled_tools
 
 logger = logging.getLogger("red.0x42_cogs.aibot")
 
 
+@dataclass
+class ToolStats:
+    calls: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+
+    @property
+    def average_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+    def record(self, elapsed: float):
+        self.calls += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+
 class LLMPipeline:
-    def __init__(self, cog: MixinMeta, ctx: commands.Context, messages: MessagesList):
+    def __init__(
+        self,
+        cog: MixinMeta,
+        ctx: commands.Context,
+        messages: MessagesList,
+        streamer: Optional[ResponseStreamer] = None,
+        lane: Optional[int] = None,
+    ):
         self.ctx: commands.Context = ctx
         self.config: Config = cog.config
+        self.config_cache = cog.config_cache
         self.bot = cog.bot
         self.msg_list = messages
         self.model = messages.model
         self.can_reply = messages.can_reply
         self.messages = messages.get_json()
         self.openai_client = cog.openai_client
+        self.tool_stats = cog.tool_stats
         self.enabled_tools: List[ToolCall] = []
         self.available_tools_schemas: List[ToolCallSchema] = []
         self.completion: Optional[str] = None
+        self.tool_rounds = 0
+        self.tool_result_tokens = 0
+        self.streamer = streamer
+        self.scheduler = cog.scheduler
+        self.rate_limiter = cog.rate_limiter
+        self.endpoint_pools = cog.endpoint_pools
+        self.metrics = cog.metrics
+        self.pool: Optional[EndpointPool] = None
+        self.lane = get_lane(ctx) if lane is None else lane
 
     async def get_custom_parameters(self) -> Dict[str, Any]:
-        custom_parameters = await self.config.guild(self.ctx.guild).parameters()
+        settings = await self.config_cache.guild(self.ctx.guild)
+        custom_parameters = settings["parameters"]
         kwargs = json.loads(custom_parameters) if custom_parameters else {}
 
         if "logit_bias" not in kwargs:
-            weights = await self.config.guild(self.ctx.guild).weights()
+            weights = settings["weights"]
             weights_dict = json.loads(weights or "{}")
             if weights_dict:
                 kwargs["logit_bias"] = weights_dict
@@ -53,38 +100,115 @@ class LLMPipeline:
         return kwargs
 
     async def setup_tools(self):
-        if not (await self.config.guild(self.ctx.guild).function_calling()):
+        if not (await self.config_cache.guild(self.ctx.guild))["function_calling"]:
             return
         self.enabled_tools = await get_enabled_tools(self.config, self.ctx)
         self.available_tools_schemas = [tool.schema for tool in self.enabled_tools]
 
     async def call_client(self, kwargs: Dict[str, Any]) -> Union[str, Tuple[str, List[ChatCompletionMessageToolCall]]]:
-        if "gpt-3.5-turbo-instruct" in self.model:
+        if not self.pool:
+            await self.rate_limiter.acquire(self.msg_list.tokens)
+            return await self.request(self.openai_client, self.model, kwargs)
+
+        tried = set()
+        while True:
+            endpoint: Endpoint = self.pool.select(exclude=tried)
+            tried.add(endpoint)
+            try:
+                await endpoint.rate_limiter.acquire(self.msg_list.tokens)
+                async with endpoint.track():
+                    return await self.request(endpoint.client, endpoint.model_for(self.model), kwargs)
+            except (*FAILOVER_ERRORS, openai.RateLimitError, RateLimitExceeded):
+                # nothing to fail over to, or part of the response was already shown
+                if len(tried) == len(self.pool.endpoints) or (self.streamer and self.streamer.chunks):
+                    raise
+                logger.warning(f"Request to {endpoint.url} failed in {self.ctx.guild.name}, trying another endpoint")
+
+    async def request(
+        self, client: AsyncOpenAI, model: str, kwargs: Dict[str, Any]
+    ) -> Union[str, Tuple[str, List[ChatCompletionMessageToolCall]]]:
+        if "gpt-3.5-turbo-instruct" in model:
             prompt = "\n".join(message["content"] for message in self.messages)
-            response: Completion = await self.openai_client.completions.create(
-                model=self.model, prompt=prompt, **kwargs
+            response: Completion = await client.completions.create(
+                model=model, prompt=prompt, **kwargs
             )
             return response.choices[0].message.content
+        elif self.streamer:
+            return await self.stream_client(client, model, kwargs)
         else:
-            response: ChatCompletion = await self.openai_client.chat.completions.create(
-                model=self.model, messages=self.msg_list.get_json(), **kwargs
+            response: ChatCompletion = await client.chat.completions.create(
+                model=model, messages=self.msg_list.get_json(), **kwargs
             )
 
+            self.log_usage(response.usage)
             tools_calls: List[ChatCompletionMessageToolCall] = response.choices[0].message.tool_calls or []
 
             return response.choices[0].message.content, tools_calls
 
+    async def stream_client(
+        self, client: AsyncOpenAI, model: str, kwargs: Dict[str, Any]
+    ) -> Tuple[Optional[str], List[ChatCompletionMessageToolCall]]:
+        if self.msg_list.settings["prompt_cache_mode"] and "stream_options" not in kwargs:
+            # usage, including cached prompt tokens, is only sent on the last chunk when asked for
+            kwargs = {**kwargs, "stream_options": {"include_usage": True}}
+        stream = await client.chat.completions.create(
+            model=model, messages=self.msg_list.get_json(), stream=True, **kwargs
+        )
+
+        content: List[str] = []
+        calls: Dict[int, Dict[str, str]] = {}
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                self.log_usage(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content.append(delta.content)
+                self.streamer.feed(delta.content)
+            for call in delta.tool_calls or []:
+                partial = calls.setdefault(call.index, {"id": "", "name": "", "arguments": ""})
+                partial["id"] = call.id or partial["id"]
+                if call.function:
+                    partial["name"] += call.function.name or ""
+                    partial["arguments"] += call.function.arguments or ""
+
+        tool_calls = [
+            ChatCompletionMessageToolCall(
+                id=call["id"], type="function", function=Function(name=call["name"], arguments=call["arguments"])
+            )
+            for _, call in sorted(calls.items())
+        ]
+        return "".join(content) or None, tool_calls
+
+    def log_usage(self, usage):
+        if not usage:
+            return
+        self.metrics.record_usage(self.ctx.guild.id, self.model, usage)
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        logger.debug(
+            f"Used {usage.prompt_tokens} prompt tokens ({cached} cached) and {usage.completion_tokens} completion tokens in {self.ctx.guild.name}"
+        )
+
     async def create_completion(self) -> Optional[str]:
         kwargs = await self.get_custom_parameters()
         await self.setup_tools()
 
+        settings = await self.config_cache.guild(self.ctx.guild)
+        max_rounds = settings["function_calling_max_rounds"]
+
         while not self.completion:
             if self.available_tools_schemas:
                 kwargs["tools"] = [asdict(schema) for schema in self.available_tools_schemas]
+                if self.tool_rounds >= max_rounds:
+                    # out of tool rounds, the model has to answer with what it has
+                    kwargs["tool_choice"] = "none"
 
             self.completion, tool_calls = await self.call_client(kwargs)
 
-            if tool_calls and not self.completion:
+            if tool_calls and not self.completion and self.tool_rounds < max_rounds:
+                self.tool_rounds += 1
                 await self.handle_tool_calls(tool_calls)
             else:
                 break
@@ -93,14 +217,52 @@ class LLMPipeline:
         return self.completion
 
     async def handle_tool_calls(self, tool_calls: List[ChatCompletionMessageToolCall]):
+        settings = await self.config_cache.guild(self.ctx.guild)
+        semaphore = asyncio.Semaphore(max(1, settings["function_calling_concurrency"]))
+        timeout = settings["function_calling_timeout"]
+
+        async def limited(tool_call: ChatCompletionMessageToolCall) -> Optional[str]:
+            async with semaphore:
+                return await self.run_tool_call(tool_call, timeout)
+
+        results = await asyncio.gather(*(limited(tool_call) for tool_call in tool_calls))
+
         await self.msg_list.add_assistant(index=len(self.msg_list) + 1, tool_calls=tool_calls)
-        for tool_call in tool_calls:
-            function = tool_call.function
-            arguments = json.loads(function.arguments)
-            result = await self.run_tool(function.name, arguments)
+        for tool_call, result in zip(tool_calls, results):
             if result:
+                result = self.fit_tool_result(result, settings["function_calling_result_tokens"])
                 await self.msg_list.add_tool_result(result, tool_call.id, index=len(self.msg_list) + 1)
 
+    def fit_tool_result(self, result: str, max_tokens: int) -> str:
+        """Truncate a tool result to what is left of the request's tool result and prompt token budgets"""
+        encoding = self.msg_list.encoding
+        budget = min(max_tokens - self.tool_result_tokens, self.msg_list.token_limit - self.msg_list.tokens)
+        tokens = count_tokens(result, encoding)
+        if tokens > budget:
+            logger.debug(f"Truncating tool result from {tokens} to {budget} tokens in {self.ctx.guild.name}")
+            result = truncate_to_tokens(result, encoding, budget) + "\n[truncated]"
+            tokens = budget
+        self.tool_result_tokens += max(0, tokens)
+        return result
+
+    async def run_tool_call(self, tool_call: ChatCompletionMessageToolCall, timeout: float) -> Optional[str]:
+        function = tool_call.function
+        stats = self.tool_stats[function.name]
+        start = time.perf_counter()
+        try:
+            arguments = json.loads(function.arguments or "{}")
+            return await asyncio.wait_for(self.run_tool(function.name, arguments), timeout)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            logger.warning(f'Tool call "{function.name}" timed out after {timeout}s in {self.ctx.guild.name}')
+            return f"The {function.name} tool timed out."
+        except Exception:
+            stats.failures += 1
+            logger.exception(f'Tool call "{function.name}" failed in {self.ctx.guild.name}')
+            return f"The {function.name} tool failed."
+        finally:
+            stats.record(time.perf_counter() - start)
+
     async def run_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Optional[str]:
         for tool in self.enabled_tools:
             if tool.function_name == tool_name:
@@ -114,13 +276,34 @@ class LLMPipeline:
 
     async def run(self) -> Optional[str]:
         try:
-            return await self.create_completion()
+            self.pool = self.endpoint_pools.get((await self.config_cache.guild(self.ctx.guild))["endpoint_pool"])
+            endpoint = f"pool:{self.pool.name}" if self.pool else str(self.openai_client.base_url)
+            queued = time.perf_counter()
+            async with self.scheduler.slot(self.ctx.guild.id, self.lane, endpoint):
+                self.metrics.observe(STAGE_QUEUE, time.perf_counter() - queued, self.ctx.guild.id, self.model)
+                with self.metrics.span(STAGE_LLM, self.ctx.guild.id, self.model):
+                    return await self.create_completion()
+        except SchedulerDropped:
+            logger.debug(f"Dropped request in {self.ctx.guild.name}, queued for too long")
         except httpx.ReadTimeout:
             logger.error("Failed request to LLM endpoint. Timed out.")
             await self.ctx.react_quietly("💤", message="`aibot` request timed out")
-        except openai.RateLimitError:
+        except (openai.RateLimitError, RateLimitExceeded):
             await self.ctx.react_quietly("💤", message="`aibot` request ratelimited")
         except Exception:
             logger.exception("Failed API request(s) to LLM endpoint")
             await self.ctx.react_quietly("⚠️", message="`aibot` request failed")
-        return None
\ No newline at end of file
+        return None
+
+
+def get_lane(ctx: commands.Context) -> int:
+    """
+    Slash commands and replies the bot is forced to make go ahead of chance-based ones.
+    Contexts no message triggered (random messages) go last.
+    """
+    if ctx.interaction:
+        return LANE_INTERACTIVE
+    decision = getattr(ctx, "trigger_decision", None)
+    if not decision:
+        return LANE_BACKGROUND
+    return LANE_INTERACTIVE if decision.forced else LANE_NORMAL
@@ -1,94 +1,95 @@
-import asyncio
 import logging
 import random
-import re
 from datetime import datetime, timezone
+from functools import partial
 
+import discord
 from discord import AllowedMentions
-from redbot.core import Config, commands
+from redbot.core import commands
 
-from localaibot.config.constants import REGEX_RUN_TIMEOUT
 from localaibot.messages_list.messages import MessagesList
+from localaibot.response.chat.cleanup import get_cleanup_program
 from localaibot.response.chat.llm_pipeline import LLMPipeline
+from localaibot.response.chat.stream import ResponseStreamer
 from localaibot.types.abc import MixinMeta
-from localaibot.utils.utilities import to_thread
+from localaibot.utils.metrics import STAGE_CLEANUP, STAGE_SEND
 
 logger = logging.getLogger("red.0x42_cogs.aibot")
 
-# Use to_thread to compile & apply a regex pattern
-@to_thread(timeout=REGEX_RUN_TIMEOUT)
-def compile_and_apply(pattern_str: str, text: str) -> str:
-    pattern = re.compile(pattern_str)
-    return pattern.sub('', text).strip(' \n')
-
-async def remove_patterns_from_response(ctx: commands.Context, config: Config, response: str) -> str:
-    # Get patterns from config and replace "{botname}".
-    patterns = await config.guild(ctx.guild).removelist_regexes()
+async def remove_patterns_from_response(cog: MixinMeta, ctx: commands.Context, response: str) -> str:
+    program = await get_cleanup_program(cog, ctx.guild)
     botname = ctx.message.guild.me.nick or ctx.bot.user.display_name
-    patterns = [p.replace(r'{botname}', botname) for p in patterns]
-
-    # Expand patterns that have "{authorname}" based on recent authors.
+    # "{authorname}" is matched against recent authors
     authors = {
-        msg.author.display_name async for msg in ctx.channel.history(limit=10)
+        msg.author.display_name for msg in await cog.channel_history.history(ctx.channel, limit=10)
         if msg.author != ctx.guild.me
     }
-    expanded_patterns = []
-    for pattern in patterns:
-        if '{authorname}' in pattern:
-            for author in authors:
-                expanded_patterns.append(pattern.replace(r'{authorname}', author))
-        else:
-            expanded_patterns.append(pattern)
+    return await program.run(response, botname, authors)
 
-    # Apply each pattern sequentially.
-    cleaned = response.strip(' \n')
-    for pattern in expanded_patterns:
-        try:
-            cleaned = await compile_and_apply(pattern, cleaned)
-        except asyncio.TimeoutError:
-            logger.warning(f"Timeout applying regex pattern: {pattern}")
-        except Exception:
-            logger.warning(f"Error applying regex pattern: {pattern}", exc_info=True)
-    return cleaned
-
-async def should_reply(ctx: commands.Context) -> bool:
+async def should_reply(cog: MixinMeta, ctx: commands.Context) -> bool:
     if ctx.interaction:
         return False
 
-    try:
-        await ctx.fetch_message(ctx.message.id)
-    except Exception:
+    exists = cog.channel_history.contains(ctx.channel, ctx.message.id)
+    if exists is None:
+        try:
+            await ctx.fetch_message(ctx.message.id)
+        except Exception:
+            return False
+    elif not exists:
         return False
 
     if (datetime.now(timezone.utc) - ctx.message.created_at).total_seconds() > 8 or random.random() < 0.25:
         return True
 
-    async for last_msg in ctx.message.channel.history(limit=1):
+    for last_msg in await cog.channel_history.history(ctx.message.channel, limit=1):
         if last_msg.author == ctx.message.guild.me:
             return True
     return False
 
-async def send_response(ctx: commands.Context, response: str, can_reply: bool) -> bool:
-    allowed = AllowedMentions(everyone=False, roles=False, users=[ctx.message.author])
+def get_allowed_mentions(ctx: commands.Context) -> AllowedMentions:
+    return AllowedMentions(everyone=False, roles=False, users=[ctx.message.author])
+
+async def send_response(cog: MixinMeta, ctx: commands.Context, response: str, can_reply: bool) -> bool:
+    allowed = get_allowed_mentions(ctx)
     if len(response) >= 2000:
         for i in range(0, len(response), 2000):
             await ctx.send(response[i:i + 2000], allowed_mentions=allowed)
-    elif can_reply and await should_reply(ctx):
-        await ctx.message.reply(response, mention_author=False, allowed_mentions=allowed)
-    elif ctx.interaction:
-        await ctx.interaction.followup.send(response, allowed_mentions=allowed)
     else:
-        await ctx.send(response, allowed_mentions=allowed)
+        await send_first_message(cog, ctx, response, can_reply)
     return True
 
+async def send_first_message(cog: MixinMeta, ctx: commands.Context, response: str, can_reply: bool) -> discord.Message:
+    allowed = get_allowed_mentions(ctx)
+    if can_reply and await should_reply(cog, ctx):
+        return await ctx.message.reply(response, mention_author=False, allowed_mentions=allowed)
+    elif ctx.interaction:
+        return await ctx.interaction.followup.send(response, allowed_mentions=allowed, wait=True)
+    else:
+        return await ctx.send(response, allowed_mentions=allowed)
+
 async def create_chat_response(cog: MixinMeta, ctx: commands.Context, messages_list: MessagesList) -> bool:
-    pipeline = LLMPipeline(cog, ctx, messages=messages_list)
+    streamer = None
+    if (await cog.config_cache.guild(ctx.guild))["stream_responses"]:
+        streamer = ResponseStreamer(
+            ctx,
+            cleanup=partial(remove_patterns_from_response, cog, ctx),
+            send=partial(send_first_message, cog, ctx, can_reply=messages_list.can_reply),
+            allowed_mentions=get_allowed_mentions(ctx),
+        )
+
+    pipeline = LLMPipeline(cog, ctx, messages=messages_list, streamer=streamer)
     response = await pipeline.run()
-    if not response:
-        return False
+    cleaned_response = None
+    if response:
+        # streamed flushes clean up too, only the final cleanup of the reply is measured
+        with cog.metrics.span(STAGE_CLEANUP, ctx.guild.id):
+            cleaned_response = await remove_patterns_from_response(cog, ctx, response)
 
-    cleaned_response = await remove_patterns_from_response(ctx, cog.config, response)
-    if not cleaned_response:
+    if not streamer and not cleaned_response:
         return False
 
-    return await send_response(ctx, cleaned_response, messages_list.can_reply)
\ No newline at end of file
+    with cog.metrics.span(STAGE_SEND, ctx.guild.id, messages_list.model):
+        if streamer:
+            return await streamer.finish(cleaned_response)
+        return await send_response(cog, ctx, cleaned_response, messages_list.can_reply)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Awaitable, Callable, List, Optional
+
+import discord
+from redbot.core import commands
+
+from localaibot.config.constants import DISCORD_MESSAGE_LIMIT, STREAM_EDIT_INTERVAL, STREAM_FIRST_CHUNKS
+
+logger = logging.getLogger("red.0x42_cogs.aibot")
+
+SENTENCE_END = re.compile(r"\S[.!?\n]\s*$")
+
+
+class ResponseStreamer:
+    """
+    Delivers a streamed completion progressively: a first message once enough text has arrived,
+    then throttled edits, rolling over into follow-up messages at Discord's character limit.
+
+    Visible text is always passed through `cleanup` (the removelist) first.
+    """
+
+    def __init__(
+        self,
+        ctx: commands.Context,
+        cleanup: Callable[[str], Awaitable[str]],
+        send: Callable[[str], Awaitable[discord.Message]],
+        allowed_mentions: discord.AllowedMentions,
+    ):
+        self.ctx = ctx
+        self.cleanup = cleanup
+        self.send = send
+        self.allowed_mentions = allowed_mentions
+        self.text = ""
+        self.chunks = 0
+        self.messages: List[discord.Message] = []
+        self.contents: List[str] = []
+        self.started = time.perf_counter()
+        self.first_visible: Optional[float] = None
+        self._last_edit = 0.0
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def feed(self, delta: str):
+        """Called for every content delta of the stream, never blocks it"""
+        self.text += delta
+        self.chunks += 1
+        if self._flush_task and not self._flush_task.done():
+            return
+        if not self.messages:
+            if self.chunks < STREAM_FIRST_CHUNKS and not SENTENCE_END.search(self.text):
+                return
+        elif time.perf_counter() - self._last_edit < STREAM_EDIT_INTERVAL:
+            return
+        self._flush_task = asyncio.create_task(self._flush())
+
+    async def finish(self, text: Optional[str]) -> bool:
+        """Final edit with the cleaned up completion, removes anything sent if there is nothing left to send"""
+        if self._flush_task:
+            await self._flush_task
+        await self._render(text or "")
+        return bool(text)
+
+    async def _flush(self):
+        try:
+            text = await self.cleanup(self.text)
+            if text:
+                await self._render(text)
+        except Exception:
+            logger.debug(f"Failed to update streamed response in {self.ctx.guild.name}", exc_info=True)
+
+    async def _render(self, text: str):
+        chunks = [text[i:i + DISCORD_MESSAGE_LIMIT] for i in range(0, len(text), DISCORD_MESSAGE_LIMIT)]
+        for i, chunk in enumerate(chunks):
+            if i < len(self.messages):
+                if self.contents[i] != chunk:
+                    await self.messages[i].edit(content=chunk, allowed_mentions=self.allowed_mentions)
+                    self.contents[i] = chunk
+                continue
+            if i == 0:
+                message = await self.send(chunk)
+                self.first_visible = time.perf_counter() - self.started
+                logger.debug(f"Streamed response visible after {self.first_visible:.2f}s in {self.ctx.guild.name}")
+            else:
+                message = await self.ctx.send(chunk, allowed_mentions=self.allowed_mentions)
+            self.messages.append(message)
+            self.contents.append(chunk)
+
+        for message in self.messages[len(chunks):]:
+            await message.delete()
+        del self.messages[len(chunks):]
+        del self.contents[len(chunks):]
+        self._last_edit = time.perf_counter()
@@ -218,7 +218,7 @@ class Settings(
             return await ctx.send("Channel already in whitelist")
         new_whitelist.append(channel.id)
         await self.config.guild(ctx.guild).channels_whitelist.set(new_whitelist)
-        self.channels_whitelist[ctx.guild.id] = new_whitelist
+        self.channels_whitelist[ctx.guild.id] = set(new_whitelist)
         embed = discord.Embed(
             title="The server whitelist is now:", color=await ctx.embed_color()
         )
@@ -245,7 +245,8 @@ class Settings(
             return await ctx.send("Channel not in whitelist")
         new_whitelist.remove(channel.id)
         await self.config.guild(ctx.guild).channels_whitelist.set(new_whitelist)
-        self.channels_whitelist[ctx.guild.id] = new_whitelist
+        self.channels_whitelist[ctx.guild.id] = set(new_whitelist)
+        self.channel_history.discard(channel.id)
         embed = discord.Embed(
             title="The server whitelist is now:", color=await ctx.embed_color()
         )
@@ -336,6 +337,7 @@ class Settings(
             await self.config.optin.set(optin)
         optout.append(ctx.author.id)
         await self.config.optout.set(optout)
+        await self.summarizer.forget_user(ctx.author.id)
         await ctx.send("You are now opted out bot-wide")
 
     @aibot.command(name="optinbydefault", alias=["optindefault"])
@@ -1,4 +1,6 @@
 
+from typing import Optional
+
 import discord
 from redbot.core import checks, commands
 
@@ -55,6 +57,67 @@ class FunctionCallingSettings(MixinMeta):
         )
         await ctx.send(embed=embed)
 
+    @functions.command(name="limits")
+    async def set_limits(
+        self,
+        ctx: commands.Context,
+        rounds: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        timeout: Optional[int] = None,
+        result_tokens: Optional[int] = None,
+    ):
+        """ Set limits on function calls made for a single response
+
+            Shows the current limits if no arguments are given.
+
+            **Arguments**
+            - `rounds` how many times the LLM may call functions before it has to respond
+            - `concurrency` how many functions may run at the same time
+            - `timeout` seconds before a function call is abandoned
+            - `result_tokens` total tokens of function results, longer results are truncated
+        """
+        values = {
+            "function_calling_max_rounds": rounds,
+            "function_calling_concurrency": concurrency,
+            "function_calling_timeout": timeout,
+            "function_calling_result_tokens": result_tokens,
+        }
+        if any(value is not None and value < (0 if key.endswith("rounds") else 1) for key, value in values.items()):
+            return await ctx.send(":warning: Invalid limit, must be a positive number")
+
+        for key, value in values.items():
+            if value is not None:
+                await self.config.guild(ctx.guild).set_raw(key, value=value)
+
+        settings = await self.config.guild(ctx.guild).all()
+        embed = discord.Embed(title="Function calling limits", color=await ctx.embed_color())
+        embed.add_field(name="Rounds", value=settings["function_calling_max_rounds"])
+        embed.add_field(name="Concurrency", value=settings["function_calling_concurrency"])
+        embed.add_field(name="Timeout", value=f"{settings['function_calling_timeout']}s")
+        embed.add_field(name="Result tokens", value=settings["function_calling_result_tokens"])
+        await ctx.send(embed=embed)
+
+    @functions.command(name="stats")
+    async def show_stats(self, ctx: commands.Context):
+        """ Show latency of function calls since the cog was loaded
+
+            (Across all servers)
+        """
+        if not self.tool_stats:
+            return await ctx.send("No functions have been called yet.")
+
+        embed = discord.Embed(title="Function calls", color=await ctx.embed_color())
+        for name, stats in sorted(self.tool_stats.items()):
+            embed.add_field(
+                name=name,
+                value=(
+                    f"{stats.calls} calls, {stats.failures} failed, {stats.timeouts} timed out\n"
+                    f"avg {stats.average_time:.2f}s, max {stats.max_time:.2f}s"
+                ),
+                inline=False,
+            )
+        await ctx.send(embed=embed)
+
     async def toggle_function_helper(self, ctx: commands.Context, tool_names: list, embed_title: str):
         enabled_tools: list = await self.config.guild(ctx.guild).function_calling_functions()
 
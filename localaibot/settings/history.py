@@ -62,3 +62,50 @@ class HistorySettings(MixinMeta):
             description=f"{new_value}",
             color=await ctx.embed_color())
         return await ctx.send(embed=embed)
+
+    @history.command(name="summary")
+    async def history_summary(self, ctx: commands.Context):
+        """ Toggle rolling summaries of older history
+
+            Messages that fall out of the backread window are summarized in the background, per channel,
+            and the summary is sent along with the recent messages.
+            Keeps long conversations coherent without sending their whole history every time.
+        """
+        current_value = not await self.config.guild(ctx.guild).history_summary()
+        await self.config.guild(ctx.guild).history_summary.set(current_value)
+        embed = discord.Embed(
+            title="Rolling history summaries on this server are now:",
+            description=f"{current_value}",
+            color=await ctx.embed_color())
+        return await ctx.send(embed=embed)
+
+    @history.command(name="summarymodel")
+    async def history_summary_model(self, ctx: commands.Context, model: Optional[str]):
+        """ Set the model used to summarize older history
+
+            A cheaper model than the one used for replies is usually fine. (Leave empty to use the server's model)
+        """
+        await self.config.guild(ctx.guild).history_summary_model.set(model)
+        embed = discord.Embed(
+            title="The model used for history summaries on this server is now:",
+            description=f"{model or 'Same as the server'}",
+            color=await ctx.embed_color())
+        return await ctx.send(embed=embed)
+
+    @history.command(name="summarytokens")
+    async def history_summary_tokens(self, ctx: commands.Context, new_value: int):
+        """ Set the max length (tokens) of a channel's history summary """
+        if new_value < 50:
+            return await ctx.send(":warning: Please enter at least 50 tokens.")
+        await self.config.guild(ctx.guild).history_summary_tokens.set(new_value)
+        embed = discord.Embed(
+            title="The max length of history summaries on this server is now:",
+            description=f"{new_value} tokens",
+            color=await ctx.embed_color())
+        return await ctx.send(embed=embed)
+
+    @history.command(name="summaryreset")
+    async def history_summary_reset(self, ctx: commands.Context):
+        """ Forget the history summary of the current channel """
+        await self.summarizer.reset(ctx.channel.id)
+        return await ctx.react_quietly("✅")
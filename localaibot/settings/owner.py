@@ -1,6 +1,9 @@
 import asyncio
+import io
 import json
 import logging
+from collections import Counter
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
 
@@ -10,10 +13,14 @@ from redbot.core.data_manager import cog_data_path
 from redbot.core.utils.menus import start_adding_reactions
 from redbot.core.utils.predicates import ReactionPredicate
 
+from localaibot.config.constants import PROFILE_MAX_MESSAGES, PROFILE_MAX_SECONDS
 from localaibot.config.defaults import DEFAULT_LLM_MODEL
-from localaibot.core.openai_utils import setup_openai_client
+from localaibot.core.openai_utils import TRANSPORT_STATS, pool_stats, replace_openai_client
 from localaibot.settings.utilities import get_tokens, truncate_prompt
 from localaibot.types.abc import MixinMeta
+from localaibot.utils.metrics import STAGE_LLM, STAGES
+from localaibot.utils.scheduler import LANE_NAMES
+from localaibot.utils.workers import WORKER_TYPES, WORKERS
 from localaibot.utils.utilities import (
     is_using_openai_endpoint,
     is_using_openrouter_endpoint,
@@ -95,7 +102,7 @@ class OwnerSettings(MixinMeta):
 
         await ctx.message.add_reaction("🔄")
 
-        self.openai_client = await setup_openai_client(self.bot, self.config)
+        await replace_openai_client(self)
 
         # test the endpoint works if not rollback
         try:
@@ -169,13 +176,14 @@ class OwnerSettings(MixinMeta):
 
     @aibotowner.command()
     async def timeout(self, ctx: commands.Context, seconds: int):
-        """ Sets the request timeout to the OpenAI endpoint """
+        """ Sets the request (read) timeout to the OpenAI endpoint """
 
         if seconds < 1:
             return await ctx.send(":warning: Please enter a positive integer.")
 
         await self.config.openai_endpoint_request_timeout.set(seconds)
-        await self.initialize_openai_client()
+        await replace_openai_client(self)
+        await self.endpoint_pools.load()
 
         embed = discord.Embed(
             title="The request timeout is now:",
@@ -184,6 +192,435 @@ class OwnerSettings(MixinMeta):
         )
         return await ctx.send(embed=embed)
 
+    @aibotowner.group(name="pool", invoke_without_command=True)
+    async def pool(self, ctx: commands.Context):
+        """ Shows the endpoint pools and the health of their endpoints
+
+            Servers pinned to a pool spread their requests across its endpoints instead of using the `endpoint`,
+            failing over to another endpoint on timeouts or server errors.
+        """
+        pools = await self.config.endpoint_pools()
+        embed = discord.Embed(title="Endpoint pools", color=await ctx.embed_color())
+        if not pools:
+            embed.description = f"No pools set up yet, add an endpoint to one using `{ctx.clean_prefix}aibotowner pool add`."
+            return await ctx.send(embed=embed)
+
+        pinned = Counter(
+            data["endpoint_pool"] for data in (await self.config.all_guilds()).values() if data.get("endpoint_pool")
+        )
+        for name, endpoints in pools.items():
+            loaded = self.endpoint_pools.get(name)
+            states = {endpoint.url: endpoint for endpoint in loaded.endpoints} if loaded else {}
+            lines = []
+            for data in endpoints:
+                state = states.get(data["url"])
+                line = f"`{data['url']}` weight `{data.get('weight', 1.0)}`"
+                if state:
+                    latency = f"{state.latency:.2f}s" if state.latency is not None else "n/a"
+                    line += (
+                        f"\n{'✅' if state.healthy else '❌'} `{state.outstanding}` in flight, `{latency}` latency, "
+                        f"`{state.requests}` requests, `{state.errors}` errors"
+                    )
+                    if blocked_until := state.rate_limiter.blocked():
+                        line += f"\n💤 ratelimited until `{blocked_until.strftime('%Y-%m-%d %H:%M:%S')}`"
+                for model, endpoint_model in data.get("models", {}).items():
+                    line += f"\n`{model}` → `{endpoint_model}`"
+                lines.append(line)
+            embed.add_field(name=f"{name} ({pinned[name]} servers)", value="\n".join(lines)[:1024], inline=False)
+        return await ctx.send(embed=embed)
+
+    @pool.command(name="add")
+    async def pool_add(self, ctx: commands.Context, name: str, url: str, weight: float = 1.0):
+        """ Adds an endpoint (must be OpenAI API compatible) to a pool, creating the pool if needed
+
+            **Arguments**
+                - `name` Name of the pool
+                - `url` The endpoint's url
+                - `weight` Share of requests relative to the pool's other endpoints
+        """
+        if weight <= 0:
+            return await ctx.send(":warning: Please enter a positive weight.")
+        async with self.config.endpoint_pools() as pools:
+            endpoints = pools.setdefault(name, [])
+            endpoints[:] = [data for data in endpoints if data["url"] != url]
+            endpoints.append({"url": url, "weight": weight, "models": {}})
+        await self.endpoint_pools.load()
+
+        loaded = self.endpoint_pools.get(name)
+        endpoint = next((e for e in loaded.endpoints if e.url == url), None) if loaded else None
+        if not endpoint or not await self.endpoint_pools.check(endpoint):
+            return await ctx.send(f":warning: Added `{url}` to `{name}`, but it isn't responding. Please check logs for more information.")
+        await ctx.tick()
+
+    @pool.command(name="remove")
+    async def pool_remove(self, ctx: commands.Context, name: str, url: str):
+        """ Removes an endpoint from a pool, removing the pool once it's empty """
+        async with self.config.endpoint_pools() as pools:
+            if not any(data["url"] == url for data in pools.get(name, [])):
+                return await ctx.send(f":warning: `{url}` is not in pool `{name}`.")
+            pools[name] = [data for data in pools[name] if data["url"] != url]
+            if not pools[name]:
+                del pools[name]
+        await self.endpoint_pools.load()
+        await ctx.tick()
+
+    @pool.command(name="model")
+    async def pool_model(self, ctx: commands.Context, name: str, url: str, model: str, endpoint_model: Optional[str]):
+        """ Maps a model to the name an endpoint serves it under, leave `endpoint_model` empty to remove the mapping
+
+            **Arguments**
+                - `model` The model set in servers
+                - `endpoint_model` The model name to request from this endpoint instead
+        """
+        async with self.config.endpoint_pools() as pools:
+            data = next((data for data in pools.get(name, []) if data["url"] == url), None)
+            if not data:
+                return await ctx.send(f":warning: `{url}` is not in pool `{name}`.")
+            models = data.setdefault("models", {})
+            if endpoint_model:
+                models[model] = endpoint_model
+            else:
+                models.pop(model, None)
+        await self.endpoint_pools.load()
+        await ctx.tick()
+
+    @pool.command(name="pin")
+    async def pool_pin(self, ctx: commands.Context, name: str, guild_id: Optional[int]):
+        """ Pins a server (this one by default) to a pool, use `none` to go back to the default endpoint """
+        guild = self.bot.get_guild(guild_id) if guild_id else ctx.guild
+        if not guild:
+            return await ctx.send(":warning: Unknown server.")
+        if name.lower() == "none":
+            name = None
+        elif name not in await self.config.endpoint_pools():
+            return await ctx.send(f":warning: No pool named `{name}`.")
+        await self.config.guild(guild).endpoint_pool.set(name)
+        embed = discord.Embed(
+            title=f"Endpoint pool of {guild.name} is now:",
+            description=f"`{name or 'default endpoint'}`",
+            color=await ctx.embed_color(),
+        )
+        return await ctx.send(embed=embed)
+
+    @aibotowner.group(name="http", invoke_without_command=True)
+    async def http(self, ctx: commands.Context):
+        """ Shows the HTTP connection pool used for requests to the OpenAI endpoint """
+        settings = await self.config.all()
+        embed = discord.Embed(
+            title="HTTP transport",
+            description=(
+                f"Pool of `{settings['http_pool_size']}` connections, kept alive for `{settings['http_keepalive_expiry']}` seconds\n"
+                f"HTTP/2: `{settings['http2']}`\n"
+                f"Timeouts: `{settings['openai_endpoint_connect_timeout']}` seconds to connect, "
+                f"`{settings['openai_endpoint_request_timeout']}` seconds to read"
+            ),
+            color=await ctx.embed_color(),
+        )
+        stats = pool_stats(self.openai_client)
+        if stats:
+            embed.add_field(name="Open connections", value=f"`{stats['open']}`")
+            embed.add_field(name="Idle connections", value=f"`{stats['idle']}`")
+            embed.add_field(name="HTTP/2 connections", value=f"`{stats['http2']}`")
+        embed.add_field(name="Requests", value=f"`{TRANSPORT_STATS.requests}`")
+        embed.add_field(name="Clients created", value=f"`{TRANSPORT_STATS.clients_created}`")
+        embed.add_field(name="Clients closed", value=f"`{TRANSPORT_STATS.clients_closed}`")
+        return await ctx.send(embed=embed)
+
+    @http.command(name="pool")
+    async def http_pool(self, ctx: commands.Context, size: int, keepalive: Optional[int]):
+        """ Sets how many connections to keep open to the endpoint, and for how many seconds idle ones are kept alive """
+        if size < 1 or (keepalive is not None and keepalive < 0):
+            return await ctx.send(":warning: Please enter a positive integer.")
+        await self.config.http_pool_size.set(size)
+        if keepalive is not None:
+            await self.config.http_keepalive_expiry.set(keepalive)
+        await replace_openai_client(self)
+        await self.endpoint_pools.load()
+        await ctx.tick()
+
+    @http.command(name="http2")
+    async def http_http2(self, ctx: commands.Context):
+        """ Toggles HTTP/2 for requests to the endpoint (requires the `h2` package) """
+        value = not await self.config.http2()
+        await self.config.http2.set(value)
+        await replace_openai_client(self)
+        await self.endpoint_pools.load()
+        embed = discord.Embed(
+            title="HTTP/2 is now:",
+            description=f"`{value}`",
+            color=await ctx.embed_color(),
+        )
+        return await ctx.send(embed=embed)
+
+    @http.command(name="connecttimeout")
+    async def http_connect_timeout(self, ctx: commands.Context, seconds: int):
+        """ Sets how long to wait for a connection to the endpoint (see `timeout` for the read timeout) """
+        if seconds < 1:
+            return await ctx.send(":warning: Please enter a positive integer.")
+        await self.config.openai_endpoint_connect_timeout.set(seconds)
+        await replace_openai_client(self)
+        await self.endpoint_pools.load()
+        embed = discord.Embed(
+            title="The connect timeout is now:",
+            description=f"`{seconds}` seconds",
+            color=await ctx.embed_color(),
+        )
+        return await ctx.send(embed=embed)
+
+    @aibotowner.command(name="tokenestimate")
+    async def token_estimate(self, ctx: commands.Context):
+        """ Toggles estimating token counts from message length for models unknown to tiktoken
+
+            When disabled, a default tokenizer is used for those models instead.
+        """
+        value = not await self.config.estimate_unknown_model_tokens()
+        await self.config.estimate_unknown_model_tokens.set(value)
+        embed = discord.Embed(
+            title="Estimating tokens for unknown models is now:",
+            description=f"{value}",
+            color=await ctx.embed_color(),
+        )
+        return await ctx.send(embed=embed)
+
+    @aibotowner.command(name="workers")
+    async def workers(self, ctx: commands.Context, kind: Optional[str], size: Optional[int]):
+        """ Configure the worker pool used for CPU-bound work (tokenization, regex cleanup)
+
+            Shows the pool's current stats if no arguments are given.
+
+            **Arguments**
+                - `kind` `thread` or `process` (processes avoid blocking the bot, but use more memory)
+                - `size` Number of workers
+        """
+        if kind:
+            if kind not in WORKER_TYPES:
+                return await ctx.send(f":warning: Worker type must be one of {', '.join(f'`{t}`' for t in WORKER_TYPES)}")
+            size = size or WORKERS.size
+            if size < 1:
+                return await ctx.send(":warning: Please enter a positive integer.")
+            await self.config.worker_pool_type.set(kind)
+            await self.config.worker_pool_size.set(size)
+            WORKERS.configure(kind, size)
+
+        embed = discord.Embed(
+            title="Worker pool",
+            description=f"`{WORKERS.size}` {WORKERS.kind} workers",
+            color=await ctx.embed_color(),
+        )
+        embed.add_field(name="In flight", value=f"`{WORKERS.in_flight}`")
+        embed.add_field(name="Queued", value=f"`{WORKERS.queue_depth}`")
+        embed.add_field(name="Completed", value=f"`{WORKERS.completed}`")
+        embed.add_field(name="Timeouts", value=f"`{WORKERS.timeouts}`")
+        embed.add_field(name="Latency p50", value=f"`{WORKERS.percentile(50) * 1000:.1f}` ms")
+        embed.add_field(name="Latency p95", value=f"`{WORKERS.percentile(95) * 1000:.1f}` ms")
+        return await ctx.send(embed=embed)
+
+    @aibotowner.group(name="scheduler", invoke_without_command=True)
+    async def scheduler(self, ctx: commands.Context):
+        """ Shows the LLM request scheduler's queues and in-flight requests """
+        scheduler = self.scheduler
+        embed = discord.Embed(
+            title="LLM request scheduler",
+            description=(
+                f"`{scheduler.in_flight}` / `{scheduler.concurrency}` requests in flight, "
+                f"up to `{scheduler.endpoint_concurrency}` per endpoint"
+            ),
+            color=await ctx.embed_color(),
+        )
+        for lane, name in LANE_NAMES.items():
+            embed.add_field(
+                name=name.capitalize(),
+                value=(
+                    f"Queued: `{scheduler.depth(lane)}`\n"
+                    f"Wait p50: `{scheduler.wait_time(lane, 50):.2f}` s\n"
+                    f"Wait p95: `{scheduler.wait_time(lane, 95):.2f}` s\n"
+                    f"Served: `{scheduler.served[lane]}`\n"
+                    f"Dropped: `{scheduler.dropped[lane]}`"
+                ),
+            )
+        embed.add_field(
+            name="Bursts",
+            value=f"`{self.coalescer.folded}` of `{self.coalescer.submitted}` triggered messages folded into another reply",
+            inline=False,
+        )
+        limiter = self.rate_limiter
+        blocked_until = limiter.blocked()
+        embed.add_field(
+            name="Rate limits",
+            value=(
+                f"Remaining requests: `{limiter.remaining_requests if limiter.remaining_requests is not None else 'unknown'}`\n"
+                f"Remaining tokens: `{limiter.remaining_tokens if limiter.remaining_tokens is not None else 'unknown'}`\n"
+                f"Held back: `{limiter.throttled}` requests"
+                + (f"\nBlocked until `{blocked_until.strftime('%Y-%m-%d %H:%M:%S')}`" if blocked_until else "")
+            ),
+            inline=False,
+        )
+        endpoints = [f"`{endpoint}`: `{count}`" for endpoint, count in scheduler.endpoint_in_flight.items() if count]
+        if endpoints:
+            embed.add_field(name="In flight by endpoint", value="\n".join(endpoints), inline=False)
+        return await ctx.send(embed=embed)
+
+    @scheduler.command(name="concurrency")
+    async def scheduler_concurrency(self, ctx: commands.Context, total: int, per_endpoint: Optional[int]):
+        """ Sets how many LLM requests may run at once, in total and per endpoint """
+        per_endpoint = per_endpoint or total
+        if total < 1 or per_endpoint < 1:
+            return await ctx.send("Please enter a positive integer.")
+        await self.config.scheduler_concurrency.set(total)
+        await self.config.scheduler_endpoint_concurrency.set(per_endpoint)
+        self.scheduler.configure(total, per_endpoint)
+        embed = discord.Embed(
+            title="The scheduler's concurrency is now:",
+            description=f"`{total}` in total, `{per_endpoint}` per endpoint",
+            color=await ctx.embed_color(),
+        )
+        return await ctx.send(embed=embed)
+
+    @scheduler.command(name="weight")
+    async def scheduler_weight(self, ctx: commands.Context, guild_id: int, weight: float):
+        """ Sets a server's share of LLM requests relative to other servers (default 1) """
+        if weight <= 0:
+            return await ctx.send("Please enter a positive number.")
+        async with self.config.scheduler_weights() as weights:
+            if weight == 1:
+                weights.pop(str(guild_id), None)
+            else:
+                weights[str(guild_id)] = weight
+        if weight == 1:
+            self.scheduler.weights.pop(guild_id, None)
+        else:
+            self.scheduler.weights[guild_id] = weight
+        embed = discord.Embed(
+            title=f"The scheduler weight of {guild_id} is now:",
+            description=f"{weight}",
+            color=await ctx.embed_color(),
+        )
+        return await ctx.send(embed=embed)
+
+    @aibotowner.command(name="rejections")
+    async def rejections_stats(self, ctx: commands.Context):
+        """ Shows how many messages each validation stage has rejected since the cog was loaded """
+        embed = discord.Embed(
+            title="Rejected messages by stage",
+            color=await ctx.embed_color(),
+        )
+        if not self.rejections:
+            embed.description = "No messages rejected yet."
+        for stage, count in self.rejections.most_common():
+            embed.add_field(name=stage, value=f"`{count}`", inline=True)
+        return await ctx.send(embed=embed)
+
+    @aibotowner.group(name="stats", invoke_without_command=True)
+    async def stats(self, ctx: commands.Context, guild_id: Optional[int]):
+        """ Shows how long each stage of replying takes, and tokens used, since the cog was loaded
+
+            Latencies are estimated from histogram buckets. Give a server ID to only show that server.
+        """
+        metrics = self.metrics
+        since = datetime.fromtimestamp(metrics.started, tz=timezone.utc)
+        embed = discord.Embed(
+            title="Reply pipeline stats" + (f" for {guild_id}" if guild_id else ""),
+            description=f"Since <t:{int(since.timestamp())}:R>",
+            color=await ctx.embed_color(),
+        )
+        for stage in STAGES:
+            histogram = metrics.stage(stage, guild_id)
+            if not histogram.count:
+                continue
+            embed.add_field(
+                name=stage.capitalize(),
+                value=(
+                    f"p50: `{histogram.percentile(50):.3f}` s\n"
+                    f"p95: `{histogram.percentile(95):.3f}` s\n"
+                    f"p99: `{histogram.percentile(99):.3f}` s\n"
+                    f"Count: `{histogram.count}`"
+                ),
+            )
+        if not embed.fields:
+            embed.description += "\nNo replies yet."
+
+        models = []
+        for model in metrics.models():
+            histogram = metrics.stage(STAGE_LLM, guild_id, model)
+            if histogram.count:
+                models.append(f"`{model}`: p50 `{histogram.percentile(50):.2f}` s, p95 `{histogram.percentile(95):.2f}` s")
+        if models:
+            embed.add_field(name="LLM requests by model", value="\n".join(models[:10]), inline=False)
+
+        tokens = metrics.token_totals(guild_id)
+        if tokens:
+            embed.add_field(
+                name="Tokens",
+                value=(
+                    f"Prompt: `{tokens['prompt']}` (`{tokens['cached']}` cached)\n"
+                    f"Completion: `{tokens['completion']}`"
+                ),
+                inline=False,
+            )
+        if self.metrics_server.running:
+            embed.set_footer(text=f"Prometheus metrics at {self.metrics_server.address}")
+        return await ctx.send(embed=embed)
+
+    @stats.command(name="reset")
+    async def stats_reset(self, ctx: commands.Context):
+        """ Clears the collected stats """
+        self.metrics.reset()
+        await ctx.tick()
+
+    @stats.command(name="prometheus")
+    async def stats_prometheus(self, ctx: commands.Context, port: Optional[int], host: str = "127.0.0.1"):
+        """ Serves the stats at `http://<host>:<port>/metrics` for Prometheus to scrape
+
+            Leave the port empty to stop serving them. Only bind to a public host if the port is firewalled.
+        """
+        if port is not None and not (1 <= port <= 65535):
+            return await ctx.send(":warning: Please enter a valid port.")
+        await self.config.metrics_port.set(port)
+        await self.config.metrics_host.set(host)
+        if port:
+            await self.metrics_server.start(host, port)
+            if not self.metrics_server.running:
+                return await ctx.send(f":warning: Could not listen on `{host}:{port}`, check the logs.")
+        else:
+            await self.metrics_server.stop()
+        embed = discord.Embed(
+            title="Prometheus metrics are now:",
+            description=f"Served at `{self.metrics_server.address}`" if port else "Not served",
+            color=await ctx.embed_color(),
+        )
+        return await ctx.send(embed=embed)
+
+    @aibotowner.command(name="profile")
+    async def profile(self, ctx: commands.Context, amount: int, unit: str = "seconds"):
+        """ Profiles message handling for a number of seconds or messages, then uploads the results
+
+            The report lists the hottest functions (cProfile) and the sites that allocated the most memory (tracemalloc).
+            In `messages` mode, profiling stops after at most 10 minutes.
+            Profiling slows the bot down while it runs, and costs nothing otherwise.
+
+            Example: `[p]aibotowner profile 50 messages`
+        """
+        unit = unit.lower()
+        if unit in ("s", "sec", "second", "seconds"):
+            if not (1 <= amount <= PROFILE_MAX_SECONDS):
+                return await ctx.send(f":warning: Please enter between 1 and {PROFILE_MAX_SECONDS} seconds.")
+            seconds, messages = amount, None
+        elif unit in ("m", "msg", "message", "messages"):
+            if not (1 <= amount <= PROFILE_MAX_MESSAGES):
+                return await ctx.send(f":warning: Please enter between 1 and {PROFILE_MAX_MESSAGES} messages.")
+            seconds, messages = PROFILE_MAX_SECONDS, amount
+        else:
+            return await ctx.send(":warning: Please profile for a number of `seconds` or `messages`.")
+
+        if self.profiler.active:
+            return await ctx.send(":warning: Already profiling.")
+        await ctx.send(f"Profiling for {amount} {'messages' if messages else 'seconds'}...")
+        report = await self.profiler.run(seconds, messages)
+        return await ctx.send(
+            f"Profiled {self.profiler.messages} messages.",
+            file=discord.File(io.BytesIO(report.encode()), filename="aibot_profile.txt"),
+        )
+
     @aibotowner.command(name="exportconfig")
     async def export_config(self, ctx: commands.Context):
         """Exports the current config to a json file
@@ -11,7 +11,9 @@ from redbot.core.utils.menus import SimpleMenu, start_adding_reactions
 from redbot.core.utils.predicates import ReactionPredicate
 
 from localaibot.config.defaults import DEFAULT_REMOVE_PATTERNS
+from localaibot.response.chat.cleanup import CleanupProgram, get_cleanup_program
 from localaibot.types.abc import MixinMeta, aibot
+from localaibot.utils.tokens import encoding_for_model
 
 logger = logging.getLogger("red.0x42_cogs.aibot")
 
@@ -45,6 +47,7 @@ class ResponseSettings(MixinMeta):
         if regex_pattern not in removelist_regexes:
             removelist_regexes.append(regex_pattern)
             await self.config.guild(ctx.guild).removelist_regexes.set(removelist_regexes)
+            self.cleanup_programs[ctx.guild.id] = CleanupProgram(removelist_regexes)
             await ctx.send(f"The regex pattern `{regex_pattern}` has been added to the list.")
         else:
             await ctx.send(f"The regex pattern `{regex_pattern}` is already in the list of regex patterns.")
@@ -57,6 +60,7 @@ class ResponseSettings(MixinMeta):
             return await ctx.send("Invalid number.")
         removed_regex = removelist_regexes.pop(number - 1)
         await self.config.guild(ctx.guild).removelist_regexes.set(removelist_regexes)
+        self.cleanup_programs[ctx.guild.id] = CleanupProgram(removelist_regexes)
         await ctx.send(f"The regex pattern `{removed_regex}` has been removed from the list.")
 
     @removelist.command(name="show")
@@ -85,6 +89,36 @@ class ResponseSettings(MixinMeta):
 
         return await SimpleMenu(pages).start(ctx)
 
+    @removelist.command(name="stats")
+    async def removelist_stats(self, ctx: commands.Context):
+        """Show how often each regex pattern matched since the cog was loaded, and how often the list timed out"""
+        program = await get_cleanup_program(self, ctx.guild)
+        if not program.templates:
+            return await ctx.send("The list of regex patterns is empty.")
+
+        formatted_list = "\n".join(
+            f"{i+1}. {stats.matches} matches, {stats.errors} errors"
+            for i, stats in enumerate(program.stats)
+        )
+        if program.timeouts:
+            formatted_list += f"\n\nThe whole list timed out {program.timeouts} times."
+
+        pages = []
+        for text in pagify(formatted_list, page_length=888):
+            page = discord.Embed(
+                title=f"Regex pattern stats in {ctx.guild.name}",
+                description=box(text),
+                color=await ctx.embed_color())
+            pages.append(page)
+
+        if len(pages) == 1:
+            return await ctx.send(embed=pages[0])
+
+        for i, page in enumerate(pages):
+            page.set_footer(text=f"Page {i+1} of {len(pages)}")
+
+        return await SimpleMenu(pages).start(ctx)
+
     @removelist.command(name="reset")
     async def removelist_reset(self, ctx: commands.Context):
         """Reset the list of regexes to default """
@@ -103,8 +137,77 @@ class ResponseSettings(MixinMeta):
             return await confirm.edit(embed=discord.Embed(title="Cancelled.", color=await ctx.embed_color()))
         else:
             await self.config.guild(ctx.guild).removelist_regexes.set(DEFAULT_REMOVE_PATTERNS)
+            self.cleanup_programs[ctx.guild.id] = CleanupProgram(DEFAULT_REMOVE_PATTERNS)
             return await confirm.edit(embed=discord.Embed(title="Removelist reset.", color=await ctx.embed_color()))
 
+    @response.command(name="stream")
+    async def toggle_streaming(self, ctx: commands.Context):
+        """Toggle streaming responses
+
+        If enabled, responses are sent while they are being generated and edited as more text arrives
+        Requires an endpoint that supports streaming
+        """
+        current_value = not await self.config.guild(ctx.guild).stream_responses()
+        await self.config.guild(ctx.guild).stream_responses.set(current_value)
+
+        embed = discord.Embed(
+            title="Streaming responses now set to:",
+            description=f"{current_value}",
+            color=await ctx.embed_color(),
+        )
+        await ctx.send(embed=embed)
+
+    @response.command(name="cachefriendly", aliases=["promptcache"])
+    async def toggle_prompt_cache_mode(self, ctx: commands.Context):
+        """Toggle prefix-stable prompts
+
+        If enabled, the system prompt is kept identical between requests and the history window only grows at its end,
+        so endpoints with prompt/prefix caching can reuse most of the previous request
+        Variables that change every message (eg. `{currenttime}`, `{authorname}`) are sent in a message after the history instead
+        """
+        current_value = not await self.config.guild(ctx.guild).prompt_cache_mode()
+        await self.config.guild(ctx.guild).prompt_cache_mode.set(current_value)
+
+        embed = discord.Embed(
+            title="Prefix-stable prompts now set to:",
+            description=f"{current_value}",
+            color=await ctx.embed_color(),
+        )
+        await ctx.send(embed=embed)
+
+    @response.command(name="burstwindow")
+    async def burst_window(self, ctx: commands.Context, seconds: float):
+        """Set how long to wait for more messages before replying
+
+        Triggered messages arriving within this window, or while a reply is being generated, get a single reply to the latest one
+        (Default is 1 second, 0 only folds messages sent during generation)
+        """
+        if not (0 <= seconds <= 10):
+            return await ctx.send(":warning: Please enter a number of seconds between 0 and 10.")
+        await self.config.guild(ctx.guild).burst_window.set(seconds)
+        embed = discord.Embed(
+            title="Burst window now set to:",
+            description=f"{seconds} seconds",
+            color=await ctx.embed_color(),
+        )
+        await ctx.send(embed=embed)
+
+    @response.command(name="youtubetokens")
+    async def youtube_description_tokens(self, ctx: commands.Context, tokens: int = None):
+        """Set how many tokens of a linked YouTube video's description are sent to the LLM
+
+        (Requires a YouTube API key, leave empty to send whole descriptions)
+        """
+        if tokens is not None and tokens < 0:
+            return await ctx.send(":warning: Please enter a positive integer.")
+        await self.config.guild(ctx.guild).youtube_description_tokens.set(tokens)
+        embed = discord.Embed(
+            title="YouTube description tokens now set to:",
+            description=f"{tokens if tokens is not None else 'Unlimited'}",
+            color=await ctx.embed_color(),
+        )
+        await ctx.send(embed=embed)
+
     @response.command(name="toggleoptinembed")
     async def toggle_optin_embed(self, ctx):
         """Toggles warning embed about opt-in on or off"""
@@ -144,9 +247,8 @@ class ResponseSettings(MixinMeta):
         if not weights:
             return await ctx.send(":warning: No weights set.")
         embed = discord.Embed(title="Weights Used", color=await ctx.embed_color())
-        try:
-            encoding = tiktoken.encoding_for_model(await self.config.guild(ctx.guild).model())
-        except KeyError:
+        encoding = encoding_for_model(await self.config.guild(ctx.guild).model())
+        if not encoding:
             return await ctx.send(":warning: Unsupported model for tokenization")
         weights = {encoding.decode([int(token)]): weight for token, weight in weights.items()}
         weights = {key.strip().lower(): value for key, value in weights.items()}
@@ -174,9 +276,8 @@ class ResponseSettings(MixinMeta):
                 return await ctx.send(":warning: Logit bias already set. Please remove logit bias from custom parameters first.")
 
         model = await self.config.guild(ctx.guild).model()
-        try:
-            encoding = tiktoken.encoding_for_model(model)
-        except KeyError:
+        encoding = encoding_for_model(model)
+        if not encoding:
             return await ctx.send(":warning: Unsupported model, please use custom parameters instead.")
 
         if weight < -100 or weight > 100:
@@ -220,9 +321,8 @@ class ResponseSettings(MixinMeta):
         *Arguments*
             - `word` The word to remove
         """
-        try:
-            encoding = tiktoken.encoding_for_model(await self.config.guild(ctx.guild).model())
-        except KeyError:
+        encoding = encoding_for_model(await self.config.guild(ctx.guild).model())
+        if not encoding:
             return await ctx.send(":warning: Unsupported model for tokenization")
         weights = await self.config.guild(ctx.guild).weights()
         weights = {} if weights is None else json.loads(weights)
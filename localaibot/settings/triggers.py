@@ -6,6 +6,7 @@ import discord
 from redbot.core import checks, commands
 
 from localaibot.types.abc import MixinMeta, aibot
+from localaibot.utils.matcher import WordMatcher
 
 logger = logging.getLogger("red.0x42_cogs.aibot")
 
@@ -126,6 +127,7 @@ class TriggerSettings(MixinMeta):
             return await ctx.send("That word is already in the list")
         words.append(word)
         await self.config.guild(ctx.guild).always_reply_on_words.set(words)
+        await self.update_trigger_words(ctx.guild, words)
         return await self.show_trigger_always_words(ctx, discord.Embed(
             title="The trigger words are now:",
             color=await ctx.embed_color()))
@@ -138,6 +140,7 @@ class TriggerSettings(MixinMeta):
             return await ctx.send("That word is not in the list")
         words.remove(word)
         await self.config.guild(ctx.guild).always_reply_on_words.set(words)
+        await self.update_trigger_words(ctx.guild, words)
         return await self.show_trigger_always_words(ctx, discord.Embed(
             title="The trigger words are now:",
             color=await ctx.embed_color()))
@@ -153,8 +156,27 @@ class TriggerSettings(MixinMeta):
     async def trigger_words_clear(self, ctx: commands.Context):
         """ Clear the trigger words list """
         await self.config.guild(ctx.guild).always_reply_on_words.set([])
+        await self.update_trigger_words(ctx.guild, [])
         return await ctx.send("The trigger words list has been cleared.")
 
+    @trigger_words.command(name="wholewords", aliases=["whole_words"])
+    async def trigger_words_whole_words(self, ctx: commands.Context):
+        """ Toggles whether trigger words only match whole words, instead of anywhere in a message """
+        value = not await self.config.guild(ctx.guild).always_reply_on_words_whole_words()
+        await self.config.guild(ctx.guild).always_reply_on_words_whole_words.set(value)
+        await self.update_trigger_words(ctx.guild)
+        embed = discord.Embed(
+            title="Trigger words only matching whole words is now:",
+            description=f"{value}",
+            color=await ctx.embed_color())
+        return await ctx.send(embed=embed)
+
+    async def update_trigger_words(self, guild: discord.Guild, words: Optional[list] = None):
+        if words is None:
+            words = await self.config.guild(guild).always_reply_on_words()
+        whole_words = await self.config.guild(guild).always_reply_on_words_whole_words()
+        self.trigger_words[guild.id] = WordMatcher(words, whole_words)
+
     async def show_trigger_always_words(self, ctx: commands.Context, embed: discord.Embed):
         words = await self.config.guild(ctx.guild).always_reply_on_words()
         if words:
@@ -1,9 +1,9 @@
 import discord
-import tiktoken
 from openai import AsyncOpenAI
 from redbot.core import Config, commands
 
 from localaibot.types.enums import MentionType
+from localaibot.utils.tokens import count_tokens, get_encoding
 from localaibot.utils.utilities import (
     format_variables,
     is_using_openai_endpoint,
@@ -57,11 +57,8 @@ async def get_tokens(config: Config, ctx: commands.Context, prompt: str) -> int:
     if not prompt:
         return 0
     prompt = await format_variables(ctx, prompt)  # to provide a better estimate
-    try:
-        encoding = tiktoken.encoding_for_model(await config.guild(ctx.guild).model())
-    except KeyError:
-        encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-    return len(encoding.encode(prompt, disallowed_special=()))
+    encoding = get_encoding(await config.guild(ctx.guild).model(), estimate=await config.estimate_unknown_model_tokens())
+    return count_tokens(prompt, encoding)
 
 
 def truncate_prompt(prompt: str, limit: int = 1900) -> str:
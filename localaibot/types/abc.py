@@ -1,13 +1,33 @@
+import asyncio
 import re
 from abc import ABC
+from collections import Counter
 from datetime import datetime
+from typing import TYPE_CHECKING, Optional, Tuple
 
 from openai import AsyncOpenAI
 from redbot.core import Config, commands
 from redbot.core.bot import Red
 
+from localaibot.core.coalescer import BurstCoalescer
+from localaibot.core.rate_limiter import RateLimiter
+from localaibot.messages_list.channel_history import ChannelHistory
 from localaibot.messages_list.entry import MessageEntry
 from localaibot.utils.cache import Cache
+from localaibot.utils.config_cache import ConfigCache
+from localaibot.utils.matcher import WordMatcher
+from localaibot.utils.metrics import Metrics
+from localaibot.utils.profiler import Profiler
+from localaibot.utils.scheduler import LLMScheduler
+
+if TYPE_CHECKING:
+    from localaibot.core.endpoint_pool import EndpointPools
+    from localaibot.core.metrics_server import MetricsServer
+    from localaibot.core.summarizer import HistorySummarizer
+    from localaibot.messages_list.converter.embed.youtube import YoutubeClient
+    from localaibot.messages_list.reference_resolver import ReferenceResolver
+    from localaibot.response.chat.cleanup import CleanupProgram
+    from localaibot.response.chat.llm_pipeline import ToolStats
 
 
 # for other settings to use
@@ -27,9 +47,27 @@ class MixinMeta(ABC):
         self.bot: Red
         self.config: Config
         self.cached_options: dict
+        self.config_cache: ConfigCache
         self.override_prompt_start_time: dict[int, datetime]
-        self.cached_messages: Cache[int, MessageEntry]
+        self.prompt_anchors: dict[int, datetime]
+        self.channel_history: ChannelHistory
+        self.cached_messages: Cache[int, Tuple[Optional[datetime], Tuple[MessageEntry, ...]]]
         self.ignore_regex: dict[int, re.Pattern]
-        self.channels_whitelist: dict[int, list[int]]
+        self.trigger_words: dict[int, WordMatcher]
+        self.cleanup_programs: dict[int, "CleanupProgram"]
+        self.channels_whitelist: dict[int, set[int]]
         self.openai_client: AsyncOpenAI
-        self.optindefault: dict[int, bool] 
\ No newline at end of file
+        self.optindefault: dict[int, bool]
+        self.rejections: Counter[str]
+        self.tool_stats: dict[str, "ToolStats"]
+        self.closing_clients: set[asyncio.Task]
+        self.scheduler: LLMScheduler
+        self.coalescer: BurstCoalescer
+        self.rate_limiter: RateLimiter
+        self.youtube: "YoutubeClient"
+        self.endpoint_pools: "EndpointPools"
+        self.summarizer: "HistorySummarizer"
+        self.metrics: Metrics
+        self.metrics_server: "MetricsServer"
+        self.profiler: Profiler
+        self.references: "ReferenceResolver"
@@ -1,24 +1,149 @@
-class Cache(dict):
-    def __init__(self, limit: int):
-        super().__init__()
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Generic, Hashable, Iterator, Optional, Set, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@dataclass
+class _Item(Generic[V]):
+    value: V
+    expires: Optional[float]
+    size: int
+    owner: Optional[int]
+
+
+class Cache(Generic[K, V]):
+    """
+    LRU cache with optional per-entry TTL and an entry / byte budget.
+
+    Entries can be tagged with an owner (eg. a message author id) so they can be dropped together.
+    Missing keys return `None` on lookup.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[V], int] = sys.getsizeof,
+    ):
         self.limit = limit
-        self.keys = []
-
-    def __setitem__(self, key, value):
-        if key in self:
-            self.keys.remove(key)
-            self.keys.append(key)
-        else:
-            if len(self) >= self.limit:
-                oldest_key = self.keys.pop(0)
-                del self[oldest_key]
-            self.keys.append(key)
-        super().__setitem__(key, value)
-
-    def __getitem__(self, key):
-        if key in self:
-            self.keys.remove(key)
-            self.keys.append(key)
-            return super().__getitem__(key)
-        else:
-            return None
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.stats = CacheStats()
+        self.bytes = 0
+        self._data: "OrderedDict[K, _Item[V]]" = OrderedDict()
+        self._owners: Dict[int, Set[K]] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(list(self._data))
+
+    def __contains__(self, key) -> bool:
+        item = self._data.get(key)
+        if item is None:
+            return False
+        if self._expired(item):
+            self._remove(key, expired=True)
+            return False
+        return True
+
+    def __getitem__(self, key: K) -> Optional[V]:
+        return self.get(key)
+
+    def __setitem__(self, key: K, value: V):
+        self.set(key, value)
+
+    def __delitem__(self, key: K):
+        if key not in self._data:
+            raise KeyError(key)
+        self._remove(key)
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        item = self._data.get(key)
+        if item is None:
+            self.stats.misses += 1
+            return default
+        if self._expired(item):
+            self._remove(key, expired=True)
+            self.stats.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.stats.hits += 1
+        return item.value
+
+    def set(self, key: K, value: V, *, owner: Optional[int] = None, ttl: Optional[float] = None):
+        if key in self._data:
+            self._remove(key)
+
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        size = self.sizeof(value) if self.max_bytes else 0
+
+        self._data[key] = _Item(value, expires, size, owner)
+        self.bytes += size
+        if owner is not None:
+            self._owners.setdefault(owner, set()).add(key)
+
+        while len(self._data) > self.limit or (self.max_bytes and self.bytes > self.max_bytes and len(self._data) > 1):
+            oldest_key = next(iter(self._data))
+            self._remove(oldest_key)
+            self.stats.evictions += 1
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        self._remove(key)
+        return item.value
+
+    def items(self) -> Iterator[Tuple[K, V]]:
+        return ((key, item.value) for key, item in list(self._data.items()) if not self._expired(item))
+
+    def invalidate_owner(self, owner: int) -> int:
+        """Remove all entries tagged with the given owner, returns the number removed"""
+        keys = self._owners.pop(owner, set())
+        for key in keys:
+            if key in self._data:
+                self._remove(key)
+        return len(keys)
+
+    def clear(self):
+        self._data.clear()
+        self._owners.clear()
+        self.bytes = 0
+
+    def _expired(self, item: _Item) -> bool:
+        return item.expires is not None and item.expires <= time.monotonic()
+
+    def _remove(self, key: K, expired: bool = False):
+        item = self._data.pop(key)
+        self.bytes -= item.size
+        if expired:
+            self.stats.expirations += 1
+        if item.owner is not None:
+            keys = self._owners.get(item.owner)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._owners[item.owner]
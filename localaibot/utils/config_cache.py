@@ -0,0 +1,121 @@
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+import discord
+from redbot.core import Config
+
+from localaibot.config.defaults import DEFAULT_CHANNEL, DEFAULT_MEMBER, DEFAULT_ROLE
+
+
+@dataclass
+class GlobalSnapshot:
+    settings: Dict[str, Any]
+    optin: Set[int]
+    optout: Set[int]
+
+
+@dataclass
+class GuildSnapshot:
+    version: int
+    settings: Dict[str, Any]
+    channels: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    roles: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    members: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.settings[key]
+
+    def channel(self, channel: discord.abc.Messageable) -> Dict[str, Any]:
+        return self.channels.get(channel.id, DEFAULT_CHANNEL)
+
+    def member(self, member: discord.abc.User) -> Dict[str, Any]:
+        return self.members.get(member.id, DEFAULT_MEMBER)
+
+    def role(self, member: discord.abc.User) -> Optional[Dict[str, Any]]:
+        """Settings of the first of the member's roles that has any stored"""
+        for role in getattr(member, "roles", []):
+            if role.id in self.roles:
+                return self.roles[role.id]
+        return None
+
+    def resolve(self, key: str, member: discord.abc.User, channel: discord.abc.Messageable) -> Any:
+        """Most specific value set for a key, in order of member > role > channel > server"""
+        role_settings = self.role(member) or DEFAULT_ROLE
+        for value in (self.member(member)[key], role_settings[key], self.channel(channel)[key]):
+            if value is not None:
+                return value
+        return self.settings[key]
+
+
+class ConfigCache:
+    """
+    Versioned in-memory snapshots of the cog's Config, used on the message handling path.
+
+    Snapshots are built lazily and must be invalidated whenever the Config they mirror is written to.
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.version = 0
+        self._global: Optional[GlobalSnapshot] = None
+        self._guilds: Dict[int, GuildSnapshot] = {}
+        # builds of different guilds don't wait on each other
+        self._locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def glob(self) -> GlobalSnapshot:
+        if self._global:
+            return self._global
+        version = self.version
+        settings = await self.config.all()
+        snapshot = GlobalSnapshot(settings, set(settings["optin"]), set(settings["optout"]))
+        if version == self.version:
+            self._global = snapshot
+        return snapshot
+
+    async def guild(self, guild: discord.Guild) -> GuildSnapshot:
+        snapshot = self._guilds.get(guild.id)
+        if snapshot:
+            return snapshot
+        async with self._locks[guild.id]:
+            snapshot = self._guilds.get(guild.id)
+            if snapshot:
+                return snapshot
+            version = self.version
+            snapshot = GuildSnapshot(version, await self.config.guild(guild).all())
+            snapshot.members = await self.config.all_members(guild)
+            snapshot.channels = await self._stored(
+                self.config.channel_from_id, [c.id for c in guild.channels] + [t.id for t in guild.threads], DEFAULT_CHANNEL
+            )
+            snapshot.roles = await self._stored(self.config.role_from_id, [role.id for role in guild.roles], DEFAULT_ROLE)
+            if version == self.version:
+                self._guilds[guild.id] = snapshot
+            return snapshot
+
+    @staticmethod
+    async def _stored(group, ids: List[int], defaults: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+        """Settings of the guild's own channels or roles that differ from the defaults, without reading every guild's"""
+        settings = await asyncio.gather(*(group(id_).all() for id_ in ids))
+        return {id_: data for id_, data in zip(ids, settings) if data != defaults}
+
+    def peek_global(self) -> Optional[GlobalSnapshot]:
+        """Global snapshot if already built, without awaiting Config"""
+        return self._global
+
+    def peek(self, guild_id: int) -> Optional[GuildSnapshot]:
+        """Guild snapshot if already built, without awaiting Config"""
+        return self._guilds.get(guild_id)
+
+    def invalidate_global(self):
+        self.version += 1
+        self._global = None
+
+    def invalidate(self, guild: Optional[discord.Guild] = None):
+        """Drop snapshots for a guild (and global settings), or everything if no guild is given"""
+        self.version += 1
+        self._global = None
+        if guild is None:
+            self._guilds.clear()
+        else:
+            self._guilds.pop(guild.id, None)
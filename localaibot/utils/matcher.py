@@ -0,0 +1,34 @@
+import re
+from typing import Iterable, Optional
+
+
+class WordMatcher:
+    """
+    Matches any of a list of words in a single regex pass.
+
+    By default words match anywhere in the text (like `word in text`), `whole_words` only matches them on word boundaries.
+    """
+
+    def __init__(self, words: Iterable[str], whole_words: bool = False):
+        self.words = {word.lower(): word for word in words if word}
+        self.whole_words = whole_words
+        self.pattern = self._compile() if self.words else None
+
+    def _compile(self) -> re.Pattern:
+        # longest first so the reported word is the most specific one at a position
+        alternation = "|".join(re.escape(word) for word in sorted(self.words, key=len, reverse=True))
+        if self.whole_words:
+            alternation = rf"(?<!\w)(?:{alternation})(?!\w)"
+        return re.compile(alternation, re.IGNORECASE)
+
+    def __bool__(self) -> bool:
+        return self.pattern is not None
+
+    def match(self, text: str) -> Optional[str]:
+        """Returns the configured word that matched, if any"""
+        if not self.pattern:
+            return None
+        found = self.pattern.search(text)
+        if not found:
+            return None
+        return self.words.get(found.group(0).lower(), found.group(0))
@@ -0,0 +1,170 @@
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# reply pipeline stages, in order
+STAGE_VALIDATION = "validation"  # prefilters, validators and triggers
+STAGE_HISTORY = "history"  # building the messages list, including the two below
+STAGE_CONVERSION = "conversion"
+STAGE_TOKENIZATION = "tokenization"
+STAGE_QUEUE = "queue"  # waiting for a scheduler slot
+STAGE_LLM = "llm"  # completion requests, including tool calls
+STAGE_CLEANUP = "cleanup"
+STAGE_SEND = "send"
+STAGE_REPLY = "reply"  # from dispatch to the reply being sent
+STAGES = (
+    STAGE_VALIDATION, STAGE_HISTORY, STAGE_CONVERSION, STAGE_TOKENIZATION, STAGE_QUEUE,
+    STAGE_LLM, STAGE_CLEANUP, STAGE_SEND, STAGE_REPLY,
+)
+
+# 1ms to ~4.5 minutes, growing by sqrt(2)
+BUCKETS: Tuple[float, ...] = tuple(round(0.001 * 2 ** (i / 2), 6) for i in range(37))
+
+Labels = Tuple[str, int, str]  # stage, guild id, model
+
+
+class Histogram:
+    """
+    Fixed bucket latency histogram.
+
+    Only ever touched from the event loop, so observations are plain increments without locking.
+    """
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def merge(self, other: "Histogram"):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent: float) -> float:
+        """Estimated from the buckets, interpolating within the bucket the percentile falls in"""
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1] * 2
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+class Metrics:
+    """Latency of each stage of the reply pipeline and token usage, by guild and model"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.histograms: Dict[Labels, Histogram] = defaultdict(Histogram)
+        # (guild id, model) -> prompt / completion / cached prompt tokens
+        self.tokens: Dict[Tuple[int, str], Counter[str]] = defaultdict(Counter)
+
+    def observe(self, stage: str, seconds: float, guild_id: int = 0, model: Optional[str] = None):
+        self.histograms[(stage, guild_id, model or "")].observe(seconds)
+
+    @contextmanager
+    def span(self, stage: str, guild_id: int = 0, model: Optional[str] = None) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, guild_id, model)
+
+    def record_usage(self, guild_id: int, model: str, usage):
+        if not usage:
+            return
+        tokens = self.tokens[(guild_id, model or "")]
+        tokens["prompt"] += usage.prompt_tokens or 0
+        tokens["completion"] += usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        tokens["cached"] += getattr(details, "cached_tokens", None) or 0
+
+    def stage(self, stage: str, guild_id: Optional[int] = None, model: Optional[str] = None) -> Histogram:
+        """A stage's observations merged across labels, optionally only those of a guild or model"""
+        merged = Histogram()
+        for (name, guild, label_model), histogram in list(self.histograms.items()):
+            if name == stage and guild_id in (None, guild) and model in (None, label_model):
+                merged.merge(histogram)
+        return merged
+
+    def models(self) -> List[str]:
+        return sorted({model for _, _, model in self.histograms if model})
+
+    def token_totals(self, guild_id: Optional[int] = None) -> Counter[str]:
+        totals: Counter[str] = Counter()
+        for (guild, _), tokens in list(self.tokens.items()):
+            if guild_id in (None, guild):
+                totals.update(tokens)
+        return totals
+
+    def reset(self):
+        self.started = time.time()
+        self.histograms.clear()
+        self.tokens.clear()
+
+    def render_prometheus(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+
+        Labelled by stage and model only, a guild label would make a series per guild the bot is in,
+        per guild breakdowns are only kept in memory for the stats command.
+        """
+        histograms: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+        for (stage, _, model), histogram in list(self.histograms.items()):
+            histograms[(stage, model)].merge(histogram)
+        tokens: Dict[str, Counter[str]] = defaultdict(Counter)
+        for (_, model), counts in list(self.tokens.items()):
+            tokens[model].update(counts)
+
+        lines = [
+            "# HELP aibot_stage_seconds Time spent in each stage of the reply pipeline",
+            "# TYPE aibot_stage_seconds histogram",
+        ]
+        for (stage, model), histogram in sorted(histograms.items()):
+            labels = f'stage="{stage}",model="{_escape(model)}"'
+            cumulative = 0
+            for bound, count in zip(_bounds(), histogram.counts):
+                cumulative += count
+                lines.append(f'aibot_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"aibot_stage_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"aibot_stage_seconds_count{{{labels}}} {histogram.count}")
+
+        lines += [
+            "# HELP aibot_tokens_total Tokens used by LLM requests",
+            "# TYPE aibot_tokens_total counter",
+        ]
+        for model, counts in sorted(tokens.items()):
+            for kind, count in sorted(counts.items()):
+                lines.append(f'aibot_tokens_total{{model="{_escape(model)}",kind="{kind}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def _bounds() -> Iterable[str]:
+    yield from (f"{bound:g}" for bound in BUCKETS)
+    yield "+Inf"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,98 @@
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import time
+import tracemalloc
+from typing import Awaitable, Optional
+
+from localaibot.config.constants import (
+    PROFILE_TOP_ALLOCATIONS,
+    PROFILE_TOP_FUNCTIONS,
+    PROFILE_TRACEBACK_FRAMES,
+)
+
+logger = logging.getLogger("red.0x42_cogs.aibot")
+
+
+class ProfilerBusy(Exception):
+    """A profiling window is already open"""
+
+
+class Profiler:
+    """
+    cProfile and tracemalloc over a bounded window of message handling, for diagnosing a slow bot live.
+
+    Nothing is traced unless a window is open, the message listener only checks `active`.
+    cProfile sees everything running on the event loop during the window, not only `handle_message`.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.messages = 0
+        self._limit: Optional[int] = None
+        self._done: Optional[asyncio.Event] = None
+
+    async def handle(self, handler: Awaitable):
+        """Run a message handler, counting it towards the window's message limit"""
+        try:
+            await handler
+        finally:
+            self.messages += 1
+            if self._limit and self.messages >= self._limit:
+                self._done.set()
+
+    async def run(self, seconds: float, messages: Optional[int] = None) -> str:
+        """
+        Profile for `seconds`, or until `messages` messages were handled (with `seconds` as a time limit).
+        Returns the report.
+        """
+        if self.active:
+            raise ProfilerBusy()
+
+        self.active = True
+        self.messages = 0
+        self._limit = messages
+        self._done = asyncio.Event()
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start(PROFILE_TRACEBACK_FRAMES)
+        before = tracemalloc.take_snapshot()
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            await asyncio.wait_for(self._done.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - start
+            after = tracemalloc.take_snapshot()
+            if not was_tracing:
+                tracemalloc.stop()
+            self.active = False
+            self._limit = None
+
+        logger.info(f"Profiled {self.messages} messages over {elapsed:.1f}s")
+        return self._report(profile, before, after, elapsed)
+
+    def _report(self, profile: cProfile.Profile, before, after, elapsed: float) -> str:
+        out = io.StringIO()
+        out.write(f"Profiled {self.messages} messages over {elapsed:.1f} seconds\n\n")
+
+        for sort, title in (("cumulative", "cumulative time"), ("tottime", "own time")):
+            out.write(f"=== Top {PROFILE_TOP_FUNCTIONS} functions by {title} ===\n")
+            pstats.Stats(profile, stream=out).strip_dirs().sort_stats(sort).print_stats(PROFILE_TOP_FUNCTIONS)
+
+        ignored = (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        )
+        differences = after.filter_traces(ignored).compare_to(before.filter_traces(ignored), "lineno")
+        out.write(f"=== Top {PROFILE_TOP_ALLOCATIONS} allocation sites (growth during the window) ===\n")
+        for difference in differences[:PROFILE_TOP_ALLOCATIONS]:
+            out.write(f"{difference}\n")
+        return out.getvalue()
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, Dict, Optional
+
+logger = logging.getLogger("red.0x42_cogs.aibot")
+
+# lower runs first
+LANE_INTERACTIVE = 0  # /chat, mentions, replies and trigger words
+LANE_NORMAL = 1  # reply_percent and conversation replies
+LANE_BACKGROUND = 2  # random messages and history summaries
+LANE_NAMES = {LANE_INTERACTIVE: "interactive", LANE_NORMAL: "normal", LANE_BACKGROUND: "background"}
+
+
+class SchedulerDropped(Exception):
+    """A request waited in a low priority lane for longer than that lane allows"""
+
+
+@dataclass
+class Ticket:
+    guild_id: int
+    lane: int
+    endpoint: str
+    enqueued: float = field(default_factory=time.monotonic)
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class LLMScheduler:
+    """
+    Admission control in front of the LLM endpoint(s).
+
+    Requests wait for a slot in priority lanes; within a lane, guilds are served by weighted fair queuing
+    so one busy guild can't starve the others. Lanes with a max wait drop requests that queued for too long.
+    """
+
+    def __init__(self, concurrency: int = 4, endpoint_concurrency: int = 2, max_wait: Optional[Dict[int, float]] = None):
+        self.concurrency = concurrency
+        self.endpoint_concurrency = endpoint_concurrency
+        self.max_wait = max_wait or {}
+        self.weights: Dict[int, float] = {}
+        self.in_flight = 0
+        self.endpoint_in_flight: Counter[str] = Counter()
+        self.served: Counter[int] = Counter()
+        self.dropped: Counter[int] = Counter()
+        self.waits: Dict[int, Deque[float]] = defaultdict(lambda: deque(maxlen=500))
+        self._queues: Dict[int, Dict[int, Deque[Ticket]]] = {lane: {} for lane in LANE_NAMES}
+        self._finish: Dict[int, float] = defaultdict(float)
+        self._clock = 0.0
+
+    def configure(self, concurrency: int, endpoint_concurrency: int, weights: Optional[Dict[int, float]] = None):
+        self.concurrency = concurrency
+        self.endpoint_concurrency = endpoint_concurrency
+        if weights is not None:
+            self.weights = weights
+        self._dispatch()
+
+    def depth(self, lane: int) -> int:
+        return sum(len(queue) for queue in self._queues[lane].values())
+
+    def wait_time(self, lane: int, percent: float = 50) -> float:
+        """Seconds recent requests in a lane waited for a slot"""
+        waits = sorted(self.waits[lane])
+        if not waits:
+            return 0.0
+        return waits[min(len(waits) - 1, int(len(waits) * percent / 100))]
+
+    @asynccontextmanager
+    async def slot(self, guild_id: int, lane: int, endpoint: str = "") -> AsyncIterator[None]:
+        """Wait for a slot, raises `SchedulerDropped` if the request waited too long"""
+        ticket = Ticket(guild_id, lane, endpoint)
+        self._queues[lane].setdefault(guild_id, deque()).append(ticket)
+        self._dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            # granted right as the waiting task was cancelled
+            if ticket.future.done() and not ticket.future.cancelled() and ticket.future.exception() is None:
+                self._release(ticket)
+            raise
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def _release(self, ticket: Ticket):
+        self.in_flight -= 1
+        self.endpoint_in_flight[ticket.endpoint] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        self._drop_expired()
+        while self.in_flight < self.concurrency:
+            ticket = self._next()
+            if not ticket:
+                return
+            self.in_flight += 1
+            self.endpoint_in_flight[ticket.endpoint] += 1
+            self.served[ticket.lane] += 1
+            self.waits[ticket.lane].append(time.monotonic() - ticket.enqueued)
+            ticket.future.set_result(None)
+
+    def _next(self) -> Optional[Ticket]:
+        for lane in sorted(self._queues):
+            queues = self._queues[lane]
+            best = None
+            for guild_id, queue in list(queues.items()):
+                while queue and queue[0].future.done():
+                    queue.popleft()
+                if not queue:
+                    del queues[guild_id]
+                    continue
+                if self.endpoint_in_flight[queue[0].endpoint] >= self.endpoint_concurrency:
+                    continue
+                if best is None or self._finish[guild_id] < self._finish[best]:
+                    best = guild_id
+            if best is not None:
+                return self._pop(lane, best)
+        return None
+
+    def _pop(self, lane: int, guild_id: int) -> Ticket:
+        queue = self._queues[lane][guild_id]
+        ticket = queue.popleft()
+        if not queue:
+            del self._queues[lane][guild_id]
+        # virtual finish time, idle guilds don't bank credit beyond the current clock
+        start = max(self._finish[guild_id], self._clock)
+        self._clock = start
+        self._finish[guild_id] = start + 1 / self.weights.get(guild_id, 1.0)
+        return ticket
+
+    def _drop_expired(self):
+        now = time.monotonic()
+        for lane, max_wait in self.max_wait.items():
+            for queue in self._queues[lane].values():
+                while queue and now - queue[0].enqueued > max_wait:
+                    ticket = queue.popleft()
+                    if not ticket.future.done():
+                        ticket.future.set_exception(SchedulerDropped())
+                        self.dropped[lane] += 1
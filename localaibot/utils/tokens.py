@@ -0,0 +1,137 @@
+import hashlib
+from typing import Dict, List, Optional, Sequence, Union
+
+import tiktoken
+
+from localaibot.config.constants import (
+    DEFAULT_TOKENIZER_MODEL,
+    ESTIMATE_BYTES_PER_TOKEN,
+    TOKEN_CACHE_LIMIT,
+    TOKENIZE_OFFLOAD_CHARS,
+)
+from localaibot.messages_list.entry import MessageEntry
+from localaibot.utils.cache import Cache
+from localaibot.utils.workers import WORKERS
+
+# process-wide, encodings are expensive to look up and shared by every guild using the same model
+_ENCODINGS: Dict[str, Optional[tiktoken.Encoding]] = {}
+_TOKEN_COUNTS: Cache[tuple, int] = Cache(limit=TOKEN_CACHE_LIMIT)
+
+
+def encoding_for_model(model: str) -> Optional[tiktoken.Encoding]:
+    """tiktoken encoding for a model, or None if tiktoken doesn't know the model"""
+    if model not in _ENCODINGS:
+        try:
+            _ENCODINGS[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _ENCODINGS[model] = None
+    return _ENCODINGS[model]
+
+
+def get_encoding(model: str, estimate: bool = False) -> Optional[tiktoken.Encoding]:
+    """
+    Encoding used to count tokens for a model.
+
+    Unknown models fall back to a default encoding, or to None (character-based estimates) if `estimate` is set.
+    """
+    encoding = encoding_for_model(model)
+    if encoding or estimate:
+        return encoding
+    return encoding_for_model(DEFAULT_TOKENIZER_MODEL)
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text.encode("utf-8")) // ESTIMATE_BYTES_PER_TOKEN)
+
+
+def count_tokens(text: Optional[str], encoding: Optional[tiktoken.Encoding]) -> int:
+    """Number of tokens in text, cached by content so repeated text is only tokenized once"""
+    if not text:
+        return 0
+    if encoding is None:
+        return estimate_tokens(text)
+
+    key = _cache_key(text, encoding)
+    count = _TOKEN_COUNTS.get(key)
+    if count is None:
+        count = len(encoding.encode(text, disallowed_special=()))
+        _TOKEN_COUNTS[key] = count
+    return count
+
+
+async def count_texts_tokens(texts: Sequence[Optional[str]], encoding: Optional[tiktoken.Encoding]) -> List[int]:
+    """
+    Same as `count_tokens` for several texts, with uncached texts tokenized in a single worker job
+    when there is enough of them to be worth leaving the event loop.
+    """
+    if encoding is None:
+        return [estimate_tokens(text) if text else 0 for text in texts]
+
+    keys = [_cache_key(text, encoding) if text else None for text in texts]
+    counts = [_TOKEN_COUNTS.get(key) if key else 0 for key in keys]
+    missing = {key: text for key, text, count in zip(keys, texts, counts) if count is None}
+
+    if missing:
+        if sum(len(text) for text in missing.values()) >= TOKENIZE_OFFLOAD_CHARS:
+            results = await WORKERS.run(tokenize_batch, encoding.name, list(missing.values()))
+        else:
+            results = tokenize_batch(encoding.name, list(missing.values()))
+        tokenized = dict(zip(missing, results))
+        for key, count in tokenized.items():
+            _TOKEN_COUNTS[key] = count
+        counts = [tokenized[key] if count is None else count for key, count in zip(keys, counts)]
+
+    return counts
+
+
+def count_entry_tokens(entry: MessageEntry, encoding: Optional[tiktoken.Encoding]) -> int:
+    """Number of tokens in an entry's text content, stored on the entry for later replies"""
+    name = encoding.name if encoding else None
+    if name in entry.tokens:
+        return entry.tokens[name]
+
+    count = sum(count_tokens(text, encoding) for text in entry_texts(entry.content))
+    entry.tokens[name] = count
+    return count
+
+
+async def count_entries_tokens(entries: Sequence[MessageEntry], encoding: Optional[tiktoken.Encoding]) -> List[int]:
+    """Same as `count_entry_tokens` for several entries, see `count_texts_tokens`"""
+    name = encoding.name if encoding else None
+    uncounted = [entry for entry in entries if name not in entry.tokens]
+    texts = [list(entry_texts(entry.content)) for entry in uncounted]
+    counts = iter(await count_texts_tokens([text for entry_text in texts for text in entry_text], encoding))
+    for entry, entry_text in zip(uncounted, texts):
+        entry.tokens[name] = sum(next(counts) for _ in entry_text)
+    return [entry.tokens[name] for entry in entries]
+
+
+def truncate_to_tokens(text: str, encoding: Optional[tiktoken.Encoding], limit: int) -> str:
+    """Text cut down to at most `limit` tokens"""
+    if limit <= 0:
+        return ""
+    if encoding is None:
+        return text.encode("utf-8")[:limit * ESTIMATE_BYTES_PER_TOKEN].decode("utf-8", errors="ignore")
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= limit:
+        return text
+    return encoding.decode(tokens[:limit])
+
+
+def tokenize_batch(encoding_name: str, texts: List[str]) -> List[int]:
+    """Runs in a worker, so only takes picklable arguments"""
+    encoding = tiktoken.get_encoding(encoding_name)
+    return [len(encoding.encode(text, disallowed_special=())) for text in texts]
+
+
+def _cache_key(text: str, encoding: tiktoken.Encoding) -> tuple:
+    return (encoding.name, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+
+
+def entry_texts(content: Union[str, list, None]):
+    if isinstance(content, list):
+        for item in content:
+            if isinstance(item, dict) and item.get("type") == "text":
+                yield item.get("text")
+    elif content:
+        yield str(content)
@@ -5,15 +5,15 @@ import logging
 import random
 from datetime import datetime
 from pathlib import Path
-from typing import Callable, Coroutine
+from typing import Any, Callable, Coroutine, Dict, Optional
 
-import discord
 from discord import Message
 from openai import AsyncOpenAI
 from redbot.core import Config, commands
 
 from localaibot.config.constants import OPENROUTER_URL, YOUTUBE_URL_PATTERN
 from localaibot.functions.tool_call import ToolCall
+from localaibot.utils.variables import VARIABLES, compile_template
 
 logger = logging.getLogger("red.0x42_cogs.aibot")
 
@@ -33,18 +33,45 @@ def to_thread(timeout=300):
     return decorator
 
 
-async def format_variables(ctx: commands.Context, text: str):
+# variables that change from one message to the next, kept out of the prompt prefix in prompt cache mode
+VOLATILE_VARIABLES = ("authorname", "authortoprole", "authormention", "currenttime", "randomnumber")
+
+
+async def format_variables(ctx: commands.Context, text: str, stable: bool = False):
     """
     Insert supported variables into string if they are present
+
+    If `stable`, the result only changes when the server/channel does: volatile variables are left as `<name>`
+    placeholders (see `format_volatile_variables`) and emojis are in a fixed order.
     """
-    botname = ctx.message.guild.me.nick or ctx.bot.user.display_name
-    app_info = await ctx.bot.application_info()
-    botowner = app_info.owner.name
+    variables = await get_variables(ctx, stable)
+    if stable:
+        variables.update({name: f"<{name}>" for name in VOLATILE_VARIABLES})
+
+    try:
+        return compile_template(text).render(variables)
+    except KeyError:
+        logger.exception("Invalid key in message", exc_info=True)
+        return text
+
+
+async def format_volatile_variables(ctx: commands.Context, text: str) -> Optional[str]:
+    """Values of the volatile variables used in a prompt, for a message after the conversation"""
+    fields = compile_template(text).fields
+    used = [name for name in VOLATILE_VARIABLES if name in fields]
+    if not used:
+        return None
+    variables = await get_variables(ctx, stable=True)
+    return "\n".join(f"<{name}> is {variables[name]}" for name in used)
+
+
+async def get_variables(ctx: commands.Context, stable: bool = False) -> Dict[str, Any]:
+    guild_variables = VARIABLES.guild(ctx)
+    botowner = await VARIABLES.botowner(ctx.bot)
     authorname = ctx.message.author.display_name
     authortoprole = ctx.message.author.top_role.name
     authormention = ctx.message.author.mention
 
-    servername = ctx.guild.name
     channelname = ctx.message.channel.name
     currentdate = datetime.today().strftime("%Y/%m/%d")
     currentweekday = datetime.today().strftime("%A")
@@ -52,35 +79,26 @@ async def format_variables(ctx: commands.Context, text: str):
 
     randomnumber = random.randint(0, 100)
 
-    if isinstance(ctx.message.channel, discord.Thread):
-        channeltopic = ctx.message.channel.parent.topic
-    else:
-        channeltopic = ctx.message.channel.topic
-
-    serveremojis = [str(e) for e in ctx.message.guild.emojis]
-    random.shuffle(serveremojis)
+    serveremojis = guild_variables.serveremojis
+    if not stable:
+        serveremojis = random.sample(serveremojis, len(serveremojis))
     serveremojis = ' '.join(serveremojis)
 
-    try:
-        res = text.format(
-            botname=botname,
-            botowner=botowner,
-            authorname=authorname,
-            authortoprole=authortoprole,
-            authormention=authormention,
-            servername=servername,
-            serveremojis=serveremojis,
-            channelname=channelname,
-            channeltopic=channeltopic,
-            currentdate=currentdate,
-            currentweekday=currentweekday,
-            currenttime=currenttime,
-            randomnumber=randomnumber,
-        )
-        return res
-    except KeyError:
-        logger.exception("Invalid key in message", exc_info=True)
-        return text
+    return dict(
+        botname=guild_variables.botname,
+        botowner=botowner,
+        authorname=authorname,
+        authortoprole=authortoprole,
+        authormention=authormention,
+        servername=guild_variables.servername,
+        serveremojis=serveremojis,
+        channelname=channelname,
+        channeltopic=guild_variables.channeltopic(ctx.message.channel),
+        currentdate=currentdate,
+        currentweekday=currentweekday,
+        currenttime=currenttime,
+        randomnumber=randomnumber,
+    )
 
 
 def is_embed_valid(message: Message):
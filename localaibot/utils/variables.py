@@ -0,0 +1,105 @@
+import logging
+from dataclasses import dataclass, field
+from string import Formatter
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Tuple
+
+import discord
+from redbot.core import commands
+
+from localaibot.config.constants import PROMPT_TEMPLATE_CACHE_LIMIT
+from localaibot.utils.cache import Cache
+
+logger = logging.getLogger("red.0x42_cogs.aibot")
+
+
+class PromptTemplate:
+    """
+    A prompt parsed once into literal text and variable names.
+
+    Templates using only plain `{name}` fields are rendered by joining their parts,
+    anything fancier (format specs, attribute access) is left to `str.format`.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.parts: List[Tuple[str, Optional[str]]] = []
+        simple = True
+        for literal, name, spec, conversion in Formatter().parse(text):
+            if name is not None and (spec or conversion or not name.isidentifier()):
+                simple = False
+            self.parts.append((literal, name))
+        self.simple = simple
+        self.fields: FrozenSet[str] = frozenset(name for _, name in self.parts if name)
+
+    def render(self, variables: Mapping[str, Any]) -> str:
+        if not self.simple:
+            return self.text.format(**variables)
+        return "".join(
+            literal if name is None else f"{literal}{variables[name]}"
+            for literal, name in self.parts
+        )
+
+
+_TEMPLATES: Cache[str, PromptTemplate] = Cache(limit=PROMPT_TEMPLATE_CACHE_LIMIT)
+
+
+def compile_template(text: str) -> PromptTemplate:
+    template = _TEMPLATES[text]
+    if template is None:
+        template = _TEMPLATES[text] = PromptTemplate(text)
+    return template
+
+
+@dataclass
+class GuildVariables:
+    botname: str
+    servername: str
+    serveremojis: Tuple[str, ...]
+    channeltopics: Dict[int, Optional[str]] = field(default_factory=dict)
+
+    def channeltopic(self, channel: discord.abc.GuildChannel) -> Optional[str]:
+        if channel.id not in self.channeltopics:
+            parent = channel.parent if isinstance(channel, discord.Thread) else channel
+            self.channeltopics[channel.id] = getattr(parent, "topic", None)
+        return self.channeltopics[channel.id]
+
+
+class VariableCache:
+    """
+    Prompt variables that only change with the server, so building a prompt doesn't need a REST call
+    (`application_info`) or to rebuild the emoji list.
+
+    Guild entries are dropped by the cog's listeners when emojis, channels or the bot's nickname change.
+    """
+
+    def __init__(self):
+        self._botowner: Optional[str] = None
+        self._guilds: Dict[int, GuildVariables] = {}
+
+    async def botowner(self, bot) -> str:
+        if self._botowner is None:
+            app_info = await bot.application_info()
+            self._botowner = app_info.owner.name
+        return self._botowner
+
+    def guild(self, ctx: commands.Context) -> GuildVariables:
+        guild = ctx.guild
+        variables = self._guilds.get(guild.id)
+        if variables is None:
+            variables = self._guilds[guild.id] = GuildVariables(
+                botname=guild.me.nick or ctx.bot.user.display_name,
+                servername=guild.name,
+                serveremojis=tuple(str(e) for e in guild.emojis),
+            )
+        return variables
+
+    def invalidate(self, guild_id: Optional[int] = None):
+        if guild_id is None:
+            self._botowner = None
+            self._guilds.clear()
+        else:
+            self._guilds.pop(guild_id, None)
+
+
+# process-wide like the token count cache, prompts are built from places that don't have the cog at hand
+VARIABLES = VariableCache()
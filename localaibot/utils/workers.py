@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Optional
+
+logger = logging.getLogger("red.0x42_cogs.aibot")
+
+WORKER_TYPES = ("thread", "process")
+
+
+class WorkerPool:
+    """
+    Dedicated executor for CPU-bound work (tokenization, regex cleanup), so it stays off the event loop
+    and out of the shared default executor.
+
+    With processes, functions and arguments must be picklable (module-level functions only).
+    """
+
+    def __init__(self, kind: str = "thread", size: int = 2):
+        self.kind = kind
+        self.size = size
+        self.submitted = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.latencies: Deque[float] = deque(maxlen=1000)
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if not self._executor:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.size, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="aibot-worker")
+        return self._executor
+
+    @property
+    def in_flight(self) -> int:
+        return self.submitted - self.completed
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.size)
+
+    def configure(self, kind: str, size: int):
+        if kind not in WORKER_TYPES:
+            raise ValueError(f"Unknown worker type {kind}")
+        if (kind, size) == (self.kind, self.size):
+            return
+        # jobs already queued finish on the old executor, the next ones go to the new one
+        self.shutdown(cancel_futures=False)
+        self.kind = kind
+        self.size = size
+
+    def shutdown(self, cancel_futures: bool = True):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=cancel_futures)
+            self._executor = None
+
+    def percentile(self, percent: float) -> float:
+        """Latency (queueing + running) in seconds of recent jobs"""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None) -> Any:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        self.submitted += 1
+        future = loop.run_in_executor(self.executor, func, *args)
+        # a job that timed out keeps its worker busy, so it only counts as completed once it actually finishes
+        future.add_done_callback(lambda _: self._complete(start))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    def _complete(self, start: float):
+        self.completed += 1
+        self.latencies.append(time.perf_counter() - start)
+
+# process-wide, configured by the cog on load
+WORKERS = WorkerPool()